@@ -0,0 +1,370 @@
+from operator import itemgetter
+from typing import Any
+from typing import Awaitable
+from typing import Callable
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+from core.engine import as_truth
+from core.engine import BOOLEAN
+from core.engine import check_operands
+from core.engine import document_reset
+from core.engine import Functions
+from core.engine import Lowered
+from core.engine import lower_comparison
+from core.engine import lower_expand
+from core.engine import lower_operand
+from core.engine import lower_step
+from core.engine import MISSING
+from core.engine import NODES
+from core.engine import resolve_function
+from core.engine import VALUE
+from core.lib import LazyModule
+from core.optimizer import optimize as optimize_selector
+from core.symbols import COMPARATORS
+from core.symbols import CONJUNCTION_OPERATORS
+from core.symbols import DISJUNCTION_OPERATORS
+from core.symbols import EXCLUSIVE_DISJUNCTION_OPERATORS
+from core.symbols import NEGATION_OPERATORS
+from core.symbols import Operator
+from core.symbols import THIS
+from core.zonquery import flatten as flatten_selector
+from core.zonquery import Node
+from core.zonquery import parse
+from core.zonquery import Predicate
+from core.zonquery import Selector
+from core.zonquery import Step
+
+# Imported on first use, as they weigh more than the library itself.
+asyncio = LazyModule("asyncio")
+inspect = LazyModule("inspect")
+
+Limiter = Optional["asyncio.Semaphore"]
+AsyncEvaluator = Callable[[Any, "Limiter"], Awaitable[Any]]
+AsyncStepRunner = Callable[[list[Any], "Limiter"], Awaitable[list[Any]]]
+
+
+class AsyncLowered(NamedTuple):
+    # A lowered operand that calls a coroutine function somewhere below it.
+    # The others are lowered by core.engine and evaluated synchronously.
+    evaluate: AsyncEvaluator
+    kind: int
+    constant: Any = MISSING  # Never constant, as Lowered it stands for.
+
+
+AnyLowered = Union["Lowered", "AsyncLowered"]
+
+
+def is_coroutine_function(fn: Callable[..., Any]) -> bool:
+    # Objects with an async __call__ included.
+    return inspect.iscoroutinefunction(fn) or inspect.iscoroutinefunction(
+        getattr(fn, "__call__", None))
+
+
+def is_coroutine_call(predicate: "Predicate", functions: "Functions") -> bool:
+    root = predicate.root
+    if not root.is_operator or root.operator is not Operator.FUNCTION:
+        return False
+    fn, _ = resolve_function(predicate, functions)
+    return is_coroutine_function(fn)
+
+
+def find_awaiting(
+    operand: "Node",
+    functions: "Functions",
+    awaiting: set[int],
+) -> bool:
+    # Adds the id of every predicate and selector under operand, included,
+    # that calls a coroutine function; returns whether operand does.
+    found = False
+    if isinstance(operand, Selector):
+        for step in operand.steps:
+            if step.predicate is not None and find_awaiting(
+                    step.predicate, functions, awaiting):
+                found = True
+    elif isinstance(operand, Predicate):
+        for o in operand.operands:
+            if find_awaiting(o, functions, awaiting):
+                found = True
+        found = found or is_coroutine_call(operand, functions)
+    if found:
+        awaiting.add(id(operand))
+    return found
+
+
+def as_async_truth(lowered: "AnyLowered") -> AsyncEvaluator:
+    if isinstance(lowered, AsyncLowered):
+        if lowered.kind == BOOLEAN:
+            return lowered.evaluate
+        evaluate = lowered.evaluate
+
+        async def async_truth(node: Any, limiter: "Limiter") -> bool:
+            return bool(await evaluate(node, limiter))
+
+        return async_truth
+    truth = as_truth(lowered)
+
+    async def sync_truth(node: Any, _: "Limiter") -> bool:
+        return truth(node)
+
+    return sync_truth
+
+
+def as_item(i: int, lowered: "AnyLowered") -> "Lowered":
+    # Stands for the operand in core.engine evaluators run on the list of
+    # operand values, as returned by values_of().
+    return Lowered(itemgetter(i), lowered.kind, lowered.constant)
+
+
+async def values_of(
+    operands: tuple["AnyLowered", ...],
+    node: Any,
+    limiter: "Limiter",
+) -> list[Any]:
+    # The values of independent operands: the synchronous ones first, then
+    # the others concurrently.
+    values = [
+        None if isinstance(o, AsyncLowered) else o.evaluate(node)
+        for o in operands
+    ]
+    pending = [i for i, o in enumerate(operands) if isinstance(o, AsyncLowered)]
+    if len(pending) == 1:
+        values[pending[0]] = await operands[pending[0]].evaluate(node, limiter)
+    elif pending:
+        results = await asyncio.gather(
+            *(operands[i].evaluate(node, limiter) for i in pending))
+        for i, value in zip(pending, results):
+            values[i] = value
+    return values
+
+
+def lower_async_function(
+    predicate: "Predicate",
+    functions: "Functions",
+    awaiting: set[int],
+) -> "AsyncLowered":
+    fn, declared = resolve_function(predicate, functions)
+    operands = tuple(
+        lower_async_operand(o, functions, awaiting) for o in predicate.operands)
+    is_coroutine = is_coroutine_function(fn)
+    if declared is not None and declared.cache_size:
+        cache = functions.cache
+        fn = (cache.wrap_async if is_coroutine else cache.wrap)(declared)
+
+    async def call(node: Any, limiter: "Limiter") -> Any:
+        # Missing fields are passed as None, as by core.engine.
+        arguments = [
+            None if v is MISSING else v
+            for v in await values_of(operands, node, limiter)
+        ]
+        if not is_coroutine:
+            return fn(*arguments)
+        if limiter is None:
+            return await fn(*arguments)
+        async with limiter:
+            return await fn(*arguments)
+
+    return AsyncLowered(call, VALUE)
+
+
+def lower_async_predicate(
+    predicate: "Predicate",
+    functions: "Functions",
+    awaiting: set[int],
+) -> "AsyncLowered":
+    root = predicate.root
+    if (op := root.operator) is Operator.FUNCTION:
+        return lower_async_function(predicate, functions, awaiting)
+
+    check_operands(predicate)
+    operands = tuple(
+        lower_async_operand(o, functions, awaiting) for o in predicate.operands)
+
+    if op in NEGATION_OPERATORS:
+        truth = as_async_truth(operands[0])
+
+        async def negation(node: Any, limiter: "Limiter") -> bool:
+            return not await truth(node, limiter)
+
+        return AsyncLowered(negation, BOOLEAN)
+
+    if op in COMPARATORS:
+        # Compares the values of both sides, evaluated concurrently, as
+        # core.engine compares operands.
+        compare = lower_comparison(
+            COMPARATORS[op], *(as_item(i, o) for i, o in enumerate(operands)))
+
+        async def comparison(node: Any, limiter: "Limiter") -> bool:
+            return compare(await values_of(operands, node, limiter))
+
+        return AsyncLowered(comparison, BOOLEAN)
+
+    if op in CONJUNCTION_OPERATORS:
+        # In order, stopping at the first false operand: the calls of the
+        # following ones are never made.
+        truths = tuple(as_async_truth(o) for o in operands)
+
+        async def conjunction(node: Any, limiter: "Limiter") -> bool:
+            for truth in truths:
+                if not await truth(node, limiter):
+                    return False
+            return True
+
+        return AsyncLowered(conjunction, BOOLEAN)
+
+    if op in DISJUNCTION_OPERATORS:
+        truths = tuple(as_async_truth(o) for o in operands)
+
+        async def disjunction(node: Any, limiter: "Limiter") -> bool:
+            for truth in truths:
+                if await truth(node, limiter):
+                    return True
+            return False
+
+        return AsyncLowered(disjunction, BOOLEAN)
+
+    if op in EXCLUSIVE_DISJUNCTION_OPERATORS:
+        # Every operand is needed, so all run concurrently.
+        truths = tuple(
+            as_truth(as_item(i, o)) for i, o in enumerate(operands))
+
+        async def parity(node: Any, limiter: "Limiter") -> bool:
+            values = await values_of(operands, node, limiter)
+            return sum(bool(truth(values)) for truth in truths) % 2 == 1
+
+        return AsyncLowered(parity, BOOLEAN)
+    raise ValueError(f"Unsupported operator '{root}'.")
+
+
+def lower_async_operand(
+    operand: "Node",
+    functions: "Functions",
+    awaiting: set[int],
+) -> "AnyLowered":
+    if id(operand) not in awaiting:
+        return lower_operand(operand, functions)
+    if isinstance(operand, Selector):
+        return AsyncLowered(
+            lower_async_selector(operand, functions, awaiting), NODES)
+    return lower_async_predicate(operand, functions, awaiting)
+
+
+def lower_async_step(
+    step: "Step",
+    functions: "Functions",
+    awaiting: set[int],
+) -> AsyncStepRunner:
+    # The predicate runs on the selected nodes concurrently.
+    expand = lower_expand(step)
+    keep = as_async_truth(
+        lower_async_operand(step.predicate, functions, awaiting))
+    name = step.node.word
+
+    async def run(nodes: list[Any], limiter: "Limiter") -> list[Any]:
+        if name != THIS:
+            nodes = [
+                value for node in nodes if isinstance(node, dict) and
+                (value := node.get(name, MISSING)) is not MISSING
+            ]
+        selected = expand(nodes)
+        truths = await asyncio.gather(
+            *(keep(node, limiter) for node in selected))
+        return [node for node, truth in zip(selected, truths) if truth]
+
+    return run
+
+
+def lower_async_selector(
+    selector: "Selector",
+    functions: "Functions",
+    awaiting: set[int],
+) -> AsyncEvaluator:
+    steps = tuple(
+        (lower_async_step(s, functions, awaiting), True) if id(s.predicate)
+        in awaiting else (lower_step(s, functions), False)
+        for s in selector.steps)
+
+    async def run(node: Any, limiter: "Limiter") -> list[Any]:
+        nodes = [node]
+        for step, awaits in steps:
+            nodes = await step(nodes, limiter) if awaits else step(nodes)
+            if not nodes:
+                break
+        return nodes
+
+    return run
+
+
+class AsyncQuery:
+    # A selector whose functions may be coroutine functions, e.g. lookups
+    # in a database, evaluated with await. Independent operands run
+    # concurrently: the arguments of a call, both sides of a comparison,
+    # the operands of XOR and the predicate of a step on each of its nodes.
+    # AND and OR still evaluate their operands in order and stop as soon as
+    # the result is known.
+    #
+    # The limit bounds the coroutine calls in flight per select(), or per
+    # select_many(); None for no limit. Subtrees without coroutine calls
+    # are lowered by core.engine and run synchronously.
+    selector: "Selector"
+    functions: "Functions"
+    limit: Optional[int]
+
+    def __init__(
+        self,
+        selector: "Selector",
+        functions: Optional["Functions"] = None,
+        flatten: bool = True,
+        optimize: bool = False,
+        limit: Optional[int] = None,
+    ) -> None:
+        if limit is not None and limit < 1:
+            raise ValueError(f"Concurrency limit must be at least 1, got "
+                             f"{limit}.")
+        self.selector = selector
+        self.functions = {} if functions is None else functions
+        self.limit = limit
+        if optimize:
+            selector = optimize_selector(selector)
+        elif flatten:
+            selector = flatten_selector(selector)
+        awaiting: set[int] = set()
+        find_awaiting(selector, self.functions, awaiting)
+        self._run = lower_async_selector(selector, self.functions, awaiting)
+        self._reset = document_reset(self.functions)
+
+    def _limiter(self) -> "Limiter":
+        return None if self.limit is None else asyncio.Semaphore(self.limit)
+
+    async def select(self, document: Any) -> list[Any]:
+        if self._reset is not None:
+            self._reset()
+        return await self._run(document, self._limiter())
+
+    async def matches(self, document: Any) -> bool:
+        return bool(await self.select(document))
+
+    async def select_many(self, documents: Iterable[Any]) -> list[list[Any]]:
+        # The documents run concurrently, within a single limit. Results
+        # cached per document are shared by all of them.
+        if self._reset is not None:
+            self._reset()
+        limiter = self._limiter()
+        return list(await asyncio.gather(
+            *(self._run(document, limiter) for document in documents)))
+
+    def __str__(self) -> str:
+        return f"async {self.selector}"
+
+
+def compile_async(
+    query: Union[str, "Selector"],
+    functions: Optional["Functions"] = None,
+    flatten: bool = True,
+    optimize: bool = False,
+    limit: Optional[int] = None,
+) -> "AsyncQuery":
+    selector = parse(query) if isinstance(query, str) else query
+    return AsyncQuery(selector, functions, flatten, optimize, limit)
@@ -0,0 +1,87 @@
+from collections import OrderedDict
+import threading
+from typing import Any
+from typing import Callable
+from typing import Hashable
+from typing import NamedTuple
+
+
+class CacheInfo(NamedTuple):
+    hits: int
+    misses: int
+    evictions: int
+    maxsize: int
+    currsize: int
+
+
+class LRUCache:
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+
+    def __init__(self, maxsize: int = 1_024) -> None:
+        if maxsize < 0:
+            raise ValueError(f"Cache size must be non-negative, got {maxsize}.")
+        self.maxsize = maxsize
+        self._data: OrderedDict[Hashable, Any] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get_or_create(
+        self,
+        key: Hashable,
+        factory: Callable[[Hashable], Any],
+    ) -> Any:
+        with self._lock:
+            if (value := self._data.get(key, _ABSENT)) is not _ABSENT:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            self.misses += 1
+
+        # Builds outside the lock so slow factories don't serialize callers.
+        value = factory(key)
+
+        with self._lock:
+            if (existing := self._data.get(key, _ABSENT)) is not _ABSENT:
+                return existing  # Another thread won the race; share it.
+            if self.maxsize:
+                self._data[key] = value
+                self._evict()
+        return value
+
+    def resize(self, maxsize: int) -> None:
+        if maxsize < 0:
+            raise ValueError(f"Cache size must be non-negative, got {maxsize}.")
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def info(self) -> "CacheInfo":
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             self.maxsize, len(self._data))
+
+    def _evict(self) -> None:
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+
+_ABSENT = object()
@@ -0,0 +1,357 @@
+from importlib.util import find_spec
+from itertools import repeat
+import operator
+import sys
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Sequence
+from typing import Union
+
+from core.engine import BOOLEAN
+from core.engine import compare
+from core.engine import CONSTANT
+from core.engine import document_reset
+from core.engine import Functions
+from core.engine import literal_value
+from core.engine import Lowered
+from core.engine import MISSING
+from core.engine import resolve_function
+from core.engine import VALUE
+from core.lib import LazyModule
+from core.symbols import COMPARATORS
+from core.symbols import CONJUNCTION_OPERATORS
+from core.symbols import DISJUNCTION_OPERATORS
+from core.symbols import EXCLUSIVE_DISJUNCTION_OPERATORS
+from core.symbols import MIRRORED_OPERATORS
+from core.symbols import NEGATION_OPERATORS
+from core.symbols import Operator
+from core.symbols import THIS
+from core.zonquery import flatten
+from core.zonquery import parse
+from core.zonquery import Predicate
+from core.zonquery import Selector
+from core.zonquery import Token
+
+# NumPy when installed, imported on first use: arrays, e.g. from to_columns,
+# exist only once it is.
+np = LazyModule("numpy") if find_spec("numpy") is not None else None
+
+Column = Union[Sequence[Any], "np.ndarray"]
+Columns = Mapping[str, "Column"]
+Mask = Union[list[bool], "np.ndarray"]
+
+# Array kinds NumPy compares natively against a literal of the same family.
+NUMERIC_KINDS: str = "biuf"
+STRING_KINDS: str = "US"
+# Ints of a larger magnitude lose precision as float64, which NumPy converts
+# them to when compared with a float.
+MAX_EXACT_INT: int = 2**53
+
+
+class Batch(NamedTuple):
+    columns: "Columns"
+    size: int
+
+
+def is_array(column: Any) -> bool:
+    return "numpy" in sys.modules and isinstance(column, np.ndarray)
+
+
+def is_exact_int(value: Any) -> bool:
+    return type(value) is int and -MAX_EXACT_INT <= value <= MAX_EXACT_INT
+
+
+def is_numeric_array(column: Sequence[Any]) -> bool:
+    # Whether a NumPy array holds the column exactly and compares it as
+    # Python does: only floats, or only ints that float64 holds exactly.
+    # Mixed columns would be converted to float64.
+    if not column:
+        return False
+    if type(column[0]) is float:
+        return all(type(v) is float for v in column)
+    return all(map(is_exact_int, column))
+
+
+def to_columns(
+    records: Iterable[Mapping[str, Any]],
+    fields: Optional[Iterable[str]] = None,
+    arrays: bool = False,
+) -> dict[str, "Column"]:
+    # Absent fields become MISSING, so a column lines up with the records.
+    # With arrays, uniform columns are converted to NumPy arrays; others stay
+    # lists, compared value by value.
+    records = list(records)
+    if fields is None:
+        fields = dict.fromkeys(k for r in records for k in r)
+    columns: dict[str, Column] = {
+        field: [r.get(field, MISSING) for r in records] for field in fields
+    }
+    if arrays and np is not None:
+        for field, column in columns.items():
+            if is_numeric_array(column):
+                columns[field] = np.asarray(column)
+            elif all(type(v) is str for v in column):
+                columns[field] = np.asarray(column, dtype=str)
+    return columns
+
+
+def constant_mask(truth: bool, size: int, like: Iterable[Any] = ()) -> "Mask":
+    if any(is_array(m) for m in like):
+        return np.full(size, truth)
+    return [truth] * size
+
+
+def column_truth(column: "Column") -> "Mask":
+    if is_array(column) and column.dtype.kind in NUMERIC_KINDS:
+        return column != 0
+    if is_array(column):
+        return np.asarray([bool(v) for v in column.tolist()], dtype=bool)
+    return [bool(v) for v in column]
+
+
+def compare_column(
+    op: Callable[[Any, Any], bool],
+    column: "Column",
+    value: Any,
+) -> "Mask":
+    # A column against a literal: one vectorized operation when the types
+    # allow it, the record semantics of engine.compare() otherwise.
+    if is_array(column):
+        kind = column.dtype.kind
+        number = type(value) is float or is_exact_int(value)
+        if (kind in NUMERIC_KINDS and number or
+                kind in STRING_KINDS and isinstance(value, str)):
+            return op(column, value)
+        return np.asarray(compare_column(op, column.tolist(), value),
+                          dtype=bool)
+
+    if op is operator.eq:
+        return [v == value for v in column]
+    if op is operator.ne:
+        return [v != value and v is not MISSING for v in column]
+    try:
+        return list(map(op, column, repeat(value)))
+    except TypeError:  # Mixed types or MISSING values in the column.
+        return [compare(op, v, value) for v in column]
+
+
+def compare_columns(
+    op: Callable[[Any, Any], bool],
+    left: "Column",
+    right: "Column",
+) -> "Mask":
+    if (is_array(left) and is_array(right) and
+            left.dtype.kind in NUMERIC_KINDS and
+            right.dtype.kind in NUMERIC_KINDS):
+        return op(left, right)
+    left = left.tolist() if is_array(left) else left
+    right = right.tolist() if is_array(right) else right
+    return [compare(op, lv, rv) for lv, rv in zip(left, right)]
+
+
+def combine(op: "Operator", masks: list["Mask"]) -> "Mask":
+    if any(is_array(m) for m in masks):
+        masks = [np.asarray(m, dtype=bool) for m in masks]
+        if op in CONJUNCTION_OPERATORS:
+            return np.logical_and.reduce(masks)
+        if op in DISJUNCTION_OPERATORS:
+            return np.logical_or.reduce(masks)
+        return np.logical_xor.reduce(masks)
+
+    if len(masks) == 2:
+        first, second = masks
+        if op in CONJUNCTION_OPERATORS:
+            return [a and b for a, b in zip(first, second)]
+        if op in DISJUNCTION_OPERATORS:
+            return [a or b for a, b in zip(first, second)]
+        return [a != b for a, b in zip(first, second)]
+    if op in CONJUNCTION_OPERATORS:
+        return list(map(all, zip(*masks)))
+    if op in DISJUNCTION_OPERATORS:
+        return list(map(any, zip(*masks)))
+    return [sum(bits) % 2 == 1 for bits in zip(*masks)]
+
+
+def negate(mask: "Mask") -> "Mask":
+    if is_array(mask):
+        return ~mask
+    return [not v for v in mask]
+
+
+def as_mask(lowered: "Lowered") -> Callable[["Batch"], "Mask"]:
+    if lowered.kind == BOOLEAN:
+        return lowered.evaluate
+    if lowered.kind == CONSTANT:
+        truth = bool(lowered.constant)
+        return lambda batch: constant_mask(truth, batch.size,
+                                           batch.columns.values())
+    evaluate = lowered.evaluate
+    return lambda batch: column_truth(evaluate(batch))
+
+
+def lower_column_token(token: "Token") -> "Lowered":
+    if (value := literal_value(token)) is not MISSING:
+        return Lowered(lambda _: value, CONSTANT, value)
+    if (name := token.word) == THIS:
+        raise ValueError("'this' is not supported by columnar evaluation.")
+
+    def column(batch: "Batch") -> "Column":
+        if (found := batch.columns.get(name)) is None:
+            return [MISSING] * batch.size
+        return found
+
+    return Lowered(column, VALUE)
+
+
+def lower_column_function(
+    predicate: "Predicate",
+    functions: "Functions",
+) -> "Lowered":
+    # Functions are opaque, so they are applied record by record.
+    fn, declared = resolve_function(predicate, functions)
+    arguments = [
+        lower_column_operand(o, functions) for o in predicate.operands
+    ]
+    if declared is not None and declared.pure and all(
+            a.kind == CONSTANT for a in arguments):
+        value = fn(*[a.constant for a in arguments])
+        return Lowered(lambda _: value, CONSTANT, value)
+    if declared is not None and declared.cache_size:
+        fn = functions.cache.wrap(declared)
+
+    def apply(batch: "Batch") -> list[Any]:
+        columns = []
+        for argument in arguments:
+            if argument.kind == CONSTANT:
+                columns.append(repeat(argument.constant, batch.size))
+            else:
+                column = argument.evaluate(batch)
+                columns.append(column.tolist() if is_array(column) else [
+                    None if v is MISSING else v for v in column
+                ])
+        if not columns:
+            return [fn() for _ in range(batch.size)]
+        return [fn(*row) for row in zip(*columns)]
+
+    return Lowered(apply, VALUE)
+
+
+def lower_column_comparison(
+    op: "Operator",
+    left: "Lowered",
+    right: "Lowered",
+) -> "Lowered":
+    if left.kind == CONSTANT and right.kind != CONSTANT:
+        op, left, right = MIRRORED_OPERATORS[op], right, left
+    compare_op = COMPARATORS[op]
+
+    if left.kind == CONSTANT:  # Both are literals.
+        truth = compare(compare_op, left.constant, right.constant)
+        return Lowered(lambda _: truth, CONSTANT, truth)
+    lf, rf = left.evaluate, right.evaluate
+    if right.kind == CONSTANT:
+        value = right.constant
+        return Lowered(lambda batch: compare_column(compare_op, lf(batch),
+                                                    value), BOOLEAN)
+    return Lowered(lambda batch: compare_columns(compare_op, lf(batch),
+                                                 rf(batch)), BOOLEAN)
+
+
+def lower_column_predicate(
+    predicate: "Predicate",
+    functions: "Functions",
+) -> "Lowered":
+    root = predicate.root
+    if not root.is_operator:
+        return lower_column_token(root)
+    if (op := root.operator) is Operator.FUNCTION:
+        return lower_column_function(predicate, functions)
+    operands = [
+        lower_column_operand(o, functions) for o in predicate.operands
+    ]
+
+    if op in NEGATION_OPERATORS and len(operands) == 1:
+        mask = as_mask(operands[0])
+        return Lowered(lambda batch: negate(mask(batch)), BOOLEAN)
+    if op in COMPARATORS and len(operands) == 2:
+        return lower_column_comparison(op, *operands)
+    if (op in CONJUNCTION_OPERATORS | DISJUNCTION_OPERATORS |
+            EXCLUSIVE_DISJUNCTION_OPERATORS and len(operands) > 1):
+        masks = [as_mask(o) for o in operands]
+        return Lowered(lambda batch: combine(op, [m(batch) for m in masks]),
+                       BOOLEAN)
+    raise ValueError(f"Unsupported operator '{root}' with "
+                     f"{len(operands)} operand(s).")
+
+
+def lower_column_operand(
+    operand: Union["Token", "Predicate", "Selector"],
+    functions: "Functions",
+) -> "Lowered":
+    if isinstance(operand, Selector):
+        raise ValueError(
+            "Nested selectors are not supported by columnar evaluation.")
+    if isinstance(operand, Predicate):
+        return lower_column_predicate(operand, functions)
+    return lower_column_token(operand)
+
+
+class ColumnarPredicate:
+    # A predicate evaluated over a batch of records held as columns: each
+    # comparison yields a boolean mask for the whole batch and the logical
+    # operators combine masks. All the operands are evaluated, there is no
+    # short-circuit across records.
+    predicate: "Predicate"
+    functions: "Functions"
+
+    def __init__(
+        self,
+        predicate: "Predicate",
+        functions: Optional["Functions"] = None,
+    ) -> None:
+        self.predicate = predicate
+        self.functions = {} if functions is None else functions
+        self._mask = as_mask(lower_column_predicate(predicate, self.functions))
+        self._reset = document_reset(self.functions)
+
+    def mask(self, columns: "Columns") -> "Mask":
+        if self._reset is not None:
+            self._reset()
+        sizes = {len(c) for c in columns.values()}
+        if len(sizes) > 1:
+            raise ValueError(f"Columns differ in length: {sorted(sizes)}.")
+        return self._mask(Batch(columns, sizes.pop() if sizes else 0))
+
+    def filter(self, columns: "Columns") -> dict[str, "Column"]:
+        mask = self.mask(columns)
+        if is_array(mask):
+            return {
+                field: column[mask] if is_array(column) else
+                [v for v, keep in zip(column, mask.tolist()) if keep]
+                for field, column in columns.items()
+            }
+        return {
+            field: [v for v, keep in zip(column, mask) if keep]
+            for field, column in columns.items()
+        }
+
+
+def compile_columnar(
+    query: Union[str, "Selector", "Predicate"],
+    functions: Optional["Functions"] = None,
+) -> "ColumnarPredicate":
+    # Takes the predicate of a single step selector, e.g. "records{ a > 1 }".
+    if isinstance(query, Predicate):
+        return ColumnarPredicate(query, functions)
+    selector = flatten(parse(query) if isinstance(query, str) else query)
+    if len(selector.steps) != 1 or selector.steps[0].predicate is None:
+        raise ValueError("Columnar evaluation takes a single step with a "
+                         "predicate, e.g. 'records{ amount > 1 }'.")
+    if not isinstance(predicate := selector.steps[0].predicate, Predicate):
+        raise ValueError(
+            "Nested selectors are not supported by columnar evaluation.")
+    return ColumnarPredicate(predicate, functions)
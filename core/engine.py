@@ -0,0 +1,489 @@
+import operator
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Mapping
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+from core.functions import DOCUMENT_SCOPE
+from core.functions import FunctionRegistry
+from core.optimizer import optimize as optimize_selector
+from core.symbols import ASSOCIATIVE_GROUPS
+from core.symbols import COMPARATORS
+from core.symbols import CONJUNCTION_OPERATORS
+from core.symbols import DISJUNCTION_OPERATORS
+from core.symbols import EXCLUSIVE_DISJUNCTION_OPERATORS
+from core.symbols import FUNCTION_PREFIX
+from core.symbols import NEGATION_OPERATORS
+from core.symbols import Operator
+from core.symbols import THIS
+from core.zonquery import at_offset
+from core.zonquery import flatten as flatten_selector
+from core.zonquery import Function
+from core.zonquery import parse
+from core.zonquery import Predicate
+from core.zonquery import Selector
+from core.zonquery import Step
+from core.zonquery import Token
+
+Evaluator = Callable[[Any], Any]
+StepRunner = Callable[[list[Any]], list[Any]]
+Functions = Mapping[str, Callable[..., Any]]
+Query = Union[str, "Selector", "CompiledQuery"]
+Slices = list[tuple[int, int]]  # Sorted, disjoint [start, stop) intervals.
+SliceResolver = Callable[[int], Slices]  # Array size to its slices.
+
+
+class Missing:
+    def __bool__(self) -> bool:
+        return False
+
+    def __repr__(self) -> str:
+        return "MISSING"
+
+
+MISSING = Missing()  # Value of a field absent from the evaluated node.
+
+# Kinds of values produced by a lowered operand.
+BOOLEAN: int = 0
+VALUE: int = 1
+CONSTANT: int = 2
+NODES: int = 3
+
+
+class Lowered(NamedTuple):
+    evaluate: Evaluator
+    kind: int
+    constant: Any = MISSING
+
+
+def compare(op: Callable[[Any, Any], bool], left: Any, right: Any) -> bool:
+    if left is MISSING or right is MISSING:
+        return False
+    try:
+        return op(left, right)
+    except TypeError:  # E.g. comparing a string against an int.
+        return False
+
+
+def literal_value(token: "Token") -> Any:
+    return token.value if token.is_literal else MISSING
+
+
+def as_truth(lowered: "Lowered") -> Evaluator:
+    if lowered.kind == BOOLEAN:
+        return lowered.evaluate
+    if lowered.kind == CONSTANT:
+        truth = bool(lowered.constant)
+        return lambda _: truth
+    evaluate = lowered.evaluate
+    return lambda node: bool(evaluate(node))
+
+
+def as_argument(lowered: "Lowered") -> Evaluator:
+    if lowered.kind != VALUE:
+        return lowered.evaluate
+    evaluate = lowered.evaluate
+
+    def argument(node: Any) -> Any:
+        value = evaluate(node)
+        return None if value is MISSING else value
+
+    return argument
+
+
+def lower_token(token: "Token") -> "Lowered":
+    if (value := literal_value(token)) is not MISSING:
+        return Lowered(lambda _: value, CONSTANT, value)
+    if (name := token.word) == THIS:
+        return Lowered(lambda node: node, VALUE)
+
+    def lookup(node: Any) -> Any:
+        if isinstance(node, dict):
+            return node.get(name, MISSING)
+        return MISSING
+
+    return Lowered(lookup, VALUE)
+
+
+def resolve_function(
+    predicate: "Predicate",
+    functions: "Functions",
+) -> tuple[Callable[..., Any], Optional["Function"]]:
+    # The callable of a call and, from a registry, its declaration, once
+    # the arity is checked.
+    root = predicate.root
+    name = root.word[len(FUNCTION_PREFIX):]
+    declared = (functions.function(name)
+                if isinstance(functions, FunctionRegistry) else None)
+    if (fn := declared.fn if declared else functions.get(name)) is None:
+        raise ValueError(f"Unknown function '{root}'{at_offset(root)}.")
+    if declared is not None and not declared.accepts(
+            count := len(predicate.operands)):
+        raise ValueError(f"Function '{root}' expects {declared.arity_text} "
+                         f"argument(s) but got {count}{at_offset(root)}.")
+    return fn, declared
+
+
+def document_reset(functions: "Functions") -> Optional[Callable[[], None]]:
+    # Clears the function results cached for the previous document, when
+    # they are cached per document.
+    if (isinstance(functions, FunctionRegistry) and functions.cached and
+            functions.cache.scope == DOCUMENT_SCOPE):
+        return functions.cache.reset
+    return None
+
+
+def lower_function(predicate: "Predicate", functions: "Functions") -> "Lowered":
+    fn, declared = resolve_function(predicate, functions)
+    lowered = [lower_operand(o, functions) for o in predicate.operands]
+    if declared is not None and declared.pure and all(
+            o.kind == CONSTANT for o in lowered):
+        value = fn(*[o.constant for o in lowered])
+        return Lowered(lambda _: value, CONSTANT, value)
+    if declared is not None and declared.cache_size:
+        fn = functions.cache.wrap(declared)
+    arguments = tuple(as_argument(o) for o in lowered)
+
+    if not arguments:
+        return Lowered(lambda _: fn(), VALUE)
+    if len(arguments) == 1:
+        (argument,) = arguments
+        return Lowered(lambda node: fn(argument(node)), VALUE)
+    return Lowered(lambda node: fn(*[a(node) for a in arguments]), VALUE)
+
+
+def lower_comparison(
+    op: Callable[[Any, Any], bool],
+    left: "Lowered",
+    right: "Lowered",
+) -> Evaluator:
+    lf, rf = left.evaluate, right.evaluate
+
+    if left.kind == NODES and right.kind == NODES:
+        return lambda node: any(
+            compare(op, lv, rv) for lv in lf(node) for rv in rf(node))
+    if left.kind == NODES:
+        if right.kind == CONSTANT:
+            rv = right.constant
+            return lambda node: any(compare(op, lv, rv) for lv in lf(node))
+
+        def compare_left_nodes(node: Any) -> bool:
+            rv = rf(node)
+            return any(compare(op, lv, rv) for lv in lf(node))
+
+        return compare_left_nodes
+    if right.kind == NODES:
+
+        def compare_right_nodes(node: Any) -> bool:
+            lv = lf(node)
+            return any(compare(op, lv, rv) for rv in rf(node))
+
+        return compare_right_nodes
+    if right.kind == CONSTANT:
+        return lower_constant_comparison(op, lf, right.constant)
+    return lambda node: compare(op, lf(node), rf(node))
+
+
+def lower_constant_comparison(
+    op: Callable[[Any, Any], bool],
+    lf: Evaluator,
+    rv: Any,
+) -> Evaluator:
+    # The literal was typed by the parser, so this is a plain Python
+    # comparison. Equality never raises and MISSING equals nothing.
+    if op is operator.eq:
+        return lambda node: lf(node) == rv
+
+    def compare_constant(node: Any) -> bool:
+        if (lv := lf(node)) is MISSING:
+            return False
+        try:
+            return op(lv, rv)
+        except TypeError:
+            return False
+
+    return compare_constant
+
+
+def check_operands(predicate: "Predicate") -> int:
+    # The operand count of an operator, once checked against its arity.
+    root, count = predicate.root, len(predicate.operands)
+    if (op := root.operator) in ASSOCIATIVE_GROUPS:
+        if count < 2:  # Flattened chains keep at least two operands.
+            raise ValueError(f"Operator '{root}' expects at least 2 operands "
+                             f"but got {count}{at_offset(predicate)}.")
+    elif count != (arity := int(op.arity)):
+        raise ValueError(f"Operator '{root}' expects {arity} operand(s) "
+                         f"but got {count}{at_offset(predicate)}.")
+    return count
+
+
+def lower_predicate(
+    predicate: "Predicate",
+    functions: "Functions",
+) -> "Lowered":
+    root = predicate.root
+    if not root.is_operator:  # A single term, e.g. "a{b}".
+        return lower_token(root)
+    if (op := root.operator) is Operator.FUNCTION:
+        return lower_function(predicate, functions)
+
+    count = check_operands(predicate)
+    operands = [lower_operand(o, functions) for o in predicate.operands]
+
+    if op in NEGATION_OPERATORS:
+        truth = as_truth(operands[0])
+        return Lowered(lambda node: not truth(node), BOOLEAN)
+
+    if op in COMPARATORS:
+        return Lowered(lower_comparison(COMPARATORS[op], *operands), BOOLEAN)
+
+    if count > 2:
+        return Lowered(lower_chain(op, [as_truth(o) for o in operands]),
+                       BOOLEAN)
+    left, right = (as_truth(o) for o in operands)
+    if op in CONJUNCTION_OPERATORS:
+        return Lowered(lambda node: left(node) and right(node), BOOLEAN)
+    if op in DISJUNCTION_OPERATORS:
+        return Lowered(lambda node: left(node) or right(node), BOOLEAN)
+    if op in EXCLUSIVE_DISJUNCTION_OPERATORS:
+        return Lowered(lambda node: left(node) != right(node), BOOLEAN)
+    raise ValueError(f"Unsupported operator '{root}'.")
+
+
+def lower_chain(op: "Operator", truths: list[Evaluator]) -> Evaluator:
+    # N-ary AND/OR/XOR from flattened predicates: a single loop instead of
+    # one closure call per level of a left-deep binary chain.
+    truths = tuple(truths)
+    if op in CONJUNCTION_OPERATORS:
+        return lambda node: all(truth(node) for truth in truths)
+    if op in DISJUNCTION_OPERATORS:
+        return lambda node: any(truth(node) for truth in truths)
+
+    def parity(node: Any) -> bool:
+        odd = False
+        for truth in truths:
+            if truth(node):
+                odd = not odd
+        return odd
+
+    return parity
+
+
+def lower_operand(
+    operand: Union["Token", "Predicate", "Selector"],
+    functions: "Functions",
+) -> "Lowered":
+    if isinstance(operand, Selector):
+        return Lowered(lower_selector(operand, functions), NODES)
+    if isinstance(operand, Predicate):
+        return lower_predicate(operand, functions)
+    return lower_token(operand)
+
+
+def merge_intervals(intervals: Iterable[tuple[int, int]]) -> "Slices":
+    merged: Slices = []
+    for start, stop in sorted(intervals):
+        if start >= stop:
+            continue
+        if merged and start <= merged[-1][1]:  # Overlapping or adjacent.
+            if stop > merged[-1][1]:
+                merged[-1] = (merged[-1][0], stop)
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+def lower_ranges(ranges: Iterable[tuple[int, int]]) -> SliceResolver:
+    # Inclusive ranges become half-open intervals. Those with a negative
+    # bound depend on the array size; the others are merged once, here.
+    ranges = tuple(ranges)
+    fixed = merge_intervals(
+        (start, end + 1) for start, end in ranges if start >= 0 and end >= 0)
+    relative = tuple((start, end) for start, end in ranges
+                     if start < 0 or end < 0)
+
+    def clip(size: int) -> "Slices":
+        slices = []
+        for start, stop in fixed:
+            if start >= size:
+                break
+            slices.append((start, stop if stop < size else size))
+        return slices
+
+    if not relative:
+        return clip
+
+    def resolve(size: int) -> "Slices":
+        slices = clip(size)
+        for start, end in relative:
+            start = max(start + size if start < 0 else start, 0)
+            stop = min((end + size if end < 0 else end) + 1, size)
+            slices.append((start, stop))
+        return merge_intervals(slices)
+
+    return resolve
+
+
+def lower_expand(step: "Step") -> StepRunner:
+    # From the values found under the step's key to the nodes it selects,
+    # before its predicate: arrays are sliced by the ranges or expanded.
+    slices_of = (lower_ranges(r.range_ for r in step.ranges)
+                 if step.ranges else None)
+
+    def expand(values: list[Any]) -> list[Any]:
+        selected: list[Any] = []
+        for value in values:
+            if isinstance(value, list):
+                if slices_of is None:
+                    selected.extend(value)
+                else:
+                    for start, stop in slices_of(len(value)):
+                        selected.extend(value[start:stop])
+            elif slices_of is None:
+                selected.append(value)
+        return selected
+
+    return expand
+
+
+def lower_take(step: "Step", functions: "Functions") -> StepRunner:
+    # The nodes selected by the step, filtered by its predicate.
+    expand = lower_expand(step)
+    if not step.predicate:
+        return expand
+    keep = as_truth(lower_operand(step.predicate, functions))
+    return lambda values: [v for v in expand(values) if keep(v)]
+
+
+def lower_step(step: "Step", functions: "Functions") -> StepRunner:
+    take = lower_take(step, functions)
+    if (name := step.node.word) == THIS:
+        return take
+
+    def run(nodes: list[Any]) -> list[Any]:
+        return take([
+            value for node in nodes if isinstance(node, dict) and
+            (value := node.get(name, MISSING)) is not MISSING
+        ])
+
+    return run
+
+
+def lower_steps(steps: Iterable["Step"], functions: "Functions") -> StepRunner:
+    runners = tuple(lower_step(s, functions) for s in steps)
+
+    def run(nodes: list[Any]) -> list[Any]:
+        for step in runners:
+            if not (nodes := step(nodes)):
+                break
+        return nodes
+
+    return run
+
+
+def lower_selector(selector: "Selector", functions: "Functions") -> Evaluator:
+    steps = lower_steps(selector.steps, functions)
+
+    def run(node: Any) -> list[Any]:
+        return steps([node])
+
+    return run
+
+
+class IndexedPlan(NamedTuple):
+    path: tuple[str, ...]  # Leading plain key steps, looked up in an index.
+    take: StepRunner  # Values at path to the nodes selected by its step.
+    rest: StepRunner  # The remaining steps.
+
+
+def lower_indexed(selector: "Selector", functions: "Functions") -> IndexedPlan:
+    # Keys up to the first step with ranges or a predicate, included, are
+    # resolved by the index; "this" stops the path.
+    steps = selector.steps
+    prefix = 0
+    while prefix < len(steps) and steps[prefix].node.word != THIS:
+        prefix += 1
+        if steps[prefix - 1].ranges or steps[prefix - 1].predicate:
+            break
+    if not prefix:
+        return IndexedPlan((), lambda values: values,
+                           lower_steps(steps, functions))
+    return IndexedPlan(tuple(s.node.word for s in steps[:prefix]),
+                       lower_take(steps[prefix - 1], functions),
+                       lower_steps(steps[prefix:], functions))
+
+
+class CompiledQuery:
+    selector: "Selector"
+    functions: "Functions"
+    flatten: bool
+    optimize: bool
+    lowered: "Selector"  # As flattened or optimized, then lowered.
+
+    def __init__(
+        self,
+        selector: "Selector",
+        functions: Optional["Functions"] = None,
+        flatten: bool = True,
+        optimize: bool = False,
+    ) -> None:
+        self.selector = selector
+        self.functions = {} if functions is None else functions
+        self.flatten = flatten
+        self.optimize = optimize
+        if optimize:  # Flattens too.
+            selector = optimize_selector(selector)
+        elif flatten:
+            selector = flatten_selector(selector)
+        self.lowered = selector
+        self._run = lower_selector(selector, self.functions)
+        self._plan: Optional["IndexedPlan"] = None
+        self._reset = document_reset(self.functions)
+
+    def indexed_plan(self) -> "IndexedPlan":
+        if self._plan is None:
+            self._plan = lower_indexed(self.lowered, self.functions)
+        return self._plan
+
+    def begin_document(self) -> None:
+        # For callers running the lowered steps or plan themselves.
+        if self._reset is not None:
+            self._reset()
+
+    def select(self, document: Any) -> list[Any]:
+        if self._reset is not None:
+            self._reset()
+        return self._run(document)
+
+    def matches(self, document: Any) -> bool:
+        if self._reset is not None:
+            self._reset()
+        return bool(self._run(document))
+
+    def __str__(self) -> str:
+        return f"compiled {self.selector}"
+
+
+def compile(  # pylint: disable=redefined-builtin
+    query: Union[str, "Selector"],
+    functions: Optional["Functions"] = None,
+    flatten: bool = True,
+    optimize: bool = False,
+) -> "CompiledQuery":
+    selector = parse(query) if isinstance(query, str) else query
+    return CompiledQuery(selector, functions, flatten, optimize)
+
+
+def as_compiled(
+    query: "Query",
+    functions: Optional["Functions"] = None,
+    flatten: bool = True,
+    optimize: bool = False,
+) -> "CompiledQuery":
+    if isinstance(query, CompiledQuery):
+        return query
+    return compile(query, functions, flatten, optimize)
@@ -0,0 +1,360 @@
+import codecs
+import re
+from typing import Any
+from typing import AnyStr
+from typing import IO
+from typing import Iterator
+from typing import Optional
+
+from core.engine import as_compiled
+from core.engine import as_truth
+from core.engine import Evaluator
+from core.engine import Functions
+from core.engine import lower_operand
+from core.engine import lower_steps
+from core.engine import lower_take
+from core.engine import merge_intervals
+from core.engine import Query
+from core.engine import Slices
+from core.engine import StepRunner
+from core.lib import json
+from core.mapped import CONTAINER_DEPTH
+from core.mapped import container_pattern
+from core.mapped import STRING_PATTERN
+from core.stream import DEFAULT_CHUNK_SIZE
+from core.symbols import THIS
+from core.zonquery import Step
+
+# Events of a JSON document, as (event, value) pairs. Only VALUE and MAP_KEY
+# carry a value.
+START_MAP: str = "start_map"
+MAP_KEY: str = "map_key"
+END_MAP: str = "end_map"
+START_ARRAY: str = "start_array"
+END_ARRAY: str = "end_array"
+VALUE: str = "value"
+
+Event = tuple[str, Any]
+
+TOKEN = re.compile(r"""[ \t\n\r]*(?:
+    (?P<delimiter>[{}\[\]:,])
+    | (?P<string>"(?:[^"\\]|\\.)*")
+    | (?P<number>-?(?:0|[1-9][0-9]*)
+        (?P<fraction>(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?))
+    | (?P<constant>true|false|null)
+)""", re.VERBOSE | re.DOTALL)
+TRAILING_WHITESPACE = re.compile(r"[ \t\n\r]*\Z")
+# What a number cut by the end of a chunk may be followed by, e.g. "12.".
+NUMBER_CUT = re.compile(r"[.eE+-]*\Z")
+CONSTANTS: dict[str, Any] = {"true": True, "false": False, "null": None}
+# Items of a container, with the patterns of core.mapped, on text.
+ITEMS = re.compile(
+    r'(?:[^"\[\]{}]++|' + STRING_PATTERN.decode() + r"|" +
+    container_pattern(CONTAINER_DEPTH).decode() + r")*+", re.DOTALL)
+
+
+class JsonEvents:
+    # Iterator over the events of a JSON document read from a stream, in
+    # chunks. The buffer holds the rest of the current chunk and, when built
+    # or skipped whole, the container being read.
+    #
+    # Right after START_MAP or START_ARRAY, skip() and build() consume the
+    # whole container at once, by matching its text rather than its events.
+    def __init__(
+        self,
+        fileobj: IO[AnyStr],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+    ) -> None:
+        self._fileobj = fileobj
+        self._decode = None
+        if isinstance(fileobj.read(0), bytes):
+            self._decode = codecs.getincrementaldecoder("utf-8")().decode
+        self._chunk_size = self._size = chunk_size
+        self._text, self._pos, self._offset = "", 0, 0
+        self._end_of_file = False
+        self._closing: list[str] = []  # Delimiters closing open containers.
+        self._expect_key = False
+
+    def _fill(self, keep: int) -> int:
+        # Reads a chunk, dropping the text before keep. Returns the shift of
+        # positions in the buffer.
+        chunk = self._fileobj.read(self._size)
+        self._end_of_file = not chunk
+        if self._decode is not None:
+            chunk = self._decode(chunk, self._end_of_file)
+        self._offset += keep
+        self._text = self._text[keep:] + chunk
+        self._pos -= keep
+        # Text longer than a chunk doubles the reads, so that it is not
+        # rescanned once per chunk.
+        self._size = max(self._chunk_size, len(self._text))
+        return keep
+
+    def _error(self, message: str) -> ValueError:
+        return ValueError(f"Invalid JSON at character "
+                          f"{self._offset + self._pos}: {message}.")
+
+    def _token(self) -> tuple[str, Any]:
+        while True:
+            match = TOKEN.match(self._text, self._pos)
+            # A token ending with the buffer may go on in the next chunk, and
+            # so may a number followed by the start of a fraction or exponent.
+            if not self._end_of_file and (
+                    match is None or match.end() == len(self._text) or
+                    match.lastgroup == "number" and
+                    NUMBER_CUT.match(self._text, match.end())):
+                self._fill(self._pos)
+                continue
+            if match is None:
+                if TRAILING_WHITESPACE.match(self._text, self._pos):
+                    raise StopIteration
+                raise self._error(repr(self._text[self._pos:self._pos + 20]))
+            break
+
+        group = match.lastgroup
+        token = match.group(group)
+        self._pos = match.end()
+        if group == "delimiter":
+            return group, token
+        if group == "string":
+            return group, json.loads(token) if "\\" in token else token[1:-1]
+        if group == "constant":
+            return group, CONSTANTS[token]
+        if match.group("fraction"):
+            return group, float(token)
+        return group, int(token)
+
+    def __iter__(self) -> "JsonEvents":
+        return self
+
+    def __next__(self) -> "Event":
+        while True:
+            try:
+                group, token = self._token()
+            except StopIteration:
+                if self._closing:
+                    raise self._error("unexpected end of document") from None
+                raise
+            if group != "delimiter":
+                if not self._expect_key:
+                    return VALUE, token
+                if group != "string":
+                    raise self._error(f"invalid key {token!r}")
+                self._expect_key = False
+                return MAP_KEY, token
+            if token == "{":
+                self._closing.append("}")
+                self._expect_key = True
+                return START_MAP, None
+            if token == "[":
+                self._closing.append("]")
+                return START_ARRAY, None
+            if token == ",":
+                self._expect_key = bool(self._closing and
+                                        self._closing[-1] == "}")
+            elif token != ":":
+                if not self._closing or self._closing.pop() != token:
+                    raise self._error(f"unexpected '{token}'")
+                self._expect_key = False
+                return (END_MAP if token == "}" else END_ARRAY), None
+
+    def _close(self, start: int, keep: bool) -> int:
+        # Moves past the end of the innermost open container. Returns start,
+        # a position in the buffer, shifted as chunks are read; without keep,
+        # the text before the position reached may be dropped.
+        depth, pos = 1, self._pos
+        while True:
+            # Whole items and containers are matched at once. The run stops
+            # at a closing bracket, a container nested too deep or going on
+            # in the next chunk, or a string going on in the next chunk.
+            pos = ITEMS.match(self._text, pos).end()
+            char = self._text[pos:pos + 1]
+            if char == "]" or char == "}":
+                depth -= 1
+                pos += 1
+                if not depth:
+                    break
+            elif char == "[" or char == "{":
+                depth += 1
+                pos += 1
+            elif self._end_of_file:
+                raise self._error("unexpected end of document")
+            else:
+                self._pos = pos
+                shift = self._fill(start if keep else pos)
+                start, pos = start - shift, pos - shift
+        self._pos = pos
+        self._closing.pop()
+        self._expect_key = False
+        return start
+
+    def build(self, event: str, value: Any) -> Any:
+        # Materializes the value starting with event.
+        if event != START_MAP and event != START_ARRAY:
+            return value
+        start = self._close(self._pos - 1, True)
+        return json.loads(self._text[start:self._pos])
+
+    def skip(self, event: str) -> None:
+        if event == START_MAP or event == START_ARRAY:
+            self._close(self._pos, False)
+
+    def skip_rest(self) -> None:
+        # Skips the remaining items of the innermost open container.
+        self._close(self._pos, False)
+
+
+def iter_events(
+    fileobj: IO[AnyStr],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> "JsonEvents":
+    return JsonEvents(fileobj, chunk_size)
+
+
+class EventStep:
+    __slots__ = ("name", "slices", "keep", "take", "rest")
+
+    name: str
+    # Fixed slices of arrays, None without ranges. Ranges relative to the
+    # array size need the whole array, which is then built and given to
+    # take.
+    slices: Optional["Slices"]
+    keep: Optional["Evaluator"]
+    take: Optional["StepRunner"]
+    rest: "StepRunner"  # The following steps, on built nodes.
+
+    def __init__(
+        self,
+        step: "Step",
+        rest: list["Step"],
+        functions: "Functions",
+    ) -> None:
+        self.name = step.node.word
+        ranges = [r.range_ for r in step.ranges or ()]
+        self.slices = self.take = None
+        if any(start < 0 or end < 0 for start, end in ranges):
+            self.take = lower_take(step, functions)
+        elif ranges:
+            self.slices = merge_intervals(
+                (start, end + 1) for start, end in ranges)
+        self.keep = (as_truth(lower_operand(step.predicate, functions))
+                     if step.predicate else None)
+        self.rest = lower_steps(rest, functions)
+
+
+class EventSelector:
+    # Evaluates a selector over the events of a single JSON document, as a
+    # state machine driven by its steps: nodes off the selector's path are
+    # skipped as their events go by and matches are yielded as soon as they
+    # complete. Memory is bounded by the largest node built, which is a
+    # match, or a node tested by the first step with a predicate.
+    #
+    # Unlike json.loads, a key repeated in an object yields its every value.
+    def __init__(
+        self,
+        query: "Query",
+        functions: Optional["Functions"] = None,
+    ) -> None:
+        compiled = as_compiled(query, functions)
+        steps = compiled.lowered.steps
+        self._begin_document = compiled.begin_document
+        self._steps = tuple(
+            EventStep(step, steps[i + 1:], compiled.functions)
+            for i, step in enumerate(steps))
+
+    def select(self, events: "JsonEvents") -> Iterator[Any]:
+        self._begin_document()
+        for event, value in events:
+            yield from self._node(event, value, events, 0)
+            return
+
+    def _node(
+        self,
+        event: str,
+        value: Any,
+        events: "JsonEvents",
+        i: int,
+    ) -> Iterator[Any]:
+        # A node the i-th step applies to.
+        if (name := self._steps[i].name) == THIS:
+            yield from self._value(event, value, events, i)
+            return
+        if event != START_MAP:
+            events.skip(event)
+            return
+        for event, value in events:
+            if event == END_MAP:
+                return
+            key = value
+            event, value = next(events)
+            if key == name:
+                yield from self._value(event, value, events, i)
+            else:
+                events.skip(event)
+
+    def _value(
+        self,
+        event: str,
+        value: Any,
+        events: "JsonEvents",
+        i: int,
+    ) -> Iterator[Any]:
+        # The value found under the i-th step's key: arrays are expanded.
+        step = self._steps[i]
+        if step.take is not None:
+            for node in step.take([events.build(event, value)]):
+                yield from self._selected(node, i)
+            return
+        if event != START_ARRAY:
+            if step.slices is None:
+                yield from self._item(event, value, events, i)
+            else:
+                events.skip(event)
+            return
+
+        slices = iter(step.slices or ())
+        start, stop = next(slices, (-1, -1))
+        index = 0
+        while step.slices is None or stop >= 0:
+            event, value = next(events)
+            if event == END_ARRAY:
+                return
+            if step.slices is None or start <= index < stop:
+                yield from self._item(event, value, events, i)
+            else:
+                events.skip(event)
+            index += 1
+            while index >= stop >= 0:
+                start, stop = next(slices, (-1, -1))
+        events.skip_rest()  # Past the last slice.
+
+    def _item(
+        self,
+        event: str,
+        value: Any,
+        events: "JsonEvents",
+        i: int,
+    ) -> Iterator[Any]:
+        step = self._steps[i]
+        if step.keep is None and i + 1 < len(self._steps):
+            yield from self._node(event, value, events, i + 1)
+            return
+        node = events.build(event, value)
+        if step.keep is None or step.keep(node):
+            yield from self._selected(node, i)
+
+    def _selected(self, node: Any, i: int) -> Iterator[Any]:
+        if i + 1 == len(self._steps):
+            yield node
+        else:
+            yield from self._steps[i].rest([node])
+
+
+def iter_select_document(
+    query: "Query",
+    fileobj: IO[AnyStr],
+    functions: Optional["Functions"] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[Any]:
+    yield from EventSelector(query, functions).select(
+        iter_events(fileobj, chunk_size))
@@ -0,0 +1,150 @@
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Optional
+from typing import Sequence
+from typing import Union
+from core.lib import LazyModule
+from core.zonquery import Node
+from core.zonquery import Predicate
+from core.zonquery import Range
+from core.zonquery import Selector
+from core.zonquery import Step
+from core.zonquery import Token
+
+# json's string escaping, imported by the first export.
+JSON_ENCODER = LazyModule("json.encoder")
+
+
+def json_members(
+    node: Union["Predicate", "Selector", "Step", "Range"]
+) -> Iterable[tuple[str, Any]]:
+    # The members of the node's as_dict, in order, with the nodes as is.
+    if isinstance(node, Predicate):
+        return ((node.root.word, node.operands),)
+    if isinstance(node, Selector):
+        return (("selector", node.steps),)
+    if isinstance(node, Range):
+        return (("start", node.range_[0]), ("end", node.range_[1]))
+    members = [("node", node.node)]
+    if node.ranges:
+        members.append(("ranges", node.ranges))
+    if node.predicate is not None:
+        members.append(("predicate", node.predicate))
+    return members
+
+
+def write_json(
+    node: Union["Node", "Step", "Range"],
+    write: Callable[[str], Any],
+    indent: Optional[int] = None,
+) -> None:
+    # Writes the JSON of node.as_dict, piece by piece, without building the
+    # dicts. Iterative, as predicates nest deeply. Compact output reuses the
+    # JSON memoized on frozen nodes. Strings are escaped as json.dumps does
+    # with ensure_ascii=False, the same with or without orjson.
+    if indent is not None:
+        write_indented_json(node, write, indent)
+        return
+    encode_basestring = JSON_ENCODER.encode_basestring
+    pending: list[Any] = [node]
+    while pending:
+        node = pending.pop()
+        if type(node) is str:
+            write(node)
+        elif isinstance(node, Token):
+            write(encode_basestring(node.word))
+        elif node._json is not None:
+            write(node._json)
+        elif isinstance(node, Predicate):
+            head = f"{{{encode_basestring(node.root.word)}:["
+            operands = node.operands
+            if all(isinstance(o, Token) for o in operands):
+                write(head + ",".join([encode_basestring(o.word)
+                                       for o in operands]) + "]}")
+            else:
+                write(head)
+                push_items(pending, operands, "]}")
+        elif isinstance(node, Selector):
+            write('{"selector":[')
+            push_items(pending, node.steps, "]}")
+        elif isinstance(node, Step):
+            text = f'{{"node":{encode_basestring(node.node.word)}'
+            if node.ranges:
+                text += ',"ranges":[' + ",".join([
+                    f'{{"start":{r.range_[0]},"end":{r.range_[1]}}}'
+                    for r in node.ranges
+                ]) + "]"
+            if node.predicate is None:
+                write(text + "}")
+            else:
+                write(text + ',"predicate":')
+                pending += ("}", node.predicate)
+        else:
+            write(f'{{"start":{node.range_[0]},"end":{node.range_[1]}}}')
+
+
+def push_items(pending: list[Any], items: Sequence[Any], close: str) -> None:
+    # Pushes the items of an array, then its closing, to be popped in order.
+    pending.append(close)
+    for i in range(len(items) - 1, 0, -1):
+        pending += (items[i], ",")
+    if items:
+        pending.append(items[0])
+
+
+def write_indented_json(
+    node: Union["Node", "Step", "Range"],
+    write: Callable[[str], Any],
+    indent: int,
+) -> None:
+    # As json.dumps with indent, hence without the memoized JSON.
+    encode_basestring = JSON_ENCODER.encode_basestring
+    pending: list[Any] = [(node, 0)]
+    while pending:
+        item = pending.pop()
+        if type(item) is str:
+            write(item)
+            continue
+        node, depth = item
+        if isinstance(node, Token):
+            write(encode_basestring(node.word))
+            continue
+
+        outer = "\n" + " " * (indent * depth)
+        inner = outer + " " * indent
+        pieces: list[Any] = ["{"]
+        for i, (key, value) in enumerate(json_members(node)):
+            pieces.append(f"{',' if i else ''}{inner}"
+                          f"{encode_basestring(key)}: ")
+            if type(value) is int:
+                pieces.append(str(value))
+            elif not isinstance(value, (list, tuple)):
+                pieces.append((value, depth + 1))
+            elif not value:
+                pieces.append("[]")
+            else:
+                pieces.append("[" + inner + " " * indent)
+                for j, child in enumerate(value):
+                    if j:
+                        pieces.append("," + inner + " " * indent)
+                    pieces.append((child, depth + 2))
+                pieces.append(inner + "]")
+        pieces.append(outer + "}")
+        pending.extend(reversed(pieces))
+
+
+def to_json(
+    node: Union["Node", "Step", "Range"],
+    indent: Optional[int] = None,
+) -> str:
+    # The compact JSON of a frozen node is memoized on it: ASTs are logged
+    # and shipped far more often than built.
+    if indent is None and (memo := getattr(node, "_json", None)) is not None:
+        return memo
+    chunks: list[str] = []
+    write_json(node, chunks.append, indent)
+    text = "".join(chunks)
+    if indent is None and getattr(node, "_frozen", False):
+        object.__setattr__(node, "_json", text)
+    return text
@@ -0,0 +1,226 @@
+from contextlib import contextmanager
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import Mapping
+from typing import Optional
+
+from core.cache import CacheInfo
+from core.cache import LRUCache
+from core.symbols import Arity
+from core.symbols import FUNCTION_PREFIX
+from core.zonquery import Argument
+from core.zonquery import Function
+
+
+# Lifetimes of cached function results: cleared as each document is
+# evaluated, or when the caller starts a batch.
+DOCUMENT_SCOPE: str = "document"
+BATCH_SCOPE: str = "batch"
+SCOPES: tuple[str, ...] = (DOCUMENT_SCOPE, BATCH_SCOPE)
+
+
+def signature_arguments(
+        fn: Callable[..., Any]) -> Optional[tuple["Argument", ...]]:
+    # The positional parameters of fn, None when it has no signature, as some
+    # builtins. Selectors pass no keyword arguments.
+    import inspect  # Only when registering: importing stays lean.
+
+    try:
+        parameters = inspect.signature(fn).parameters.values()
+    except (TypeError, ValueError):
+        return None
+    return tuple(
+        Argument(p.name, p.default is not p.empty, p.kind is p.VAR_POSITIONAL)
+        for p in parameters
+        if p.kind is not p.KEYWORD_ONLY and p.kind is not p.VAR_KEYWORD)
+
+
+def declared_arguments(arity: int) -> tuple["Argument", ...]:
+    if arity == Arity.NARY:
+        return (Argument("arguments", variadic=True),)
+    if arity < 0:
+        raise ValueError(f"Invalid arity {arity}.")
+    return tuple(Argument(f"argument{i}") for i in range(arity))
+
+
+class FunctionCache:
+    # Results of the functions registered with a cache size, one bounded LRU
+    # cache per function, keyed on the values and types of their arguments,
+    # as 1, 1.0 and True are equal. Calls with unhashable values, e.g. lists,
+    # are not cached.
+    #
+    # A document is one select() of a compiled query, one evaluate() of a
+    # query set or one mask() of a columnar predicate. With the batch scope,
+    # results are kept across documents until reset(), e.g. by batch().
+    # Statistics add up across resets.
+    scope: str
+
+    def __init__(self, scope: str = DOCUMENT_SCOPE) -> None:
+        if scope not in SCOPES:
+            raise ValueError(f"Cache scope must be one of {SCOPES}, got "
+                             f"'{scope}'.")
+        self.scope = scope
+        self._caches: dict[str, LRUCache] = {}
+        self._totals: dict[str, tuple[int, int, int]] = {}
+
+    def _cache(self, function: "Function") -> "LRUCache":
+        if (cache := self._caches.get(function.name)) is None:
+            cache = self._caches[function.name] = LRUCache(function.cache_size)
+        elif cache.maxsize != function.cache_size:
+            cache.resize(function.cache_size)
+        return cache
+
+    def wrap(self, function: "Function") -> Callable[..., Any]:
+        get_or_create, fn = self._cache(function).get_or_create, function.fn
+
+        def create(key: tuple[tuple[Any, ...], tuple[type, ...]]) -> Any:
+            return fn(*key[0])
+
+        def cached(*arguments: Any) -> Any:
+            try:
+                key = (arguments, tuple(map(type, arguments)))
+                hash(key)
+            except TypeError:
+                return fn(*arguments)
+            return get_or_create(key, create)
+
+        return cached
+
+    def wrap_async(self, function: "Function") -> Callable[..., Any]:
+        # For coroutine functions: the task of each call is cached, so that
+        # concurrent calls with the same arguments share it. Failed calls
+        # are dropped from the cache, to be retried.
+        import asyncio  # Only for async evaluation: importing stays lean.
+
+        cache = self._cache(function)
+        fn = function.fn
+
+        def create(
+            key: tuple[tuple[Any, ...], tuple[type, ...]]
+        ) -> "asyncio.Future":
+            task = asyncio.ensure_future(fn(*key[0]))
+
+            def discard_failed(task: "asyncio.Future") -> None:
+                if task.cancelled() or task.exception() is not None:
+                    cache.discard(key)
+
+            task.add_done_callback(discard_failed)
+            return task
+
+        def cached(*arguments: Any) -> Any:
+            try:
+                key = (arguments, tuple(map(type, arguments)))
+                hash(key)
+            except TypeError:
+                return fn(*arguments)
+            return cache.get_or_create(key, create)
+
+        return cached
+
+    def reset(self) -> None:
+        for name, cache in self._caches.items():
+            info = cache.info()
+            hits, misses, evictions = self._totals.get(name, (0, 0, 0))
+            self._totals[name] = (hits + info.hits, misses + info.misses,
+                                  evictions + info.evictions)
+            cache.clear()
+
+    @contextmanager
+    def batch(self) -> Iterator["FunctionCache"]:
+        self.reset()
+        try:
+            yield self
+        finally:
+            self.reset()
+
+    def info(self) -> dict[str, "CacheInfo"]:
+        infos = {}
+        for name, cache in self._caches.items():
+            info = cache.info()
+            hits, misses, evictions = self._totals.get(name, (0, 0, 0))
+            infos[name] = info._replace(hits=hits + info.hits,
+                                        misses=misses + info.misses,
+                                        evictions=evictions + info.evictions)
+        return infos
+
+    def hit_rates(self) -> dict[str, float]:
+        return {
+            name: info.hits / calls if (calls := info.hits + info.misses) else
+            0.0 for name, info in self.info().items()
+        }
+
+    def report(self) -> str:
+        lines = [f"{'function':<24} {'hits':>10} {'misses':>10} "
+                 f"{'evictions':>10} {'hit rate':>8}"]
+        rates = self.hit_rates()
+        for name, info in self.info().items():
+            lines.append(f"{name:<24} {info.hits:>10,} {info.misses:>10,} "
+                         f"{info.evictions:>10,} {rates[name]:>8.1%}")
+        return "\n".join(lines)
+
+
+class FunctionRegistry(Mapping[str, Callable[..., Any]]):
+    # Functions callable from selectors, by name without the f: prefix. As a
+    # mapping it gives the callables, so it stands for a dict of functions
+    # anywhere one is taken; compiling also checks the arity of every call
+    # and evaluates pure ones with literal arguments.
+    #
+    # The arity is read from the signature, unless declared: a number of
+    # arguments, or Arity.NARY for any. Without either, any is accepted.
+    #
+    # Caching is opt-in: with a cache size, the results of a function are
+    # kept in self.cache, for the scope given here.
+    cache: "FunctionCache"
+
+    def __init__(
+        self,
+        functions: Optional[Mapping[str, Callable[..., Any]]] = None,
+        cache_scope: str = DOCUMENT_SCOPE,
+    ) -> None:
+        self._functions: dict[str, Function] = {}
+        self.cache = FunctionCache(cache_scope)
+        for name, fn in (functions or {}).items():
+            self.register(fn, name=name)
+
+    def register(
+        self,
+        fn: Optional[Callable[..., Any]] = None,
+        *,
+        name: Optional[str] = None,
+        arity: Optional[int] = None,
+        pure: bool = False,
+        cache: int = 0,
+    ) -> Callable[..., Any]:
+        # Returns fn, so that it decorates a function as well, with or
+        # without arguments, e.g. @registry.register(pure=True).
+        if fn is None:
+            return lambda f: self.register(
+                f, name=name, arity=arity, pure=pure, cache=cache)
+        if cache < 0:
+            raise ValueError(f"Cache size must be non-negative, got {cache}.")
+        name = name or fn.__name__
+        if name.startswith(FUNCTION_PREFIX):
+            name = name[len(FUNCTION_PREFIX):]
+        if arity is not None:
+            arguments = declared_arguments(arity)
+        elif (arguments := signature_arguments(fn)) is None:
+            arguments = declared_arguments(Arity.NARY)
+        self._functions[name] = Function(name, fn, arguments, pure, cache)
+        return fn
+
+    def function(self, name: str) -> Optional["Function"]:
+        return self._functions.get(name)
+
+    @property
+    def cached(self) -> bool:
+        return any(f.cache_size for f in self._functions.values())
+
+    def __getitem__(self, name: str) -> Callable[..., Any]:
+        return self._functions[name].fn
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._functions)
+
+    def __len__(self) -> int:
+        return len(self._functions)
@@ -0,0 +1,240 @@
+from bisect import bisect_right
+import re
+from typing import Iterator
+from typing import Optional
+
+from core.symbols import Separator
+from core.symbols import TOKEN_PATTERN
+from core.zonquery import conjoin
+from core.zonquery import parse_selector
+from core.zonquery import scan_matches
+from core.zonquery import Selector
+from core.zonquery import Step
+from core.zonquery import Token
+
+# Raised by parse() on invalid selectors, kept by states instead.
+PARSE_ERRORS: tuple[type[Exception], ...] = (ValueError, AssertionError)
+
+# Nested by the tokenizer, as opposed to curly brackets: by the parser only.
+OPENING: frozenset[str] = frozenset(
+    (Separator.OPEN_BRACKET, Separator.OPEN_PARENTHESIS))
+CLOSING: frozenset[str] = frozenset(
+    (Separator.CLOSE_BRACKET, Separator.CLOSE_PARENTHESIS))
+
+
+class Segment:
+    # A run of the selector text starting with a top-level step, up to the
+    # next one. Segments are tokenized and parsed on their own, which gives
+    # the same steps as parsing the whole text: each starts with a word
+    # after a dot outside any bracket, where the parser starts a new step
+    # and the tokenizer holds no state. Segments are shared by states.
+    __slots__ = ("size", "tokens", "scan_error", "parse_error", "steps",
+                 "complete", "parsed")
+
+    size: int  # Characters, up to the next segment.
+    tokens: Optional[list["Token"]]  # None if it fails to tokenize.
+    scan_error: Optional[Exception]
+    parse_error: Optional[Exception]
+    steps: Optional[tuple["Step", ...]]  # Frozen, once parsed.
+    complete: bool  # All tokens parsed: the selector goes on after it.
+    parsed: bool
+
+    def __init__(self, size: int, matches: list["re.Match"]) -> None:
+        self.size = size
+        self.tokens = self.scan_error = self.parse_error = self.steps = None
+        self.complete = self.parsed = False
+        try:
+            self.tokens = list(conjoin(scan_matches(matches)))
+        except PARSE_ERRORS as e:
+            self.scan_error = e
+
+    def moved(self, delta: int) -> "Segment":
+        # The segment found delta characters further: steps and errors hold
+        # offsets, so its tokens are copied at their new ones and parsed
+        # again, without tokenizing the text again.
+        segment = Segment.__new__(Segment)
+        segment.size = self.size
+        segment.tokens = [
+            t if t.start is None else t.at(t.start + delta, t.end + delta)
+            for t in self.tokens
+        ]
+        segment.scan_error = segment.parse_error = segment.steps = None
+        segment.complete = segment.parsed = False
+        return segment
+
+    def parse(self) -> None:
+        # Once, when first needed: parse() does not parse past the first
+        # step it cannot, nor report the errors there.
+        if self.tokens is None or self.parsed:
+            return
+        self.parsed = True
+        tokens = self.tokens
+        try:
+            selector, end = parse_selector(tokens, 0, len(tokens))
+            selector.freeze()
+        except PARSE_ERRORS as e:
+            self.parse_error = e
+            return
+        self.steps = selector.steps
+        self.complete = end == len(tokens)
+
+
+def split(text: str, pos: int) -> Iterator[tuple[int, int, list["re.Match"]]]:
+    # Start, end and token matches of the segments of text from pos, which
+    # must start one. A dot within brackets never ends a segment, nor after
+    # an unmatched closing one: only parsing tells where those stop.
+    depth = curly_depth = 0
+    after_dot = False
+    start = pos
+    matches: list[re.Match] = []
+    for match in TOKEN_PATTERN.finditer(text, pos):
+        kind = match.lastgroup
+        if kind == "blank":
+            matches.append(match)
+            continue
+        word = match.group()
+        if after_dot and kind == "word" and word.isalnum():
+            yield start, match.start(), matches
+            start, matches = match.start(), []
+        after_dot = False
+        if kind == "separator":
+            if word in OPENING:
+                depth += 1
+            elif word in CLOSING:
+                depth -= 1
+            elif word == Separator.OPEN_CURLY_BRACKET:
+                curly_depth += 1
+            elif word == Separator.CLOSE_CURLY_BRACKET:
+                curly_depth -= 1
+            elif word == Separator.DOT and not depth and not curly_depth:
+                after_dot = True
+        matches.append(match)
+    yield start, len(text), matches
+
+
+class ParseState:
+    # A selector text with its segments, parsed again after each edit from
+    # the segment before the edit, up to the first one found unchanged: the
+    # steps of the others, their predicates included, are reused as is, or
+    # parsed again from their tokens if the edit moved them.
+    # Invalid texts are kept too, so that edits can go on; selector raises
+    # the error parse() would.
+    text: str
+    segments: tuple["Segment", ...]
+    starts: tuple[int, ...]  # Offset of each segment.
+    scanned: int  # Segments tokenized to build this state.
+    scan_error_at: Optional[int]  # Index of the first segment failing to.
+
+    def __init__(
+        self,
+        text: str,
+        segments: tuple["Segment", ...],
+        scanned: int,
+    ) -> None:
+        self.text = text
+        self.segments = segments
+        self.scanned = scanned
+        starts, offset = [], 0
+        for segment in segments:
+            starts.append(offset)
+            offset += segment.size
+        self.starts = tuple(starts)
+        self.scan_error_at = None
+        self._selector: Optional[Selector] = None
+        self._error: Optional[Exception] = None
+        self._assemble()
+
+    def _assemble(self) -> None:
+        # As parse(): tokenizing the whole text fails first, then parsing
+        # stops at the first step it cannot parse.
+        for i, segment in enumerate(self.segments):
+            if segment.scan_error is not None:
+                self.scan_error_at = i
+                self._error = segment.scan_error
+                return
+        steps: list[Step] = []
+        for segment in self.segments:
+            segment.parse()
+            if segment.parse_error is not None:
+                self._error = segment.parse_error
+                return
+            steps.extend(segment.steps)
+            if not segment.complete:
+                break
+        selector = Selector()
+        selector.steps = steps
+        if located := [s for s in steps if s.start is not None]:
+            selector.start = located[0].start  # As SelectorFrame does.
+            selector.end = located[-1].end
+        selector.seal()  # Its steps are, already.
+        self._selector = selector
+
+    @property
+    def error(self) -> Optional[Exception]:
+        return self._error
+
+    @property
+    def selector(self) -> "Selector":
+        if self._error is not None:
+            raise self._error
+        return self._selector
+
+
+def parse_state(text: str) -> "ParseState":
+    segments = tuple(
+        Segment(end - start, matches)
+        for start, end, matches in split(text, 0))
+    return ParseState(text, segments, len(segments))
+
+
+def reparse(
+    state: "ParseState",
+    offset: int,
+    removed: int,
+    inserted: str,
+) -> "ParseState":
+    # The state of state.text with the removed characters at offset replaced
+    # by the inserted text.
+    text = state.text
+    if not 0 <= offset <= len(text) or not 0 <= removed <= len(text) - offset:
+        raise ValueError(f"Invalid edit of {removed} characters at offset "
+                         f"{offset} in a text of {len(text)}.")
+    new_text = text[:offset] + inserted + text[offset + removed:]
+    delta = len(inserted) - removed
+    edited_end = offset + len(inserted)  # In new_text, unchanged after.
+
+    # The segment before the edited one too: a dot starts a segment only
+    # if the word after it is alphanumeric, up to the edit maybe. From an
+    # unmatched quote before, as the edit may close it.
+    starts, old = state.starts, state.segments
+    first = max(bisect_right(starts, offset) - 2, 0)
+    if state.scan_error_at is not None:
+        first = min(first, state.scan_error_at)
+    segments = list(old[:first])
+    scanned = 0
+    for start, end, matches in split(new_text, starts[first]):
+        i = bisect_right(starts, start) - 1
+        if end <= offset and starts[i] == start and old[i].size == end - start:
+            segments.append(old[i])  # Before the edit, unchanged.
+        else:
+            segments.append(Segment(end - start, matches))
+            scanned += 1
+        if end >= edited_end and end < len(new_text):
+            j = bisect_right(starts, end - delta) - 1
+            if starts[j] == end - delta:  # Same text on, same segments.
+                break
+    else:
+        return ParseState(new_text, tuple(segments), scanned)
+
+    # Offsets after the edit moved with the text.
+    for segment in old[j:]:
+        if delta and segment.scan_error is None:
+            segment = segment.moved(delta)
+        elif delta:
+            segment = Segment(
+                segment.size,
+                list(TOKEN_PATTERN.finditer(new_text, end, end + segment.size)))
+            scanned += 1
+        segments.append(segment)
+        end += segment.size
+    return ParseState(new_text, tuple(segments), scanned)
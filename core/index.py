@@ -0,0 +1,150 @@
+import sys
+from typing import Any
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+
+from core.cache import LRUCache
+from core.engine import as_compiled
+from core.engine import CompiledQuery
+from core.engine import Functions
+from core.engine import Query
+
+Path = tuple[str, ...]
+
+# Queries given as text, compiled and planned once, by text and functions.
+# Entries reference their functions, whose ids are never reused meanwhile.
+QUERY_CACHE: "LRUCache" = LRUCache(maxsize=1_024)
+
+
+class IndexInfo(NamedTuple):
+    paths: int
+    references: int  # Document values referenced by the index.
+    nbytes: int  # Memory held by the index itself, not by the document.
+    hits: int
+    misses: int
+    generation: int
+
+
+def compiled_query(
+    query: "Query",
+    functions: Optional["Functions"] = None,
+) -> "CompiledQuery":
+    if not isinstance(query, str):
+        return as_compiled(query, functions)
+    return QUERY_CACHE.get_or_create(
+        (query, id(functions)), lambda _: as_compiled(query, functions))
+
+
+def expand(values: Iterable[Any]) -> list[Any]:
+    # Values to the nodes a following step visits: arrays give their items.
+    nodes: list[Any] = []
+    for value in values:
+        if isinstance(value, list):
+            nodes.extend(value)
+        else:
+            nodes.append(value)
+    return nodes
+
+
+class DocumentIndex:
+    # Maps key paths of one document, e.g. ("insurance", "benefits"), to the
+    # values found there, so that many selectors share a single traversal.
+    #
+    # The index references the document's nodes and never copies them. After
+    # mutating the document in place, call invalidate() with the path that
+    # changed: it and every path below it are dropped, then recomputed from
+    # the closest valid ancestor when next looked up. Replacing the document
+    # means building a new index.
+    document: Any
+    max_depth: Optional[int]
+    generation: int
+    hits: int
+    misses: int
+
+    def __init__(self, document: Any, max_depth: Optional[int] = None) -> None:
+        self.document = document
+        self.max_depth = max_depth
+        self.generation = 0
+        self.hits = self.misses = 0
+        self._values: dict[Path, list[Any]] = {(): [document]}
+        self._build()
+
+    def _build(self) -> None:
+        # One pass over the document, level by level. Deeper paths are
+        # indexed lazily, on lookup.
+        pending: list[tuple[Path, list[Any]]] = [((), [self.document])]
+        while pending:
+            path, nodes = pending.pop()
+            if self.max_depth is not None and len(path) >= self.max_depth:
+                continue
+            children: dict[str, list[Any]] = {}
+            for node in nodes:
+                if isinstance(node, dict):
+                    for key, value in node.items():
+                        children.setdefault(key, []).append(value)
+            for key, values in children.items():
+                self._values[child := (*path, key)] = values
+                pending.append((child, expand(values)))
+
+    def values(self, path: Path) -> list[Any]:
+        if (values := self._values.get(path)) is not None:
+            self.hits += 1
+            return values
+        self.misses += 1
+
+        depth = len(path) - 1
+        while path[:depth] not in self._values:
+            depth -= 1
+        values = self._values[path[:depth]]
+        for depth in range(depth + 1, len(path) + 1):
+            key = path[depth - 1]
+            # The document itself is a node, even an array, as in _build.
+            nodes = expand(values) if depth > 1 else values
+            values = [
+                node[key] for node in nodes
+                if isinstance(node, dict) and key in node
+            ]
+            self._values[path[:depth]] = values
+        return values
+
+    def nodes(self, path: Path) -> list[Any]:
+        return expand(self.values(path)) if path else [self.document]
+
+    def select(
+        self,
+        query: "Query",
+        functions: Optional["Functions"] = None,
+    ) -> list[Any]:
+        compiled = compiled_query(query, functions)
+        plan = compiled.indexed_plan()
+        compiled.begin_document()
+        if not (values := self.values(plan.path)):
+            return []
+        return plan.rest(plan.take(values))
+
+    def invalidate(self, path: Path = ()) -> int:
+        # Returns the number of paths dropped. The root is always kept.
+        size = len(path)
+        stale = [p for p in self._values if p[:size] == path and p]
+        for p in stale:
+            del self._values[p]
+        self.generation += 1
+        return len(stale)
+
+    def memory_usage(self) -> int:
+        return sys.getsizeof(self._values) + sum(
+            sys.getsizeof(path) + sys.getsizeof(values)
+            for path, values in self._values.items())
+
+    def info(self) -> "IndexInfo":
+        return IndexInfo(len(self._values),
+                         sum(len(v) for v in self._values.values()),
+                         self.memory_usage(), self.hits, self.misses,
+                         self.generation)
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def __contains__(self, path: Path) -> bool:
+        return path in self._values
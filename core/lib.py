@@ -1,22 +1,57 @@
 from typing import Any
+from typing import Callable
+from typing import Optional
 
-try:
-    # from truth.truth import AssertThat
-    import orjson as json
-    from rich.console import Console
 
-    console = Console()
-    print = console.print
-    JSON_OPTIONS = dict(option=json.OPT_INDENT_2)
+class LazyModule:
+    # Stands for the first of the modules importable, imported on first use
+    # rather than with its importers: attributes are bound once read, so later
+    # reads cost as much as on the module.
+    def __init__(self, *names: str) -> None:
+        self._names = names
 
-except ImportError:
-    import json
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_") and name != "__name__":
+            raise AttributeError(name)
+        module = self.__dict__.get("_module") or self._import()
+        value = getattr(module, name)
+        setattr(self, name, value)
+        return value
 
-    JSON_OPTIONS = dict(indent=2)
+    def _import(self) -> Any:
+        for module_name in self._names:
+            try:
+                # With a fromlist, the submodule rather than its package.
+                self._module = __import__(module_name, fromlist=["_"])
+            except ImportError:
+                continue
+            return self._module
+        raise ImportError(f"None of {', '.join(self._names)} is installed.")
+
+
+# orjson when installed. Both parse str and bytes, only orjson dumps bytes.
+json = LazyModule("orjson", "json")
+_console_print: Optional[Callable[..., None]] = None
 
 
 def as_json(data: dict[str, Any]) -> str:
-    return json.dumps(data, **JSON_OPTIONS).decode("utf-8")
+    # Tokens are written as their word.
+    if json.__name__ == "orjson":
+        return json.dumps(data, default=str,
+                          option=json.OPT_INDENT_2).decode("utf-8")
+    return json.dumps(data, default=str, indent=2, ensure_ascii=False)
+
+
+def console_print(*objects: Any) -> None:
+    # Through rich's console when installed, created on first use.
+    global _console_print
+    if _console_print is None:
+        try:
+            from rich.console import Console
+            _console_print = Console().print
+        except ImportError:
+            _console_print = print
+    _console_print(*objects)
 
 
 def str_ls(ls: list[Any]) -> list[str]:
@@ -24,4 +59,4 @@ def str_ls(ls: list[Any]) -> list[str]:
 
 
 def print_ls(header: str, ls: list[Any]) -> None:
-    print(f"{header}: {str_ls(ls)}")
+    console_print(f"{header}: {str_ls(ls)}")
@@ -0,0 +1,188 @@
+import mmap
+import re
+from typing import Any
+from typing import Optional
+
+from core.engine import as_compiled
+from core.engine import Functions
+from core.engine import Query
+from core.lib import json
+
+Path = tuple[str, ...]
+Span = tuple[int, int]  # [start, stop) bytes of a JSON value.
+
+WHITESPACE = re.compile(rb"[ \t\n\r]*")
+STRING_PATTERN = rb'"(?:[^"\\]++|\\.)*+"'
+# Strings are matched whole, so brackets inside them are never counted.
+STRUCTURE = re.compile(STRING_PATTERN + rb"|[\[\]{}]", re.DOTALL)
+CONTAINER_DEPTH: int = 8
+
+
+def container_pattern(depth: int) -> bytes:
+    # Arrays and objects nested up to depth levels, skipped by a single
+    # match; possessive quantifiers keep it from backtracking.
+    pattern = rb"(?!)"
+    for _ in range(depth):
+        pattern = (rb'[\[{](?:[^"\[\]{}]++|' + STRING_PATTERN + rb"|" +
+                   pattern + rb")*+[\]}]")
+    return pattern
+
+
+VALUE = re.compile(
+    STRING_PATTERN + rb"|" + container_pattern(CONTAINER_DEPTH) +
+    rb'|[^,:\[\]{}"\s]++', re.DOTALL)
+MEMBER = re.compile(
+    rb"[ \t\n\r]*(" + STRING_PATTERN + rb")[ \t\n\r]*:[ \t\n\r]*", re.DOTALL)
+SEPARATOR = re.compile(rb"[ \t\n\r]*([,\]}])[ \t\n\r]*")
+
+OPEN_OBJECT, CLOSE_OBJECT = ord("{"), ord("}")
+OPEN_ARRAY, CLOSE_ARRAY = ord("["), ord("]")
+QUOTE = ord('"')
+
+
+class MappedDocument:
+    # A JSON document read through a memory map. Selectors walk its bytes:
+    # the subtrees under keys off their path are skipped without being
+    # decoded, and only the values found at the end of the path are parsed.
+    #
+    # The path is made of the leading key steps of the selector, up to the
+    # first step with ranges or a predicate, as for core.index. Those values
+    # are materialized whole, then the remaining steps run on them.
+    filename: str
+    materialized: int  # Bytes parsed into values so far.
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.materialized = 0
+        with open(filename, "rb") as f:
+            try:
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:  # Empty files cannot be mapped.
+                raise ValueError(f"Invalid JSON document in {filename}: "
+                                 f"{e}") from e
+
+    def _at(self, pos: int) -> int:
+        return self._map[pos] if pos < len(self._map) else -1
+
+    def _skip_whitespace(self, pos: int) -> int:
+        return WHITESPACE.match(self._map, pos).end()
+
+    def _error(self, expected: str, pos: int) -> ValueError:
+        found = self._map[pos:pos + 1] or b"end of file"
+        return ValueError(f"Invalid JSON in {self.filename}: expected "
+                          f"{expected} at byte {pos} but found {found!r}.")
+
+    def _skip_value(self, pos: int) -> int:
+        # Returns the position after the value starting at pos.
+        if match := VALUE.match(self._map, pos):
+            return match.end()
+        if self._at(pos) != OPEN_OBJECT and self._at(pos) != OPEN_ARRAY:
+            raise self._error("a value", pos)
+
+        depth = 0  # Nested deeper than CONTAINER_DEPTH, or invalid.
+        for match in STRUCTURE.finditer(self._map, pos):
+            char = self._map[match.start()]
+            if char == OPEN_OBJECT or char == OPEN_ARRAY:
+                depth += 1
+            elif char != QUOTE:
+                depth -= 1
+                if not depth:
+                    return match.end()
+        raise self._error("a closing bracket", len(self._map))
+
+    def _separator(self, pos: int, close: bytes) -> Optional[int]:
+        # Position of the next item after a value, or None at the end of the
+        # array or object.
+        if (match := SEPARATOR.match(self._map, pos)) is None or (
+                separator := match.group(1)) not in (b",", close):
+            raise self._error(f"',' or '{close.decode()}'", pos)
+        return match.end() if separator == b"," else None
+
+    def _find(self, pos: int, path: Path, spans: list[Span]) -> None:
+        # Spans of the values at path below the node at pos. Arrays found
+        # along the path are expanded, as the engine does.
+        if self._at(pos) == OPEN_OBJECT:
+            self._find_in_object(pos, path, spans)
+            return
+        if self._at(pos) != OPEN_ARRAY:
+            return
+        pos = self._skip_whitespace(pos + 1)
+        if self._at(pos) == CLOSE_ARRAY:
+            return
+        while pos is not None:
+            if self._at(pos) == OPEN_OBJECT:
+                self._find_in_object(pos, path, spans)
+            pos = self._separator(self._skip_value(pos), b"]")
+
+    def _find_in_object(self, pos: int, path: Path, spans: list[Span]) -> None:
+        name = path[0]
+        quoted = b'"' + name.encode() + b'"'  # Escaped keys are decoded.
+        found: Optional[Span] = None  # Of a duplicate key, the last wins.
+        pos = self._skip_whitespace(pos + 1)
+        if self._at(pos) == CLOSE_OBJECT:
+            return
+        while pos is not None:
+            if (match := MEMBER.match(self._map, pos)) is None:
+                raise self._error("a key and ':'", pos)
+            start = match.end()
+            pos = self._skip_value(start)
+            if (key := match.group(1)) == quoted or (b"\\" in key and
+                                                     json.loads(key) == name):
+                found = (start, pos)
+            pos = self._separator(pos, b"}")
+
+        if found is None:
+            return
+        if len(path) == 1:
+            spans.append(found)
+        else:
+            self._find(found[0], path[1:], spans)
+
+    def spans(self, path: Path) -> list[Span]:
+        start = self._skip_whitespace(0)
+        if not path:
+            return [(start, self._skip_value(start))]
+        spans: list[Span] = []
+        if self._at(start) == OPEN_OBJECT:
+            self._find_in_object(start, path, spans)
+        return spans
+
+    def values(self, path: Path) -> list[Any]:
+        # The matched values are parsed in one call, as a single array.
+        if not (spans := self.spans(path)):
+            return []
+        self.materialized += sum(stop - start for start, stop in spans)
+        return json.loads(b"[" + b",".join(
+            self._map[start:stop] for start, stop in spans) + b"]")
+
+    def select(
+        self,
+        query: "Query",
+        functions: Optional["Functions"] = None,
+    ) -> list[Any]:
+        compiled = as_compiled(query, functions)
+        plan = compiled.indexed_plan()
+        compiled.begin_document()
+        if not plan.path:
+            return plan.rest(self.values(()))
+        if not (values := self.values(plan.path)):
+            return []
+        return plan.rest(plan.take(values))
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "MappedDocument":
+        return self
+
+    def __exit__(self, *_: Any) -> None:
+        self.close()
+
+
+def select_mapped(
+    query: "Query",
+    filename: str,
+    functions: Optional["Functions"] = None,
+) -> list[Any]:
+    with MappedDocument(filename) as document:
+        return document.select(query, functions)
@@ -0,0 +1,298 @@
+from typing import Any
+from typing import Callable
+from typing import Iterable
+from typing import Optional
+from typing import Union
+from core.symbols import ASSOCIATIVE_GROUPS
+from core.symbols import COMPARATORS
+from core.symbols import CONJUNCTION_OPERATORS
+from core.symbols import EXCLUSIVE_DISJUNCTION_OPERATORS
+from core.symbols import KIND_LITERAL
+from core.symbols import MIRRORED_OPERATORS
+from core.symbols import NEGATION_OPERATORS
+from core.symbols import Operator
+from core.zonquery import flatten
+from core.zonquery import INTERNED_TOKENS
+from core.zonquery import Node
+from core.zonquery import Predicate
+from core.zonquery import Selector
+from core.zonquery import Step
+from core.zonquery import Token
+from core.zonquery import transform
+
+# Relative costs used to order AND/OR operands: literals and field lookups
+# are cheap, nested selectors walk a subtree and functions are opaque, so
+# they keep running last.
+TERM_COST: int = 1
+STEP_COST: int = 10
+FUNCTION_COST: int = 1_000
+
+TRUE_TOKEN: "Token" = Token("1")
+FALSE_TOKEN: "Token" = Token("0")
+NOT_TOKEN: "Token" = INTERNED_TOKENS[Operator.NOT.symbol]
+
+
+def literal_of(node: "Node") -> Optional[Any]:
+    if isinstance(node, Token) and node.kind & KIND_LITERAL:
+        return node.value
+    return None
+
+
+def is_negation(node: "Node") -> bool:
+    return (isinstance(node, Predicate) and
+            node.root.operator in NEGATION_OPERATORS and
+            len(node.operands) == 1)
+
+
+def is_boolean(node: "Node") -> bool:
+    if isinstance(node, Token):
+        return literal_of(node) in (0, 1)
+    return isinstance(node, Predicate) and (
+        is_negation(node) or
+        (node.root.operator in COMPARATORS and len(node.operands) == 2) or
+        (node.root.operator in ASSOCIATIVE_GROUPS and len(node.operands) > 1))
+
+
+class Optimizer:
+    # Rewrites predicates bottom-up into cheaper equivalents, recording a
+    # note per rewrite. Keys and costs are memoized per node so each one is
+    # computed once, from the already rewritten operands. Entries hold their
+    # node: nodes dropped while rewriting would free their ids for new ones.
+    notes: list[str]
+
+    def __init__(self) -> None:
+        self.notes = []
+        self._keys: dict[int, tuple["Node", Optional[tuple]]] = {}
+        self._costs: dict[int, tuple["Node", int]] = {}
+
+    def run(self, selector: "Selector") -> "Selector":
+        return transform(flatten(selector), self.rebuild)
+
+    def rebuild(
+        self,
+        predicate: "Predicate",
+        operands: list["Node"],
+    ) -> "Node":
+        root = predicate.root
+        op = root.operator
+        if op in NEGATION_OPERATORS and len(operands) == 1:
+            node = self.negate(root, operands[0])
+        elif op in COMPARATORS and len(operands) == 2:
+            node = self.compare(root, *operands)
+        elif op in ASSOCIATIVE_GROUPS and len(operands) > 1:
+            node = self.combine(root, operands)
+        else:
+            node = self.predicate(root, operands)
+        if isinstance(node, Predicate):
+            # Stands for the source of the predicate rewritten, e.g. with
+            # its parentheses, which rewrites never see.
+            node.widen(predicate.start, predicate.end)
+        return node
+
+    def negate(self, root: "Token", operand: "Node") -> "Node":
+        operand = self.as_truth(operand)
+        if (value := literal_of(operand)) is not None:
+            self.notes.append(f"folded constant: {render(root)} "
+                              f"{render(operand)}")
+            return FALSE_TOKEN if value else TRUE_TOKEN
+        if is_negation(operand) and is_boolean(inner := operand.operands[0]):
+            self.notes.append(f"folded double negation: {render(inner)}")
+            return inner
+        return self.predicate(root, [operand])
+
+    def compare(self, root: "Token", left: "Node", right: "Node") -> "Node":
+        left_value, right_value = literal_of(left), literal_of(right)
+        if left_value is not None and right_value is not None:
+            try:
+                truth = COMPARATORS[root.operator](left_value, right_value)
+            except TypeError:
+                truth = False
+            self.notes.append(f"folded constant: {render(left)} {root} "
+                              f"{render(right)}")
+            return TRUE_TOKEN if truth else FALSE_TOKEN
+        if left_value is not None:  # Literals go right, compared as is.
+            mirrored = Token.of(MIRRORED_OPERATORS[root.operator].symbol)
+            self.notes.append(f"moved literal right: {render(left)} {root} "
+                              f"{render(right)} -> {render(right)} "
+                              f"{mirrored} {render(left)}")
+            return self.predicate(mirrored, [right, left])
+        return self.predicate(root, [left, right])
+
+    def combine(self, root: "Token", operands: list["Node"]) -> "Node":
+        group = ASSOCIATIVE_GROUPS[root.operator]
+        merged: list["Node"] = []
+        for operand in map(self.as_truth, operands):
+            if (isinstance(operand, Predicate) and
+                    ASSOCIATIVE_GROUPS.get(operand.root.operator) is group):
+                merged.extend(operand.operands)
+            else:
+                merged.append(operand)
+        if group is EXCLUSIVE_DISJUNCTION_OPERATORS:
+            return self.predicate(root, merged)
+
+        # AND drops true constants and is false as soon as one is false; OR
+        # is the converse.
+        identity = group is CONJUNCTION_OPERATORS
+        kept: list["Node"] = []
+        seen: set[tuple] = set()
+        for operand in merged:
+            if (value := literal_of(operand)) is not None:
+                if bool(value) is not identity:
+                    self.notes.append(f"folded constant: {render(operand)} "
+                                      f"decides {root}")
+                    return FALSE_TOKEN if identity else TRUE_TOKEN
+                self.notes.append(
+                    f"dropped constant {root} operand: {render(operand)}")
+                continue
+            if (key := self.key(operand)) is not None:
+                if key in seen:
+                    self.notes.append(
+                        f"dropped duplicate {root} operand: {render(operand)}")
+                    continue
+                seen.add(key)
+            kept.append(operand)
+
+        if not kept:
+            return TRUE_TOKEN if identity else FALSE_TOKEN
+        if len(kept) == 1:
+            if is_boolean(only := kept[0]):
+                return only
+            # Still converted to a boolean, as the operator did.
+            return self.predicate(NOT_TOKEN,
+                                  [self.predicate(NOT_TOKEN, [only])])
+
+        ordered = sorted(kept, key=self.cost)
+        if any(a is not b for a, b in zip(ordered, kept)):
+            self.notes.append(f"reordered {root} operands by cost: "
+                              f"{', '.join(render(o) for o in ordered)}")
+        return self.predicate(root, ordered)
+
+    def as_truth(self, node: "Node") -> "Node":
+        # Only the truth of an operand of NOT/AND/OR/XOR matters, so a double
+        # negation can go even around a non-boolean value.
+        if is_negation(node) and is_negation(inner := node.operands[0]):
+            self.notes.append(
+                f"folded double negation: {render(inner.operands[0])}")
+            return inner.operands[0]
+        return node
+
+    def predicate(self, root: "Token", operands: list["Node"]) -> "Predicate":
+        predicate = Predicate(root)
+        predicate.operands = operands
+        predicate.locate()
+        keys = [self.key(o) for o in operands]
+        self._keys[id(predicate)] = (predicate, None if root.is_function or
+                                     None in keys else (root.word, *keys))
+        self._costs[id(predicate)] = (predicate, (
+            FUNCTION_COST if root.is_function else TERM_COST) + sum(
+                self.cost(o) for o in operands))
+        return predicate
+
+    def key(self, node: Optional["Node"]) -> Optional[tuple]:
+        # Structural identity for duplicate elimination; None for anything
+        # calling a function, which may not be pure.
+        if node is None:
+            return ()
+        if isinstance(node, Token):
+            return (node.word, node.is_phrase)
+        if (entry := self._keys.get(id(node))) is not None:
+            return entry[1]
+        key = None
+        if isinstance(node, Selector):
+            steps = [(s.node.word, tuple(r.range_ for r in s.ranges or ()),
+                      self.key(s.predicate)) for s in node.steps]
+            if all(s[2] is not None for s in steps):
+                key = ("selector", *steps)
+        self._keys[id(node)] = (node, key)
+        return key
+
+    def cost(self, node: Optional["Node"]) -> int:
+        if node is None:
+            return 0
+        if isinstance(node, Token):
+            return TERM_COST
+        if (entry := self._costs.get(id(node))) is not None:
+            return entry[1]
+        if isinstance(node, Selector):
+            cost = sum(STEP_COST + self.cost(s.predicate) for s in node.steps)
+        else:
+            cost = (FUNCTION_COST if node.root.is_function else
+                    TERM_COST) + sum(self.cost(o) for o in node.operands)
+        self._costs[id(node)] = (node, cost)
+        return cost
+
+
+def optimize(selector: "Selector") -> "Selector":
+    return Optimizer().run(selector)
+
+
+def explain(selector: "Selector") -> str:
+    optimizer = Optimizer()
+    optimized = optimizer.run(selector)
+    lines = ["Original:", *tree_lines(selector)]
+    lines += ["Optimized:", *tree_lines(optimized, optimizer.cost)]
+    lines += ["Rewrites:", *(f"  - {n}" for n in optimizer.notes or ["none"])]
+    return "\n".join(lines)
+
+
+def render(node: "Node") -> str:
+    if isinstance(node, Token):
+        return f'"{node.word}"' if node.is_phrase else node.word
+    if isinstance(node, Selector):
+        return ".".join(render_step(s) for s in node.steps)
+    operands = [render(o) for o in node.operands]
+    if node.root.is_function:
+        return f"{node.root}({', '.join(operands)})"
+    if len(operands) == 1:
+        return f"{node.root} {operands[0]}"
+    if not operands:
+        return str(node.root)
+    return f"({f' {node.root} '.join(operands)})"
+
+
+def render_step(step: "Step", predicate: bool = True) -> str:
+    text = step.node.word
+    if step.ranges:
+        text += "[{}]".format(" ".join(
+            str(s) if s == e else f"{s}-{e}"
+            for s, e in (r.range_ for r in step.ranges)))
+    if predicate and step.predicate is not None:
+        text += f"{{{render(step.predicate)}}}"
+    return text
+
+
+def cost_note(
+    node: "Node",
+    cost: Optional[Callable[["Node"], int]],
+) -> str:
+    return f" (cost {cost(node)})" if cost else ""
+
+
+def tree_lines(
+    selector: "Selector",
+    cost: Optional[Callable[["Node"], int]] = None,
+    indent: str = "  ",
+) -> list[str]:
+    # One line per node, children indented under their parent, with the
+    # estimated cost of predicates and nested selectors when given.
+    lines = []
+    pending: list[tuple[Union["Node", "Step"], int]] = [(selector, 0)]
+    while pending:
+        node, depth = pending.pop()
+        pad = indent * depth
+        children: Iterable[Union["Node", "Step"]] = ()
+        if isinstance(node, Step):
+            lines.append(f"{pad}.{render_step(node, predicate=False)}")
+            if node.predicate is not None:
+                children = (node.predicate,)
+        elif isinstance(node, Selector):
+            if depth:
+                lines.append(f"{pad}selector{cost_note(node, cost)}")
+            children = node.steps
+        elif isinstance(node, Token):
+            lines.append(f"{pad}{render(node)}")
+        else:
+            lines.append(f"{pad}{node.root}{cost_note(node, cost)}")
+            children = node.operands
+        pending.extend((c, depth + 1) for c in reversed(tuple(children)))
+    return lines
@@ -0,0 +1,132 @@
+import multiprocessing
+import os
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.engine import CompiledQuery
+from core.engine import Functions
+from core.engine import Query
+from core.lib import json
+from core.zonquery import parse
+from core.zonquery import Selector
+
+DEFAULT_PARTITION_SIZE: int = 64 << 20  # 64 MiB.
+READ_BUFFER_SIZE: int = 1 << 20  # 1 MiB.
+
+
+class Partition(NamedTuple):
+    path: str
+    start: int
+    end: int
+
+
+def partition_files(
+    paths: Iterable[str],
+    partition_size: int = DEFAULT_PARTITION_SIZE,
+) -> list["Partition"]:
+    partitions = []
+    for path in paths:
+        size = os.path.getsize(path)
+        partitions.extend(
+            Partition(path, start, min(start + partition_size, size))
+            for start in range(0, size, partition_size))
+    return partitions
+
+
+def iter_partition_lines(
+        partition: "Partition") -> Iterator[tuple[int, bytes]]:
+    # A line belongs to the partition where it starts, so byte ranges can be
+    # cut anywhere and still yield every line exactly once.
+    with open(partition.path, "rb", buffering=READ_BUFFER_SIZE) as f:
+        position = partition.start
+        if position > 0:
+            f.seek(position - 1)
+            position += len(f.readline()) - 1
+        while position < partition.end and (line := f.readline()):
+            yield position, line
+            position += len(line)
+
+
+def select_partition(
+    query: "CompiledQuery",
+    partition: "Partition",
+    skip_invalid: bool = False,
+) -> list[Any]:
+    matches: list[Any] = []
+    select = query.select
+    for offset, line in iter_partition_lines(partition):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            if skip_invalid:
+                continue
+            raise ValueError(f"Invalid JSON record at byte {offset} of "
+                             f"{partition.path}: {e}") from e
+        matches.extend(select(record))
+    return matches
+
+
+# State of each worker process, set once by the pool initializer.
+_worker_query: Optional["CompiledQuery"] = None
+_worker_skip_invalid: bool = False
+
+
+def _init_worker(
+    selector: "Selector",
+    functions: Optional["Functions"],
+    flatten: bool,
+    optimize: bool,
+    skip_invalid: bool,
+) -> None:
+    # pylint: disable-next=global-statement
+    global _worker_query, _worker_skip_invalid
+    _worker_query = compile(selector, functions, flatten, optimize)
+    _worker_skip_invalid = skip_invalid
+
+
+def _select_in_worker(partition: "Partition") -> list[Any]:
+    return select_partition(_worker_query, partition, _worker_skip_invalid)
+
+
+def select_many(
+    query: "Query",
+    paths: Iterable[str],
+    workers: Optional[int] = None,
+    ordered: bool = True,
+    functions: Optional["Functions"] = None,
+    partition_size: int = DEFAULT_PARTITION_SIZE,
+    skip_invalid: bool = False,
+    flatten: bool = True,
+    optimize: bool = False,
+) -> Iterator[Any]:
+    # Compiled closures can't be pickled: workers get the Selector and
+    # compile it once each. Functions must be picklable (module level).
+    if isinstance(query, CompiledQuery):
+        selector, functions = query.selector, query.functions
+        flatten, optimize = query.flatten, query.optimize
+    else:
+        selector = parse(query) if isinstance(query, str) else query
+    partitions = partition_files(paths, partition_size)
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(partitions) <= 1:
+        compiled = compile(selector, functions, flatten, optimize)
+        for partition in partitions:
+            yield from select_partition(compiled, partition, skip_invalid)
+        return
+
+    with multiprocessing.Pool(
+            processes=min(workers, len(partitions)),
+            initializer=_init_worker,
+            initargs=(selector, functions, flatten, optimize,
+                      skip_invalid),
+    ) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+        for matches in imap(_select_in_worker, partitions):
+            yield from matches
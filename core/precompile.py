@@ -0,0 +1,370 @@
+from array import array
+import hashlib
+import os
+import struct
+import sys
+from typing import Iterable
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+from core.optimizer import optimize as optimize_selector
+from core.zonquery import cache_resize
+from core.zonquery import parse_uncached
+from core.zonquery import PARSE_CACHE
+from core.zonquery import Predicate
+from core.zonquery import Range
+from core.zonquery import restore_token
+from core.zonquery import Selector
+from core.zonquery import Step
+from core.zonquery import Token
+
+# Layout of a precompiled library, little-endian:
+#   header, see HEADER;
+#   a 16-byte BLAKE2b hash of each source text;
+#   the UTF-8 text of every distinct string, concatenated;
+#   an array of unsigned ints: the length of each string, then each token
+#   as (string, is phrase, arity), then each entry as its name, its source
+#   and its AST in pre-order, see the node codes below.
+# Signed ints, i.e. arities and range bounds, are zigzag encoded. Spans are
+# the start and end offsets of a node or token, plus one, 0 for none. Bump
+# FORMAT_VERSION on any change: libraries of another version are refused.
+MAGIC: bytes = b"ZQAST"
+FORMAT_VERSION: int = 2
+HEADER = struct.Struct("<5sHBcIIIII")  # Magic to the size of the ints.
+HASH_SIZE: int = 16
+OPTIMIZED: int = 1  # Header flag.
+TYPECODES: str = "BHIQ"  # Smallest first.
+
+TOKEN_NODE: int = 0  # Token, span.
+PREDICATE_NODE: int = 1  # Root token, its span, operand count, span.
+SELECTOR_NODE: int = 2  # Step count, span.
+STEP_NODE: int = 3  # Token, its span, range count + 1 (0 without ranges),
+# ranges as (start, end, span), 1 with a predicate else 0, span.
+
+SOURCE_SUFFIX: str = ".zq"
+
+Node = Union["Token", "Predicate", "Selector", "Step"]
+
+
+class Precompiled(NamedTuple):
+    name: str
+    source: str
+    selector: "Selector"
+    optimized: bool
+
+
+def source_hash(source: str) -> bytes:
+    return hashlib.blake2b(source.encode(), digest_size=HASH_SIZE).digest()
+
+
+def span(node: Union["Node", "Range"]) -> tuple[int, int]:
+    return (0 if node.start is None else node.start + 1,
+            0 if node.end is None else node.end + 1)
+
+
+def offset(n: int) -> Optional[int]:
+    return n - 1 if n else None
+
+
+def located(token: "Token", start: int, end: int) -> "Token":
+    # A frozen copy of the token at its span, unless shared.
+    if not start and not end:
+        return token
+    token = token.at(offset(start), offset(end))
+    token.freeze()
+    return token
+
+
+def zigzag(n: int) -> int:
+    return n << 1 if n >= 0 else (-n << 1) - 1
+
+
+def unzigzag(n: int) -> int:
+    return n >> 1 if not n & 1 else -((n + 1) >> 1)
+
+
+class Encoder:
+
+    def __init__(self) -> None:
+        self.strings: dict[str, int] = {}
+        self.tokens: dict[tuple[int, bool, int], int] = {}
+        self.ints: list[int] = []
+
+    def string(self, text: str) -> int:
+        if (index := self.strings.get(text)) is None:
+            index = self.strings[text] = len(self.strings)
+        return index
+
+    def token(self, token: "Token") -> int:
+        key = (self.string(token.word), token.is_phrase, token.arity)
+        if (index := self.tokens.get(key)) is None:
+            index = self.tokens[key] = len(self.tokens)
+        return index
+
+    def node(self, root: "Node") -> None:
+        # Pre-order, with an explicit stack as predicates nest deeply.
+        ints = self.ints
+        pending: list[Node] = [root]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, Token):
+                ints += (TOKEN_NODE, self.token(node), *span(node))
+            elif isinstance(node, Predicate):
+                ints += (PREDICATE_NODE, self.token(node.root),
+                         *span(node.root), len(node.operands), *span(node))
+                pending.extend(reversed(node.operands))
+            elif isinstance(node, Selector):
+                ints += (SELECTOR_NODE, len(node.steps), *span(node))
+                pending.extend(reversed(node.steps))
+            else:
+                ints += (STEP_NODE, self.token(node.node), *span(node.node))
+                if node.ranges is None:
+                    ints.append(0)
+                else:
+                    ints.append(len(node.ranges) + 1)
+                    for r in node.ranges:
+                        ints += (zigzag(r.range_[0]), zigzag(r.range_[1]),
+                                 *span(r))
+                ints += (node.predicate is not None, *span(node))
+                if node.predicate is not None:
+                    pending.append(node.predicate)
+
+
+def dumps(
+    sources: Union[Iterable[str], Iterable[tuple[str, str]]],
+    optimize: bool = False,
+) -> bytes:
+    # Sources are selector texts, or (name, text) pairs.
+    encoder = Encoder()
+    hashes: list[bytes] = []
+    for item in sources:
+        name, source = (item, item) if isinstance(item, str) else item
+        selector = parse_uncached(source)
+        if optimize:
+            selector = optimize_selector(selector)
+        hashes.append(source_hash(source))
+        encoder.ints += (encoder.string(name), encoder.string(source))
+        encoder.node(selector)
+
+    strings = [s.encode() for s in encoder.strings]
+    ints = [len(s) for s in strings]
+    for word, is_phrase, arity in encoder.tokens:
+        ints += (word, is_phrase, zigzag(arity))
+    ints += encoder.ints
+    top = max(ints, default=0)
+    typecode = next(t for t in TYPECODES if top < 1 << 8 * array(t).itemsize)
+    packed = array(typecode, ints)
+    if sys.byteorder != "little":
+        packed.byteswap()
+    blob = b"".join(strings)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, OPTIMIZED if optimize else 0,
+                         typecode.encode(), len(hashes), len(strings),
+                         len(encoder.tokens), len(blob), len(packed))
+    return b"".join((header, *hashes, blob, packed.tobytes()))
+
+
+def loads(data: bytes, verify: bool = True) -> list["Precompiled"]:
+    # With verify, the hash of every source is checked against its text.
+    try:
+        (magic, version, flags, typecode, entries, string_count, token_count,
+         blob_size, int_count) = HEADER.unpack_from(data)
+    except struct.error as e:
+        raise ValueError(f"Not a precompiled selector library: {e}.") from e
+    if magic != MAGIC:
+        raise ValueError("Not a precompiled selector library.")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Precompiled library format {version} is not "
+                         f"supported, expected {FORMAT_VERSION}.")
+
+    pos = HEADER.size
+    hashes = [
+        data[start:start + HASH_SIZE]
+        for start in range(pos, pos + entries * HASH_SIZE, HASH_SIZE)
+    ]
+    pos += entries * HASH_SIZE
+    blob = data[pos:pos + blob_size]
+    pos += blob_size
+    ints = array(typecode.decode())
+    ints.frombytes(data[pos:])
+    if len(ints) != int_count or len(blob) != blob_size:
+        raise ValueError("Truncated precompiled selector library.")
+    if sys.byteorder != "little":
+        ints.byteswap()
+    ints = ints.tolist()
+
+    strings: list[str] = []
+    start = 0
+    for size in ints[:string_count]:
+        strings.append(blob[start:start + size].decode())
+        start += size
+    i = string_count
+    tokens = []
+    for _ in range(token_count):
+        tokens.append(
+            restore_token(strings[ints[i]], bool(ints[i + 1]),
+                          unzigzag(ints[i + 2])))
+        i += 3
+
+    library = []
+    for expected in hashes:
+        name, source = strings[ints[i]], strings[ints[i + 1]]
+        if verify and source_hash(source) != expected:
+            raise ValueError(f"Hash mismatch for precompiled '{name}'.")
+        selector, i = decode_node(ints, i + 2, tokens)
+        library.append(
+            Precompiled(name, source, selector, bool(flags & OPTIMIZED)))
+    if i != len(ints):
+        raise ValueError("Invalid precompiled selector library.")
+    return library
+
+
+def decode_node(
+    ints: list[int],
+    i: int,
+    tokens: list["Token"],
+) -> tuple["Node", int]:
+    # Returns the node starting at ints[i], sealed, and the position after
+    # it. Frames are [node, children left].
+    pending: list[list] = []
+    while True:
+        code = ints[i]
+        if code == TOKEN_NODE:
+            node = located(tokens[ints[i + 1]], ints[i + 2], ints[i + 3])
+            children = 0
+            i += 4
+        elif code == PREDICATE_NODE:
+            node = Predicate(
+                located(tokens[ints[i + 1]], ints[i + 2], ints[i + 3]))
+            children = ints[i + 4]
+            node.start, node.end = offset(ints[i + 5]), offset(ints[i + 6])
+            i += 7
+        elif code == SELECTOR_NODE:
+            node, children = Selector(), ints[i + 1]
+            node.start, node.end = offset(ints[i + 2]), offset(ints[i + 3])
+            i += 4
+        elif code == STEP_NODE:
+            node = Step(located(tokens[ints[i + 1]], ints[i + 2], ints[i + 3]))
+            count = ints[i + 4]
+            i += 5
+            if count:
+                node.ranges = []
+                for _ in range(count - 1):
+                    r = Range.__new__(Range)
+                    r.range_ = (unzigzag(ints[i]), unzigzag(ints[i + 1]))
+                    r.start, r.end = offset(ints[i + 2]), offset(ints[i + 3])
+                    r.seal()
+                    node.ranges.append(r)
+                    i += 4
+            children = ints[i]
+            node.start, node.end = offset(ints[i + 1]), offset(ints[i + 2])
+            i += 3
+        else:
+            raise ValueError(f"Invalid node code {code} at {i}.")
+
+        if children:
+            pending.append([node, children])
+            continue
+        if not isinstance(node, Token):
+            node.seal()
+        while pending:  # Attaches the node to its parent.
+            frame = pending[-1]
+            parent = frame[0]
+            if isinstance(parent, Predicate):
+                parent.operands.append(node)
+            elif isinstance(parent, Selector):
+                parent.steps.append(node)
+            else:
+                parent.predicate = node
+            frame[1] -= 1
+            if frame[1]:
+                break
+            pending.pop()
+            node = parent
+            node.seal()  # Its children are, already.
+        else:
+            return node, i
+
+
+def dump(
+    sources: Union[Iterable[str], Iterable[tuple[str, str]]],
+    path: str,
+    optimize: bool = False,
+) -> None:
+    data = dumps(sources, optimize)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def load(path: str, verify: bool = True) -> list["Precompiled"]:
+    with open(path, "rb") as f:
+        return loads(f.read(), verify)
+
+
+def warm_cache(
+    path: str,
+    sources: Optional[Iterable[str]] = None,
+    resize: bool = False,
+) -> int:
+    # Fills the parse cache from a library of unoptimized selectors, so that
+    # parse() returns them without tokenizing. Given the sources expected,
+    # only those are cached and any missing from the library is parsed.
+    # Returns the number of selectors loaded from the library. The cache
+    # must hold them all: with resize, it grows to fit them.
+    library = load(path)
+    if any(p.optimized for p in library):
+        raise ValueError(f"{path} holds optimized selectors, which parse() "
+                         "must not return.")
+    by_source = {p.source: p.selector for p in library}
+    wanted = list(by_source if sources is None else sources)
+    if PARSE_CACHE.maxsize < len(wanted):
+        if not resize:
+            raise ValueError(f"{len(wanted):,} selectors do not fit in the "
+                             f"parse cache, of {PARSE_CACHE.maxsize:,}; pass "
+                             "resize=True to grow it.")
+        cache_resize(len(wanted))
+    loaded = 0
+    for source in wanted:
+        if (selector := by_source.get(source)) is not None:
+            loaded += 1
+            PARSE_CACHE.get_or_create(source, lambda _, s=selector: s)
+        else:
+            PARSE_CACHE.get_or_create(source, parse_uncached)
+    return loaded
+
+
+def read_sources(directory: str) -> list[tuple[str, str]]:
+    # One selector per file ending with SOURCE_SUFFIX, named by its path
+    # relative to the directory.
+    sources = []
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith(SOURCE_SUFFIX):
+                path = os.path.join(root, name)
+                with open(path, encoding="utf-8") as f:
+                    sources.append((os.path.relpath(path, directory),
+                                    f.read().strip()))
+    return sources
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import argparse  # Only for the command line: loading stays lean.
+
+    parser = argparse.ArgumentParser(
+        prog="python -m core.precompile",
+        description=f"Precompiles the *{SOURCE_SUFFIX} selectors of a "
+        "directory into one binary library.")
+    parser.add_argument("directory")
+    parser.add_argument("output")
+    parser.add_argument("--optimize", action="store_true")
+    args = parser.parse_args(argv)
+
+    sources = read_sources(args.directory)
+    dump(sources, args.output, args.optimize)
+    print(f"{len(sources):,} selectors, "
+          f"{os.path.getsize(args.output):,} bytes: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
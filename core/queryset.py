@@ -0,0 +1,135 @@
+from typing import Any
+from typing import Iterable
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+from typing import Union
+
+from core.engine import document_reset
+from core.engine import Functions
+from core.engine import lower_take
+from core.engine import MISSING
+from core.engine import StepRunner
+from core.optimizer import optimize as optimize_selector
+from core.symbols import THIS
+from core.zonquery import flatten as flatten_selector
+from core.zonquery import Node
+from core.zonquery import parse
+from core.zonquery import Selector
+from core.zonquery import Step
+from core.zonquery import Token
+
+
+class QuerySetInfo(NamedTuple):
+    queries: int
+    steps: int  # Steps of all the selectors.
+    evaluated_steps: int  # Steps left once shared prefixes are merged.
+
+
+class TrieNode:
+    __slots__ = ("take", "children", "ends")
+
+    take: Optional["StepRunner"]
+    # Key looked up, then the step applied to its values, so steps on the
+    # same key share the lookup.
+    children: dict[str, dict[tuple, "TrieNode"]]
+    ends: list[int]  # Queries whose last step is this one.
+
+    def __init__(self, take: Optional["StepRunner"] = None) -> None:
+        self.take = take
+        self.children = {}
+        self.ends = []
+
+
+def node_key(node: "Node") -> tuple:
+    # Structural identity of a node, unlike its rendered text: words and
+    # phrases, and literals of different types, differ.
+    if isinstance(node, Token):
+        return (node.word, node.is_phrase, type(node.value), node.value)
+    if isinstance(node, Selector):
+        return ("selector", *(step_key(s) for s in node.steps))
+    return (node_key(node.root), *(node_key(o) for o in node.operands))
+
+
+def step_key(step: "Step") -> tuple:
+    return (step.node.word, tuple(r.range_ for r in step.ranges or ()),
+            None if step.predicate is None else node_key(step.predicate))
+
+
+class QuerySet:
+    # Evaluates many selectors in one traversal of each document: their steps
+    # are merged into a trie, so a prefix shared by several selectors, such
+    # as "insurance{ type = MH }.benefits", is evaluated once.
+    queries: list[Union[str, "Selector"]]
+    functions: "Functions"
+
+    def __init__(
+        self,
+        queries: Iterable[Union[str, "Selector"]],
+        functions: Optional["Functions"] = None,
+        flatten: bool = True,
+        optimize: bool = False,
+    ) -> None:
+        self.queries = list(queries)
+        self.functions = {} if functions is None else functions
+        self._root = TrieNode()
+        self._steps = self._nodes = 0
+        self._reset = document_reset(self.functions)
+
+        for i, query in enumerate(self.queries):
+            selector = parse(query) if isinstance(query, str) else query
+            if optimize:
+                selector = optimize_selector(selector)
+            elif flatten:
+                selector = flatten_selector(selector)
+            node = self._root
+            for step in selector.steps:
+                node = self._add_step(node, step)
+            node.ends.append(i)
+
+    def _add_step(self, parent: "TrieNode", step: "Step") -> "TrieNode":
+        self._steps += 1
+        branches = parent.children.setdefault(step.node.word, {})
+        if (node := branches.get(key := step_key(step))) is None:
+            node = branches[key] = TrieNode(lower_take(step, self.functions))
+            self._nodes += 1
+        return node
+
+    def evaluate(self, document: Any) -> list[list[Any]]:
+        # Matches of each query, in the order the queries were given.
+        if self._reset is not None:
+            self._reset()
+        results: list[list[Any]] = [[] for _ in self.queries]
+        pending: list[tuple[TrieNode, list[Any]]] = [(self._root, [document])]
+        while pending:
+            node, nodes = pending.pop()
+            for i in node.ends:
+                results[i] = nodes if len(node.ends) == 1 else list(nodes)
+
+            for name, branches in node.children.items():
+                if name == THIS:
+                    values = nodes
+                else:
+                    values = [
+                        value for n in nodes if isinstance(n, dict) and
+                        (value := n.get(name, MISSING)) is not MISSING
+                    ]
+                if not values:
+                    continue
+                for child in branches.values():
+                    if selected := child.take(values):
+                        pending.append((child, selected))
+        return results
+
+    def evaluate_many(
+        self,
+        documents: Iterable[Any],
+    ) -> Iterator[list[list[Any]]]:
+        for document in documents:
+            yield self.evaluate(document)
+
+    def info(self) -> "QuerySetInfo":
+        return QuerySetInfo(len(self.queries), self._steps, self._nodes)
+
+    def __len__(self) -> int:
+        return len(self.queries)
@@ -0,0 +1,64 @@
+from typing import Any
+from typing import AnyStr
+from typing import IO
+from typing import Iterator
+from typing import Optional
+
+from core.engine import as_compiled
+from core.engine import Functions
+from core.engine import Query
+from core.lib import json
+
+DEFAULT_CHUNK_SIZE: int = 1 << 20  # 1 MiB.
+
+
+def iter_lines(
+    fileobj: IO[AnyStr],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[AnyStr]:
+    empty = fileobj.read(0)  # Empty str or bytes, matching the stream.
+    newline = "\n" if isinstance(empty, str) else b"\n"
+    partial: list[AnyStr] = []  # Pieces of a line spanning several chunks.
+
+    while chunk := fileobj.read(chunk_size):
+        lines = chunk.split(newline)
+        if len(lines) == 1:
+            partial.append(chunk)
+            continue
+        if partial:
+            partial.append(lines[0])
+            lines[0] = empty.join(partial)
+            partial.clear()
+        partial.append(lines.pop())
+        yield from lines
+    if partial and (last := empty.join(partial)):
+        yield last
+
+
+def iter_records(
+    fileobj: IO[AnyStr],
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    skip_invalid: bool = False,
+) -> Iterator[Any]:
+    for number, line in enumerate(iter_lines(fileobj, chunk_size), 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            if skip_invalid:
+                continue
+            raise ValueError(
+                f"Invalid JSON record on line {number}: {e}") from e
+
+
+def iter_select(
+    query: "Query",
+    fileobj: IO[AnyStr],
+    functions: Optional["Functions"] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    skip_invalid: bool = False,
+) -> Iterator[Any]:
+    select = as_compiled(query, functions).select
+    for record in iter_records(fileobj, chunk_size, skip_invalid):
+        yield from select(record)
@@ -2,6 +2,10 @@ import enum
 from enum import Enum
 from enum import IntEnum
 from enum import StrEnum
+import operator
+import re
+from typing import Any
+from typing import Callable
 from typing import Optional
 
 FUNCTION_PREFIX: str = "f:"
@@ -115,3 +119,149 @@ COMPOUND_OPERATOR_DOUBLED_CHARS = {
         Operator.OR_2,
     )
 }
+# Operators spelled with two separator characters (e.g. "<=", "!=", "==").
+COMPOUND_OPERATORS: set[str] = {
+    symbol for symbol in (
+        {prefix + Operator.EQUAL.symbol
+         for prefix in COMPOUND_OPERATOR_EQUAL_PREFIXES} |
+        {char * 2 for char in COMPOUND_OPERATOR_DOUBLED_CHARS})
+    if set(symbol) <= SEPARATOR_CHARS
+}
+
+# Token kind bits, computed once per token and tested by the parser loops.
+KIND_PHRASE: int = 1 << 0
+KIND_ALNUM: int = 1 << 1
+KIND_DELIMITER: int = 1 << 2
+KIND_OPERATOR: int = 1 << 3
+KIND_FUNCTION: int = 1 << 4
+KIND_UNARY: int = 1 << 5
+KIND_RIGHT_ASSOCIATIVE: int = 1 << 6
+KIND_NON_RIGHT_ANDABLE: int = 1 << 7
+KIND_COMMA: int = 1 << 8
+KIND_DOT: int = 1 << 9
+KIND_OPEN_PARENTHESIS: int = 1 << 10
+KIND_CLOSE_PARENTHESIS: int = 1 << 11
+KIND_OPEN_BRACKET: int = 1 << 12
+KIND_CLOSE_BRACKET: int = 1 << 13
+KIND_OPEN_CURLY_BRACKET: int = 1 << 14
+KIND_CLOSE_CURLY_BRACKET: int = 1 << 15
+KIND_INTEGER: int = 1 << 16
+KIND_FLOAT: int = 1 << 17
+KIND_IDENTIFIER: int = 1 << 18
+KIND_LITERAL: int = KIND_PHRASE | KIND_INTEGER | KIND_FLOAT
+
+SEPARATOR_KINDS: dict[str, int] = {
+    Separator.COMMA: KIND_COMMA,
+    Separator.DOT: KIND_DOT,
+    Separator.OPEN_PARENTHESIS: KIND_OPEN_PARENTHESIS,
+    Separator.CLOSE_PARENTHESIS: KIND_CLOSE_PARENTHESIS,
+    Separator.OPEN_BRACKET: KIND_OPEN_BRACKET,
+    Separator.CLOSE_BRACKET: KIND_CLOSE_BRACKET,
+    Separator.OPEN_CURLY_BRACKET: KIND_OPEN_CURLY_BRACKET,
+    Separator.CLOSE_CURLY_BRACKET: KIND_CLOSE_CURLY_BRACKET,
+}
+
+
+def _delimiter_kind(word: str) -> int:
+    kind = KIND_DELIMITER | SEPARATOR_KINDS.get(word, 0)
+    if word in NON_RIGHT_ANDABLE_CHARS:
+        kind |= KIND_NON_RIGHT_ANDABLE
+    if (op := Operator.parse(word)) is not None:
+        kind |= KIND_OPERATOR
+        if op is Operator.FUNCTION:
+            kind |= KIND_FUNCTION
+        if op.arity is Arity.UNARY:
+            kind |= KIND_UNARY
+        if op.associativity is Associativity.RIGHT:
+            kind |= KIND_RIGHT_ASSOCIATIVE
+    return kind
+
+
+# Kinds of every delimiter word; other words only carry alnum/function bits.
+DELIMITER_KINDS: dict[str, int] = {
+    str(word): _delimiter_kind(word) for word in DELIMITERS
+}
+
+
+def _char_class(chars: set[str]) -> str:
+    return EMPTY.join(re.escape(c) for c in sorted(chars))
+
+
+_SEPARATORS = {
+    c for c in SEPARATOR_CHARS - QUOTE_CHARS if len(c) == 1 and not c.isspace()
+}
+
+# Numeric literals, underscores allowed between digits as in Python. Floats
+# with a fraction are scanned as a whole, their dot is not a path separator.
+INTEGER_PATTERN: re.Pattern = re.compile(r"-?\d+(?:_\d+)*")
+FRACTION: str = r"-?\d+(?:_\d+)*\.\d+(?:_\d+)*(?:[eE][-+]?\d+)?"
+FLOAT_PATTERN: re.Pattern = re.compile(
+    r"-?\d+(?:_\d+)*(?:\.\d+(?:_\d+)*)?(?:[eE][-+]?\d+)?")
+
+# Master pattern consumed by the tokenizer: each alternative is a whole run
+# (blanks, quoted phrase, fractional number, operator or word) named after
+# its kind.
+TOKEN_PATTERN: re.Pattern = re.compile("|".join((
+    r"(?P<blank>\s+)",
+    r'"(?P<double_quoted>[^"]*)"',
+    r"'(?P<single_quoted>[^']*)'",
+    f"(?P<open_quote>[{_char_class(QUOTE_CHARS)}])",
+    f"(?P<fraction>{FRACTION})",
+    "(?P<separator>{}|[{}])".format(
+        "|".join(re.escape(op) for op in sorted(COMPOUND_OPERATORS)),
+        _char_class(_SEPARATORS)),
+    f"(?P<word>[^\\s{_char_class(_SEPARATORS | QUOTE_CHARS)}]+)",
+)))
+
+NEGATION_OPERATORS: set["Operator"] = {
+    Operator.NOT,
+    Operator.NOT_2,
+    Operator.NOT_3,
+}
+CONJUNCTION_OPERATORS: set["Operator"] = {Operator.AND, Operator.AND_2}
+DISJUNCTION_OPERATORS: set["Operator"] = {Operator.OR, Operator.OR_2}
+EXCLUSIVE_DISJUNCTION_OPERATORS: set["Operator"] = {
+    Operator.XOR,
+    Operator.XOR_2,
+}
+RELATIONAL_OPERATORS: set["Operator"] = {
+    Operator.GREATER,
+    Operator.GREATER_OR_EQUAL,
+    Operator.LESS,
+    Operator.LESS_OR_EQUAL,
+    Operator.EQUAL,
+    Operator.EQUAL_2,
+    Operator.NOT_EQUAL,
+}
+THIS: str = "this"
+
+# Operators whose chains can be flattened into a single n-ary node.
+ASSOCIATIVE_GROUPS: dict["Operator", set["Operator"]] = {
+    op: group for group in (
+        CONJUNCTION_OPERATORS,
+        DISJUNCTION_OPERATORS,
+        EXCLUSIVE_DISJUNCTION_OPERATORS,
+    ) for op in group
+}
+
+
+COMPARATORS: dict["Operator", Callable[[Any, Any], bool]] = {
+    Operator.GREATER: operator.gt,
+    Operator.GREATER_OR_EQUAL: operator.ge,
+    Operator.LESS: operator.lt,
+    Operator.LESS_OR_EQUAL: operator.le,
+    Operator.EQUAL: operator.eq,
+    Operator.EQUAL_2: operator.eq,
+    Operator.NOT_EQUAL: operator.ne,
+}
+
+# Operator giving the same result once its operands are swapped.
+MIRRORED_OPERATORS: dict["Operator", "Operator"] = {
+    Operator.GREATER: Operator.LESS,
+    Operator.GREATER_OR_EQUAL: Operator.LESS_OR_EQUAL,
+    Operator.LESS: Operator.GREATER,
+    Operator.LESS_OR_EQUAL: Operator.GREATER_OR_EQUAL,
+    Operator.EQUAL: Operator.EQUAL,
+    Operator.EQUAL_2: Operator.EQUAL_2,
+    Operator.NOT_EQUAL: Operator.NOT_EQUAL,
+}
@@ -2,49 +2,188 @@
 
 from collections import deque
 from enum import StrEnum
+import re
 from typing import Any
+from typing import Callable
 from typing import Iterable
+from typing import Iterator
+from typing import NamedTuple
 from typing import Optional
 from typing import Union
 
-from core.lib import as_json
-from core.symbols import Arity
-from core.symbols import Associativity
+from core.cache import CacheInfo
+from core.cache import LRUCache
+from core.lib import LazyModule
+from core.symbols import ASSOCIATIVE_GROUPS
 from core.symbols import COMPOUND_OPERATOR_DOUBLED_CHARS
 from core.symbols import COMPOUND_OPERATOR_EQUAL_PREFIXES
-from core.symbols import DELIMITERS
+from core.symbols import DELIMITER_KINDS
 from core.symbols import EMPTY
+from core.symbols import FLOAT_PATTERN
 from core.symbols import FUNCTION_PREFIX
+from core.symbols import INTEGER_PATTERN
+from core.symbols import KIND_ALNUM
+from core.symbols import KIND_CLOSE_BRACKET
+from core.symbols import KIND_CLOSE_CURLY_BRACKET
+from core.symbols import KIND_CLOSE_PARENTHESIS
+from core.symbols import KIND_COMMA
+from core.symbols import KIND_DELIMITER
+from core.symbols import KIND_DOT
+from core.symbols import KIND_FLOAT
+from core.symbols import KIND_FUNCTION
+from core.symbols import KIND_IDENTIFIER
+from core.symbols import KIND_INTEGER
+from core.symbols import KIND_LITERAL
+from core.symbols import KIND_NON_RIGHT_ANDABLE
+from core.symbols import KIND_OPEN_BRACKET
+from core.symbols import KIND_OPEN_CURLY_BRACKET
+from core.symbols import KIND_OPEN_PARENTHESIS
+from core.symbols import KIND_OPERATOR
+from core.symbols import KIND_PHRASE
+from core.symbols import KIND_RIGHT_ASSOCIATIVE
+from core.symbols import KIND_UNARY
 from core.symbols import MINUS_CHAR
-from core.symbols import NON_RIGHT_ANDABLE_CHARS
 from core.symbols import Operator
-from core.symbols import QUOTE_CHARS
 from core.symbols import Separator
-from core.symbols import SEPARATOR_CHARS
+from core.symbols import TOKEN_PATTERN
 from core.symbols import TOP_PRECEDENCE
 
+# The JSON writer, which imports this module, imported by the first export.
+EXPORT = LazyModule("core.export")
+
+
+class Frozen:
+    _frozen: bool = False
+    _json: Optional[str] = None  # Compact JSON, memoized once frozen.
+    start: Optional[int] = None  # Offsets of the node in the selector parsed.
+    end: Optional[int] = None
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if self._frozen:
+            raise AttributeError(
+                f"Cannot set '{name}' on frozen {type(self).__name__}.")
+        object.__setattr__(self, name, value)
+
+    def freeze(self) -> None:
+        # Iterative so arbitrarily deep predicates can be frozen.
+        pending: list[Frozen] = [self]
+        while pending:
+            pending.extend(pending.pop().seal())
+
+    def seal(self) -> Iterable["Frozen"]:
+        object.__setattr__(self, "_frozen", True)
+        return ()
+
+    def __getstate__(self) -> dict[str, Any]:
+        # The memoized JSON is not shipped along, e.g. to workers.
+        state = self.__dict__
+        if "_json" in state:
+            state = {k: v for k, v in state.items() if k != "_json"}
+        return state
+
 
 class Token:
+    # Tokens are created by the thousand for large selectors, hence slots and
+    # kind bits computed once instead of per-access string comparisons.
+    # Literals carry their typed value, converted once here; identifiers
+    # carry the field name. The source text stays in word, found between the
+    # start and end offsets of the selector; shared tokens have none.
+    __slots__ = ("word", "operator", "precedence", "arity", "kind", "value",
+                 "start", "end")
+
     word: str
-    operator: Optional["Operator"] = None
-    precedence: int = TOP_PRECEDENCE
-    arity: int = 0
-    is_function: bool = False
-    is_operator: bool = False
-    is_phrase: bool = False
-
-    def __init__(self, word: str, is_phrase: bool = False) -> None:
+    operator: Optional["Operator"]
+    precedence: int
+    arity: int
+    kind: int
+    value: Any
+    start: Optional[int]
+    end: Optional[int]
+
+    def __init__(
+        self,
+        word: str,
+        is_phrase: bool = False,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+    ) -> None:
         self.word = word
-        self.is_phrase = is_phrase
-        if self.is_phrase:
+        self.start = start
+        self.end = end
+        self.operator = None
+        self.precedence = TOP_PRECEDENCE
+        self.arity = 0
+        self.value = None
+        kind = KIND_ALNUM if word.isalnum() else 0
+        if is_phrase:
+            self.kind = kind | KIND_PHRASE
+            self.value = word
             return
-        self.is_function = Token.isit_function(word)
-        self.operator = (Operator.FUNCTION
-                         if self.is_function else Operator.parse(word))
-        self.is_operator = self.operator is not None
-        if self.is_operator:
+
+        kind |= DELIMITER_KINDS.get(word, 0)
+        if Token.isit_function(word):
+            self.operator = Operator.FUNCTION
+            kind |= KIND_OPERATOR | KIND_FUNCTION
+        else:
+            self.operator = Operator.parse(word)
+        if self.operator is not None:
             self.precedence = self.operator.precedence
             self.arity = int(self.operator.arity)
+        elif not kind & KIND_DELIMITER:
+            kind |= self._convert(word)
+        self.kind = kind
+
+    def _convert(self, word: str) -> int:
+        if INTEGER_PATTERN.fullmatch(word):
+            self.value = int(word)
+            return KIND_INTEGER
+        if FLOAT_PATTERN.fullmatch(word):
+            self.value = float(word)
+            return KIND_FLOAT
+        self.value = word
+        return KIND_IDENTIFIER
+
+    @staticmethod
+    def of(word: str) -> "Token":
+        return INTERNED_TOKENS.get(word) or Token(word)
+
+    def at(self, start: int, end: int) -> "Token":
+        # A copy found at the given offsets, e.g. of an interned token,
+        # without building it again.
+        token = Token.__new__(Token)
+        token.word = self.word
+        token.operator = self.operator
+        token.precedence = self.precedence
+        token.arity = self.arity
+        token.kind = self.kind
+        token.value = self.value
+        token.start = start
+        token.end = end
+        return token
+
+    @property
+    def is_phrase(self) -> bool:
+        return bool(self.kind & KIND_PHRASE)
+
+    @property
+    def is_literal(self) -> bool:
+        return bool(self.kind & KIND_LITERAL)
+
+    @property
+    def is_number(self) -> bool:
+        return bool(self.kind & (KIND_INTEGER | KIND_FLOAT))
+
+    @property
+    def is_identifier(self) -> bool:
+        return bool(self.kind & KIND_IDENTIFIER)
+
+    @property
+    def is_function(self) -> bool:
+        return bool(self.kind & KIND_FUNCTION)
+
+    @property
+    def is_operator(self) -> bool:
+        return bool(self.kind & KIND_OPERATOR)
 
     @property
     def is_zero_arg_function(self) -> bool:
@@ -52,40 +191,39 @@ class Token:
 
     @property
     def isalnum(self) -> bool:
-        return self.word.isalnum()
+        return bool(self.kind & KIND_ALNUM)
 
     @property
     def is_delimiter(self) -> bool:
-        return self.word in DELIMITERS
+        return bool(self.kind & KIND_DELIMITER)
 
     @property
     def is_open_parenthesis(self) -> bool:
-        return self.word == Separator.OPEN_PARENTHESIS
+        return bool(self.kind & KIND_OPEN_PARENTHESIS)
 
     @property
     def is_close_parenthesis(self) -> bool:
-        return self.word == Separator.CLOSE_PARENTHESIS
+        return bool(self.kind & KIND_CLOSE_PARENTHESIS)
 
     @property
     def is_open_bracket(self) -> bool:
-        return self.word == Separator.OPEN_BRACKET
+        return bool(self.kind & KIND_OPEN_BRACKET)
 
     @property
     def is_close_bracket(self) -> bool:
-        return self.word == Separator.CLOSE_BRACKET
+        return bool(self.kind & KIND_CLOSE_BRACKET)
 
     @property
     def is_right_associative(self) -> bool:
-        return (self.is_operator and
-                self.operator.associativity is Associativity.RIGHT)
+        return bool(self.kind & KIND_RIGHT_ASSOCIATIVE)
 
     @property
     def is_right_andable(self) -> bool:
-        return self.word in NON_RIGHT_ANDABLE_CHARS
+        return bool(self.kind & KIND_NON_RIGHT_ANDABLE)
 
     @property
     def is_unary_operator(self) -> bool:
-        return self.is_operator and self.operator.arity is Arity.UNARY
+        return bool(self.kind & KIND_UNARY)
 
     def is_compound_operator_with(self, char: str) -> bool:
         return (char == Operator.EQUAL.symbol and
@@ -100,18 +238,86 @@ class Token:
     def __str__(self) -> str:
         return self.word
 
+    def __repr__(self) -> str:
+        return f"Token({self.word!r})"
+
     def __eq__(self, other):
         if not isinstance(other, (Token, str, StrEnum)):
-            return NotImplemented()
+            return NotImplemented
         return self.word == str(other)
 
     def __ne__(self, other):
         if not isinstance(other, (Token, str, StrEnum)):
-            return NotImplemented()
+            return NotImplemented
         return self.word != str(other)
 
-
-class Predicate:
+    def __hash__(self) -> int:
+        return hash(self.word)
+
+    def freeze(self) -> None:
+        # Read-only from now on, e.g. once part of a parsed selector, which
+        # callers share; tokens are built and completed while parsing only.
+        object.__setattr__(self, "__class__", FrozenToken)
+
+    def __reduce__(self):
+        # Pickles as plain values so interned tokens unpickle to singletons,
+        # or copies of them, and no Operator enum references are shipped.
+        return restore_token, (self.word, self.is_phrase, self.arity,
+                               self.start, self.end)
+
+
+def restore_token(
+    word: str,
+    is_phrase: bool,
+    arity: int,
+    start: Optional[int] = None,
+    end: Optional[int] = None,
+) -> "Token":
+    if not is_phrase and (token := INTERNED_TOKENS.get(word)):
+        if start is None:
+            return token
+        token = token.at(start, end)
+    else:
+        token = Token(word, is_phrase, start, end)
+        token.arity = arity
+    token.freeze()  # As the tree it was pickled with.
+    return token
+
+
+class FrozenToken(Token):
+    # A token once frozen. Checking in Token itself would slow down every
+    # assignment while tokenizing, so frozen tokens change class instead.
+    __slots__ = ()
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(
+            f"Cannot set '{name}' on frozen token '{self.word}'.")
+
+
+# Separators and operators never change once built, so a single instance of
+# each is shared by every parse. Functions are excluded: their arity is set
+# while tokenizing. Brackets, commas and operators, which errors and spans
+# point at, are copied at each offset found instead; dots carry none, the
+# selectors around them do.
+INTERNED_TOKENS: dict[str, "Token"] = {
+    word: token for word in DELIMITER_KINDS
+    if not (token := Token(word)).is_function
+}
+for _token in INTERNED_TOKENS.values():
+    _token.freeze()
+KIND_LOCATED: int = (KIND_OPEN_PARENTHESIS | KIND_CLOSE_PARENTHESIS |
+                     KIND_OPEN_BRACKET | KIND_CLOSE_BRACKET |
+                     KIND_OPEN_CURLY_BRACKET | KIND_CLOSE_CURLY_BRACKET |
+                     KIND_COMMA | KIND_OPERATOR)
+AND_TOKEN: "Token" = INTERNED_TOKENS[Operator.AND.symbol]
+
+
+def at_offset(node: Union["Token", "Frozen"]) -> str:
+    # Where a node was found, for error messages.
+    return "" if node.start is None else f" at offset {node.start}"
+
+
+class Predicate(Frozen):
 
     root: "Token"
     operands: list[Union["Token", "Predicate"]]
@@ -119,6 +325,8 @@ class Predicate:
     def __init__(self, root: "Token"):
         self.root = root
         self.operands = []
+        if root.start is not None:
+            self.start, self.end = root.start, root.end
 
     def add_operand(self, stack: deque["Token"]) -> None:
         operand = Predicate.build(stack)
@@ -129,22 +337,76 @@ class Predicate:
         if len(self.operands) > 1:
             self.operands.reverse()
 
+    def widen(self, start: Optional[int], end: Optional[int]) -> None:
+        if start is None:
+            return
+        if self.start is None or start < self.start:
+            self.start = start
+        if self.end is None or self.end < end:
+            self.end = end
+
+    def locate(self) -> None:
+        # From the first to the last token of the predicate found in the
+        # selector, widened over enclosing parentheses while building.
+        for operand in self.operands:
+            self.widen(operand.start, operand.end)
+
+    def seal(self) -> Iterable["Frozen"]:
+        self.operands = tuple(self.operands)
+        self.root.freeze()
+        for operand in self.operands:
+            if isinstance(operand, Token):
+                operand.freeze()
+        super().seal()
+        return (o for o in self.operands if not isinstance(o, Token))
+
     @staticmethod
     def build(
-        stack: deque[Union["Token", "Selector"]]
+        stack: deque[Union["Token", "Selector"]],
+        groups: Optional[dict[int, tuple[int, int]]] = None,
     ) -> Optional[Union["Token", "Predicate", "Selector"]]:
+        # Builds the tree from the top of the postfix stack, operands last
+        # to first. An explicit stack of (predicate, operands left) replaces
+        # the recursion so thousands of chained terms don't overflow. Groups
+        # map the position in the stack of each parenthesized term's top to
+        # the offsets of its parentheses.
         if not stack:
             return None
-        top = stack.pop()
-        if isinstance(top, Selector) or not top.is_operator:
-            return top
-
-        p = Predicate(top)
-        if top.arity > 0:
-            for i in range(top.arity):
-                p.add_operand(stack)
-        p.reverse_operands()
-        return p
+        groups = groups or {}
+        pending: list[list[Union[Predicate, int]]] = []
+
+        while True:
+            node = span = None
+            if stack:
+                top = stack.pop()
+                span = groups.get(len(stack))
+                if isinstance(top, Selector) or not top.is_operator:
+                    node = top
+                elif top.arity > 0:
+                    pending.append([Predicate(top), top.arity])
+                    pending[-1][0].widen(*span or (None, None))
+                    continue
+                else:
+                    node = Predicate(top)
+                    node.widen(*span or (None, None))
+                    span = None
+
+            while pending:  # Attaches the built node to its parent.
+                frame = pending[-1]
+                parent = frame[0]
+                if node:
+                    parent.operands.append(node)
+                    parent.widen(*span or (None, None))  # A term's.
+                    span = None
+                frame[1] -= 1
+                if frame[1] > 0:
+                    break
+                pending.pop()
+                parent.reverse_operands()
+                parent.locate()
+                node = parent
+            else:
+                return node
 
     @property
     def as_dict(self) -> dict[str, Any]:
@@ -155,13 +417,15 @@ class Predicate:
         }
 
     def __str__(self) -> str:
-        return as_json(self.as_dict)
+        return EXPORT.to_json(self)
 
 
-class Range:
+class Range(Frozen):
     range_: tuple[int, int]
 
     def __init__(self, token: "Token"):
+        if token.start is not None:
+            self.start, self.end = token.start, token.end
         if Separator.RANGE in (word :=
                                token.word) and not word.startswith(MINUS_CHAR):
             start, end = (int(s) for s in word.split(Separator.RANGE))
@@ -180,26 +444,58 @@ class Range:
         return str(self.range_)
 
 
-class Function:
-    ...
+class Argument(NamedTuple):
+    name: str
+    optional: bool = False  # Has a default value.
+    variadic: bool = False  # Takes any number of values, e.g. *args.
+
+
+class Function(NamedTuple):
+    # A function callable from selectors as f:name. A pure function returns
+    # the same value for the same arguments and has no side effects, so its
+    # calls with literal arguments are evaluated once, when compiling.
+    name: str
+    fn: Callable[..., Any]
+    arguments: tuple["Argument", ...]
+    pure: bool = False
+    cache_size: int = 0  # Results kept per scope, see core.functions.
+
+    @property
+    def min_arity(self) -> int:
+        return sum(not a.optional and not a.variadic for a in self.arguments)
+
+    @property
+    def max_arity(self) -> Optional[int]:
+        if any(a.variadic for a in self.arguments):
+            return None
+        return len(self.arguments)
 
+    def accepts(self, count: int) -> bool:
+        return self.min_arity <= count and (self.max_arity is None or
+                                            count <= self.max_arity)
 
-class Argument:
-    ...
+    @property
+    def arity_text(self) -> str:
+        low, high = self.min_arity, self.max_arity
+        if high is None:
+            return f"at least {low}"
+        return str(low) if low == high else f"{low} to {high}"
 
 
-class Step:
+class Step(Frozen):
     ranges: Optional[list["Range"]] = None
     predicate: Optional["Predicate"] = None
     node: "Token"
 
     def __init__(self, node: "Token") -> None:
         self.node = node
+        if node.start is not None:
+            self.start, self.end = node.start, node.end
 
     def add_range(self, tokens: list["Token"], start: int, end: int) -> int:
         if self.ranges:
-            raise AssertionError(
-                f"A Predicate is already defined for step '{self.node}'.")
+            raise AssertionError(f"A Predicate is already defined for step "
+                                 f"'{self.node}'{at_offset(self.node)}.")
 
         if self.ranges is None:
             self.ranges = []
@@ -208,10 +504,12 @@ class Step:
         while i < end:
             token = tokens[i]
             i += 1
-            if token == Separator.CLOSE_BRACKET:
+            if token.kind & KIND_CLOSE_BRACKET:
                 break
             self.ranges.append(Range(token))
 
+        if i > start and (last := tokens[i - 1]).end is not None:
+            self.end = last.end  # The closing bracket, when found.
         return i
 
     def add_predicate(
@@ -220,97 +518,15 @@ class Step:
         start: int,
         end: int,
     ) -> int:
-        if self.ranges:
-            raise AssertionError(
-                f"A range is already defined for step '{self.node}'.")
-
-        def print_list(key, ls):
-            print(
-                as_json({
-                    key: [
-                        t.word if isinstance(t, Token) else t.as_dict
-                        for t in ls
-                    ]
-                }))
-
-        count: int = 0
-
-        def print_debug():
-            nonlocal count
-            count += 1
-            print(f"### {count} {'#' * 20}")
-            print_list("buffer", buffer)
-            print_list("operators", operators)
-
-        # Begins executing the Shunting Yard algorithm (for the most part).
-        buffer: deque[Token | Selector] = deque()
-        operators: deque[Token] = deque()
-        i = start
-
-        while i < end:
-            token = tokens[i]
-
-            if (token.isalnum and (i + 1) < end and
-                    tokens[i + 1] == Separator.DOT):
-                selector, i = parse_selector(tokens, i, end)
-                buffer.append(selector)
-                continue
-            else:
-                i += 1
-
-            if token == Separator.CLOSE_CURLY_BRACKET:  # Ends the predicate.
-                break
-            if token.is_function:  # Starts function declaration.
-                operators.append(token)
-            elif token.is_operator:
-                while (operators and (top := operators[-1]) and
-                       top.is_operator and not top.is_open_parenthesis and
-                       ((token.is_right_associative and
-                         token.precedence < top.precedence) or
-                        (not token.is_right_associative and
-                         token.precedence <= top.precedence))):
-                    buffer.append(operators.pop())
-                operators.append(token)
-            elif token == Separator.COMMA:  # Function argument operator.
-                while operators and not operators[-1].is_open_parenthesis:
-                    buffer.append(operators.pop())
-                if not operators or not operators[-1].is_open_parenthesis:
-                    raise ValueError(
-                        "Mismatched parentheses or misplaced comma.")
-            elif token.is_open_parenthesis:
-                operators.append(token)
-            elif token.is_close_parenthesis:
-                while operators:
-                    if operators[-1].is_open_parenthesis:
-                        break
-                    buffer.append(operators.pop())
-                else:
-                    raise ValueError("Mismatched parentheses.")
-                top = operators.pop()
-                if not top.is_open_parenthesis:
-                    raise ValueError(
-                        f"Expected open parenthesis but got {top} instead.")
-                if operators and operators[-1].is_function:
-                    buffer.append(operators.pop())
-            else:
-                buffer.append(token)
+        return parse_frames(PredicateFrame(self), tokens, start, end)
 
-        # Flushes remaining operators into buffer.
-        while operators:
-            top = operators.pop()
-            if top.is_open_parenthesis or top.is_close_parenthesis:
-                raise ValueError("Mismatched parentheses.")
-            buffer.append(top)
-        # Ends executing the Shunting Yard algorithm.
-
-        # Builds expression's abstract syntax tree.
-        # print_debug()
-        predicate = Predicate.build(buffer)
-        if isinstance(predicate, Token):
-            predicate = Predicate(predicate)
-        self.predicate = predicate
-
-        return i
+    def seal(self) -> Iterable["Frozen"]:
+        if self.ranges is not None:
+            self.ranges = tuple(self.ranges)
+        self.node.freeze()
+        super().seal()
+        return (*(self.ranges or ()),
+                *((self.predicate,) if self.predicate is not None else ()))
 
     @property
     def as_dict(self) -> dict[str, Any]:
@@ -329,7 +545,7 @@ class Step:
         return f"step{{{self.node}}}"
 
 
-class Selector:
+class Selector(Frozen):
     steps: list["Step"]
 
     def __init__(self) -> None:
@@ -338,6 +554,11 @@ class Selector:
     def add_step(self, step: "Step") -> None:
         self.steps.append(step)
 
+    def seal(self) -> Iterable["Frozen"]:
+        self.steps = tuple(self.steps)
+        super().seal()
+        return self.steps
+
     @property
     def as_dict(self) -> dict[str, Any]:
         return dict(selector=[s.as_dict for s in self.steps])
@@ -348,117 +569,116 @@ class Selector:
 
 def conjoin(trimmed_tokens: Iterable["Token"]) -> deque["Token"]:
     token_ls: deque[Token] = deque()
-    token: Token
-    previous: Token
+    previous: Optional[Token] = None
     nesting: deque[Token] = deque([Token(EMPTY)])
-    nest: Optional[Token]
-
-    def open_nesting():
-        nesting.append(previous if (
-            token.is_open_parenthesis and previous.is_function) else token)
-
-    def close_nesting():
-        if (token.is_close_parenthesis and not nest.is_function and
-                not nest.is_open_parenthesis) or (token.is_close_bracket and
-                                                  not nest.is_open_bracket):
-            raise ValueError(f"Mismatched nesting {nest} and {token}.")
-        if nest.is_function:
-            increment_function_arity()
-        nesting.pop()
-
-    def increment_function_arity():
-        if previous.is_open_parenthesis:
+
+    def increment_function_arity(nest: "Token") -> None:
+        if previous.kind & KIND_OPEN_PARENTHESIS:
             nest.arity = 0
         elif nest.arity != 0:
             nest.arity = max(nest.arity, 0) + 1
 
-    def is_previous_right_andable() -> bool:
-        return (not nest.is_open_bracket and previous and
-                not previous.is_right_andable and
-                (not previous.is_function or previous.arity == 0))
-
     for token in trimmed_tokens:
-        previous = token_ls[-1] if token_ls else None
-        if token.is_open_parenthesis or token.is_open_bracket:
-            open_nesting()
+        kind = token.kind
+        if kind & (KIND_OPEN_PARENTHESIS | KIND_OPEN_BRACKET):
+            nesting.append(previous if (
+                kind & KIND_OPEN_PARENTHESIS and previous is not None and
+                previous.kind & KIND_FUNCTION) else token)
         nest = nesting[-1]
 
-        if token == Separator.COMMA:
-            if nest.is_function:
+        if kind & KIND_COMMA:
+            if nest.kind & KIND_FUNCTION:
                 token_ls.append(token)
-                increment_function_arity()
+                increment_function_arity(nest)
+                previous = token
             continue
-        elif (not token.is_delimiter or token.is_open_parenthesis or
-              token.is_unary_operator):
-            if is_previous_right_andable():
-                # print(f"--> AND {token}")
-                token_ls.append(Token(Operator.AND.symbol))
-            token_ls.append(token)
-        else:
-            token_ls.append(token)
-
-        if token.is_close_parenthesis or token.is_close_bracket:
-            close_nesting()
+        if (not kind & KIND_DELIMITER or
+                kind & (KIND_OPEN_PARENTHESIS | KIND_UNARY)):
+            if (previous is not None and
+                    not nest.kind & KIND_OPEN_BRACKET and
+                    not previous.kind & KIND_NON_RIGHT_ANDABLE and
+                    (not previous.kind & KIND_FUNCTION or previous.arity == 0)):
+                token_ls.append(AND_TOKEN)
+        token_ls.append(token)
+
+        if kind & (KIND_CLOSE_PARENTHESIS | KIND_CLOSE_BRACKET):
+            opened_by = nest.kind
+            if (kind & KIND_CLOSE_PARENTHESIS and not opened_by &
+                (KIND_FUNCTION | KIND_OPEN_PARENTHESIS)) or (
+                    kind & KIND_CLOSE_BRACKET and
+                    not opened_by & KIND_OPEN_BRACKET):
+                raise ValueError(f"Mismatched nesting {nest}{at_offset(nest)}"
+                                 f" and {token}{at_offset(token)}.")
+            if opened_by & KIND_FUNCTION:
+                increment_function_arity(nest)
+            nesting.pop()
+        previous = token
 
     return token_ls
 
 
-def tokenize(selector: str) -> list["Token"]:
-    token_ls: deque[Token] = deque()
-    curr_token: deque[str] = deque()
-    start_phrase: Optional[str] = None
-    quote_count: int = 0  # Used to detect quote mismatches.
-
-    def flush_token(is_phrase: bool = False) -> None:
-        if curr_token:
-            token_ls.append(Token(EMPTY.join(curr_token), is_phrase))
-            curr_token.clear()
-
-    for char in selector:
-        if start_phrase and char != start_phrase:  # Builds quoted phrase.
-            curr_token.append(char)
-        elif char in QUOTE_CHARS:
-            if char == start_phrase:  # Closes current quoted phrase.
-                flush_token(is_phrase=True)
-                quote_count -= 1
-                start_phrase = None
-            else:  # Opens new quoted phrase.
-                quote_count += 1
-                start_phrase = char
-        elif char.isspace():
-            flush_token()
-            if token_ls and token_ls[-1].is_function:
-                token_ls[-1].arity = 0  # Handles zero-argument functions.
-        elif char in SEPARATOR_CHARS:
-            flush_token()
-            if (previous :=
-                (token_ls and token_ls[-1] or
-                 None)) and previous.is_compound_operator_with(char):
-                # Combines compound operators (e.g. "&&", "<=", "!=")
-                token_ls[-1] = Token(previous.word + char)
-            else:
-                token_ls.append(Token(char))
-        else:
-            curr_token.append(char)
+def scan(selector: str) -> Iterator["Token"]:
+    return scan_matches(TOKEN_PATTERN.finditer(selector))
+
+
+def scan_matches(matches: Iterable["re.Match"]) -> Iterator["Token"]:
+    # Tokens of TOKEN_PATTERN matches, e.g. of a part of a selector.
+    previous: Optional[Token] = None
+    interned = INTERNED_TOKENS
+    located = KIND_LOCATED
+
+    for match in matches:
+        kind = match.lastgroup
+        if kind == "blank":
+            if previous is not None and previous.kind & KIND_FUNCTION:
+                previous.arity = 0  # Handles zero-argument functions.
+            continue
+        if kind == "word" or kind == "separator" or kind == "fraction":
+            word = match.group()
+            if (previous := interned.get(word)) is None:
+                previous = Token(word, False, *match.span())
+            elif previous.kind & located:
+                previous = previous.at(*match.span())
+        elif kind == "open_quote":
+            raise ValueError(f"Mismatched quotes: {match.group()} at offset "
+                             f"{match.start()} is not closed.")
+        else:  # Quoted phrase, quotes included in its offsets.
+            previous = Token(match.group(kind), True, *match.span())
+        yield previous
+
 
-    flush_token()
+def tokenize(selector: str) -> list["Token"]:
+    return list(conjoin(scan(selector)))
 
-    if quote_count != 0:
-        raise ValueError(
-            f"Mismatched parentheses: {quote_count} are not closed.")
 
-    # print_ls("Before Norm", token_ls)
-    # print_ls("After Norm", token_ls)
-    return list(conjoin(token_ls))
+PARSE_CACHE: "LRUCache" = LRUCache(maxsize=1_024)
 
 
 def parse(query: str) -> "Selector":
+    return PARSE_CACHE.get_or_create(query, parse_uncached)
+
+
+def parse_uncached(query: str) -> "Selector":
     tokens = tokenize(query)
-    return parse_selector(
+    selector = parse_selector(
         tokens,
         0,
         len(tokens),
     )[0]
+    selector.freeze()  # Cached selectors are shared between callers.
+    return selector
+
+
+def cache_info() -> "CacheInfo":
+    return PARSE_CACHE.info()
+
+
+def cache_clear() -> None:
+    PARSE_CACHE.clear()
+
+
+def cache_resize(maxsize: int) -> None:
+    PARSE_CACHE.resize(maxsize)
 
 
 def parse_selector(
@@ -466,25 +686,277 @@ def parse_selector(
     start: int,
     end: int,
 ) -> tuple["Selector", int]:
-    selector = Selector()
-    step = None
+    frame = SelectorFrame()
+    return frame.selector, parse_frames(frame, tokens, start, end)
+
+
+# Selectors nest inside predicates and vice versa. Rather than recursing,
+# each one being parsed is a frame on an explicit stack: a frame advances
+# until it ends or opens a nested frame, and resumes once that one ends.
+
+
+class SelectorFrame:
+    __slots__ = ("selector", "step")
+
+    selector: "Selector"
+    step: Optional["Step"]
+
+    def __init__(self) -> None:
+        self.selector = Selector()
+        self.step = None
+
+    def advance(
+        self,
+        tokens: list["Token"],
+        i: int,
+        end: int,
+    ) -> tuple[int, Optional["PredicateFrame"]]:
+        while i < end:
+            token = tokens[i]
+            i += 1
+            # TODO(alonso): handle nodes declared as phrases.
+
+            if (kind := token.kind) & KIND_DOT:
+                continue
+            elif kind & (KIND_OPEN_CURLY_BRACKET | KIND_OPEN_BRACKET):
+                if self.step is None:
+                    raise ValueError(f"Missing node before '{token}'"
+                                     f"{at_offset(token)}.")
+                if kind & KIND_OPEN_BRACKET:
+                    i = self.step.add_range(tokens, i, end)
+                else:
+                    return i, PredicateFrame(self.step)
+            elif not kind & KIND_ALNUM:
+                i -= 1
+                break
+            else:
+                self.step = Step(token)
+                self.selector.add_step(self.step)
+
+        # Implied operators, e.g. AND, are words too, found nowhere.
+        if located := [s for s in self.selector.steps if s.start is not None]:
+            self.selector.start = located[0].start
+            self.selector.end = located[-1].end
+        return i, None
+
+    def resume(self, frame: "PredicateFrame") -> None:
+        pass  # The predicate frame already set its step's predicate.
+
+
+class PredicateFrame:
+    __slots__ = ("step", "buffer", "operators", "opened", "groups")
+
+    step: "Step"
+    buffer: deque[Union["Token", "Selector"]]
+    operators: deque["Token"]
+    opened: list[int]  # Length of the buffer at each open parenthesis.
+    groups: dict[int, tuple[int, int]]  # See Predicate.build.
+
+    def __init__(self, step: "Step") -> None:
+        if step.ranges:
+            raise AssertionError(f"A range is already defined for step "
+                                 f"'{step.node}'{at_offset(step.node)}.")
+        self.step = step
+        # Begins executing the Shunting Yard algorithm (for the most part).
+        self.buffer = deque()
+        self.operators = deque()
+        self.opened = []
+        self.groups = {}
+
+    def advance(
+        self,
+        tokens: list["Token"],
+        i: int,
+        end: int,
+    ) -> tuple[int, Optional["SelectorFrame"]]:
+        buffer, operators = self.buffer, self.operators
+
+        while i < end:
+            token = tokens[i]
+            kind = token.kind
+
+            if (kind & KIND_ALNUM and (i + 1) < end and
+                    tokens[i + 1].kind & KIND_DOT):
+                return i, SelectorFrame()  # Nested selector.
+            i += 1
+
+            if kind & KIND_CLOSE_CURLY_BRACKET:  # Ends the predicate.
+                self.step.end = token.end
+                break
+            if kind & KIND_FUNCTION:  # Starts function declaration.
+                operators.append(token)
+            elif kind & KIND_OPERATOR:
+                precedence = token.precedence
+                if kind & KIND_RIGHT_ASSOCIATIVE:
+                    while (operators and operators[-1].kind & KIND_OPERATOR
+                           and precedence < operators[-1].precedence):
+                        buffer.append(operators.pop())
+                else:
+                    while (operators and operators[-1].kind & KIND_OPERATOR
+                           and precedence <= operators[-1].precedence):
+                        buffer.append(operators.pop())
+                operators.append(token)
+            elif kind & KIND_COMMA:  # Function argument operator.
+                while operators and not operators[-1].is_open_parenthesis:
+                    buffer.append(operators.pop())
+                if not operators or not operators[-1].is_open_parenthesis:
+                    raise ValueError(f"Mismatched parentheses or misplaced "
+                                     f"comma{at_offset(token)}.")
+            elif kind & KIND_OPEN_PARENTHESIS:
+                operators.append(token)
+                self.opened.append(len(buffer))
+            elif kind & KIND_CLOSE_PARENTHESIS:
+                while operators:
+                    if operators[-1].is_open_parenthesis:
+                        break
+                    buffer.append(operators.pop())
+                else:
+                    raise ValueError(
+                        f"Mismatched parentheses{at_offset(token)}.")
+                top = operators.pop()
+                if not top.is_open_parenthesis:
+                    raise ValueError(f"Expected open parenthesis but got "
+                                     f"{top}{at_offset(top)} instead.")
+                if operators and operators[-1].is_function:
+                    # Calls end with their closing parenthesis, as functions
+                    # are never interned nor shared.
+                    function = operators.pop()
+                    if function.end is not None:
+                        function.end = token.end
+                    buffer.append(function)
+                elif len(buffer) > self.opened[-1]:
+                    # Outer parentheses come later, over the inner ones.
+                    self.groups[len(buffer) - 1] = (top.start, token.end)
+                self.opened.pop()
+            else:
+                buffer.append(token)
+
+        self.finish()
+        return i, None
+
+    def resume(self, frame: "SelectorFrame") -> None:
+        self.buffer.append(frame.selector)
+
+    def finish(self) -> None:
+        buffer, operators = self.buffer, self.operators
+        # Flushes remaining operators into buffer.
+        while operators:
+            top = operators.pop()
+            if top.is_open_parenthesis or top.is_close_parenthesis:
+                raise ValueError(f"Mismatched parentheses{at_offset(top)}.")
+            buffer.append(top)
+        # Ends executing the Shunting Yard algorithm.
+
+        # Builds expression's abstract syntax tree.
+        span = self.groups.get(len(buffer) - 1)
+        predicate = Predicate.build(buffer, self.groups)
+        if isinstance(predicate, Token):
+            predicate = Predicate(predicate)
+        if isinstance(predicate, Predicate) and span is not None:
+            predicate.widen(*span)
+        self.step.predicate = predicate
+        step = self.step
+        if (predicate is not None and predicate.end is not None and
+                (step.end is None or step.end < predicate.end)):
+            step.end = predicate.end  # Up to the end, when not closed.
+
+
+def parse_frames(
+    frame: Union["SelectorFrame", "PredicateFrame"],
+    tokens: list["Token"],
+    start: int,
+    end: int,
+) -> int:
+    frames = [frame]
     i = start
-    while i < end:
-        token = tokens[i]
-        i += 1
-        # TODO(alonso): handle nodes declared as phrases.
+    while frames:
+        i, nested = frames[-1].advance(tokens, i, end)
+        if nested is not None:
+            frames.append(nested)
+            continue
+        done = frames.pop()
+        if frames:
+            frames[-1].resume(done)
+    return i
+
+
+Node = Union["Token", "Predicate", "Selector"]
+
+
+def transform(
+    selector: "Selector",
+    rebuild_predicate: Callable[["Predicate", list["Node"]], "Node"],
+) -> "Selector":
+    # Rebuilds the tree bottom-up, handing each predicate its already rebuilt
+    # operands. Iterative, so it copes with any depth; the result is frozen.
+    pending: list[tuple[Union["Node", "Step"], bool]] = [(selector, False)]
+    built: list[Union["Node", "Step"]] = []
+
+    while pending:
+        node, visited = pending.pop()
+        if isinstance(node, Token):
+            built.append(node)
+            continue
+
+        if isinstance(node, Selector):
+            children = node.steps
+        elif isinstance(node, Step):
+            children = () if node.predicate is None else (node.predicate,)
+        else:
+            children = node.operands
 
-        if token == Separator.DOT:
+        if not visited:
+            pending.append((node, True))
+            pending.extend((c, False) for c in reversed(children))
             continue
-        elif token == Separator.OPEN_CURLY_BRACKET:
-            i = step.add_predicate(tokens, i, end)
-        elif token == Separator.OPEN_BRACKET:
-            i = step.add_range(tokens, i, end)
-        elif not token.isalnum:
-            i -= 1
-            break
+
+        rebuilt = built[len(built) - len(children):]
+        del built[len(built) - len(children):]
+        if isinstance(node, Selector):
+            new = Selector()
+            new.steps = rebuilt
+            new.start, new.end = node.start, node.end
+        elif isinstance(node, Step):
+            new = Step(node.node)
+            new.end = node.end
+            if node.ranges is not None:
+                new.ranges = list(node.ranges)
+            if rebuilt:
+                new.predicate = rebuilt[0]
+                if isinstance(new.predicate, Token):  # As parsed: "a{b}".
+                    new.predicate = Predicate(new.predicate)
+        else:
+            new = rebuild_predicate(node, rebuilt)
+        built.append(new)
+
+    result = built.pop()
+    result.freeze()
+    return result
+
+
+def flatten_predicate(
+    predicate: "Predicate",
+    operands: list["Node"],
+) -> "Predicate":
+    flat = Predicate(predicate.root)
+    flat.start, flat.end = predicate.start, predicate.end
+    if (group := ASSOCIATIVE_GROUPS.get(predicate.root.operator)) is None:
+        flat.operands = operands
+        return flat
+
+    for operand in operands:
+        if (isinstance(operand, Predicate) and
+                ASSOCIATIVE_GROUPS.get(operand.root.operator) is group):
+            if flat.operands:
+                flat.operands.extend(operand.operands)
+            else:  # Left-deep chains: takes over the child's fresh list.
+                flat.operands = operand.operands
         else:
-            step = Step(token)
-            selector.add_step(step)
+            flat.operands.append(operand)
+    return flat
+
 
-    return selector, i
+def flatten(selector: "Selector") -> "Selector":
+    # Folds chains of AND/&&, OR/|| and XOR/^ into single n-ary predicates,
+    # e.g. {"AND": [{"AND": [a, b]}, c]} becomes {"AND": [a, b, c]}.
+    return transform(selector, flatten_predicate)
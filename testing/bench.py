@@ -0,0 +1,911 @@
+import asyncio
+from functools import partial
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from typing import Any
+from typing import Callable
+
+from core.asynchronous import compile_async
+from core.columnar import compile_columnar
+from core.columnar import np
+from core.columnar import to_columns
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.events import iter_select_document
+from core.export import to_json
+from core.export import write_json
+from core.functions import FunctionRegistry
+from core.incremental import parse_state
+from core.incremental import PARSE_ERRORS
+from core.incremental import reparse
+from core.index import DocumentIndex
+from core.mapped import MappedDocument
+from core.optimizer import explain
+from core.precompile import dump as dump_library
+from core.precompile import loads as load_library
+from core.parallel import select_many
+from core.queryset import QuerySet
+from core.zonquery import parse
+from core.zonquery import parse_uncached
+from core.zonquery import PARSE_CACHE
+from core.zonquery import scan
+from core.zonquery import tokenize
+from testing.interpreter import interpret
+from testing.legacy import legacy_scan
+from testing.legacy import legacy_tokenize
+from testing.testing import import_times
+from testing.testing import TestingData
+from tests.data import TEST_DATA
+
+EVALUATION_QUERY: str = """
+insurance {
+    amount <= 8_000 type == "MH"
+    (this.plans{ name = "Dental Care" } OR status = "Active Coverage")
+}.benefits [1 2-9 15-20 33]
+"""
+
+PLAN_NAMES: tuple[str, ...] = ("Dental Care", "Vision", "Medical", "Pharmacy")
+STATUSES: tuple[str, ...] = ("Active Coverage", "Inactive", "Pending")
+
+
+def make_record(rng: random.Random) -> dict[str, Any]:
+    return {
+        "insurance": [{
+            "amount": rng.randrange(0, 16_000),
+            "type": rng.choice(("MH", "PPO", "HMO")),
+            "status": rng.choice(STATUSES),
+            "plans": [{
+                "name": rng.choice(PLAN_NAMES)
+            } for _ in range(rng.randrange(0, 4))],
+            "benefits": list(range(rng.randrange(0, 40))),
+        } for _ in range(rng.randrange(1, 4))]
+    }
+
+
+def make_records(count: int, seed: int = 0) -> list[dict[str, Any]]:
+    rng = random.Random(seed)
+    return [make_record(rng) for _ in range(count)]
+
+
+# Values given to the fields of generated nodes, so that the predicates of
+# tests/data.py selectors both match and fail.
+FIELD_VALUES: tuple[Any, ...] = (0, 1, 3, 5, 777, "A", "A c d", "MH", "x")
+
+
+class AnyFunctions(dict):
+    # Binds every f: name to a function counting its arguments.
+    def __missing__(self, name):
+        return lambda *arguments: len(arguments)
+
+    def get(self, name, default=None):
+        return self[name]
+
+
+def selector_words(selector: str) -> list[str]:
+    return sorted(
+        {t.word for t in tokenize(selector) if t.isalnum and t.is_identifier})
+
+
+def make_selector_document(
+    selector: str,
+    count: int,
+    seed: int = 0,
+) -> dict[str, Any]:
+    # Every identifier of the selector becomes a field, one level of nesting
+    # deep, under the first step, so that each of its predicates is run.
+    rng = random.Random(seed)
+    words = selector_words(selector)
+
+    def make_node(depth: int) -> dict[str, Any]:
+        node = {}
+        for word in words:
+            if depth and rng.random() < 0.3:
+                node[word] = [make_node(depth - 1) for _ in range(2)]
+            else:
+                node[word] = rng.choice(FIELD_VALUES)
+        return node
+
+    first = tokenize(selector)[0].word
+    return {first: [make_node(1) for _ in range(count)]}
+
+
+def timed(fn: Callable[[], Any], reps: int) -> float:
+    return min(timeit.repeat(fn, number=1, repeat=reps))
+
+
+def report(label: str, seconds: float, count: int) -> None:
+    print(f"{label:<32} {seconds * 1_000:>10,.1f} ms"
+          f" {count / seconds:>14,.0f} records/s")
+
+
+def bench_compiled_vs_naive(count: int = 20_000, reps: int = 5) -> None:
+    print("─── Compiled engine vs naive tree-walking interpreter ───")
+    records = make_records(count)
+    selector = parse(EVALUATION_QUERY)
+    query = compile(selector)
+
+    def naive():
+        for record in records:
+            interpret(selector, record)
+
+    def compiled():
+        for record in records:
+            query.select(record)
+
+    naive_time = timed(naive, reps)
+    compiled_time = timed(compiled, reps)
+    report("naive interpreter", naive_time, count)
+    report("compiled query", compiled_time, count)
+    print(f"Speedup: {naive_time / compiled_time:.2f}x")
+
+
+def bench_parse_cache(rounds: int = 100) -> None:
+    print("─── Parse cache ───")
+    selectors = [TestingData(d).selector for d in TEST_DATA]
+    PARSE_CACHE.clear()
+
+    def uncached():
+        for selector in selectors:
+            parse_uncached(selector)
+
+    def cached():
+        for selector in selectors:
+            parse(selector)
+
+    for label, fn in (("parse_uncached", uncached), ("parse (cached)", cached)):
+        per_call = timeit.timeit(fn, number=rounds) / (rounds *
+                                                        len(selectors))
+        print(f"{label:<32} {per_call * 1_000_000:>10,.2f} µs/call")
+    print(PARSE_CACHE.info())
+
+
+def corpus_selectors(scale: int = 1) -> list[str]:
+    return [
+        "\n".join([TestingData(d).selector] * scale) for d in TEST_DATA
+    ]
+
+
+def bench_tokenizer(scale: int = 100, reps: int = 5) -> None:
+    print(f"─── Tokenizer on tests/data.py selectors scaled {scale}x ───")
+    selectors = corpus_selectors(scale)
+    size = sum(len(s) for s in selectors)
+
+    def tokenize_all(fn):
+        return lambda: [list(fn(s)) for s in selectors]
+
+    for phase, legacy_fn, fn in (
+        ("scan", legacy_scan, scan),
+        ("scan + conjoin", legacy_tokenize, tokenize),
+    ):
+        legacy_time = timed(tokenize_all(legacy_fn), reps)
+        scanner_time = timed(tokenize_all(fn), reps)
+        for label, seconds in (
+            (f"{phase}: per-character loop", legacy_time),
+            (f"{phase}: master pattern", scanner_time),
+        ):
+            print(f"{label:<36} {seconds * 1_000:>10,.1f} ms"
+                  f" {size / seconds / 1_000_000:>10,.2f} MB/s")
+        print(f"Speedup: {legacy_time / scanner_time:.2f}x")
+
+
+def bench_tokens(scale: int = 100, reps: int = 5) -> None:
+    print(f"─── Tokens of tests/data.py selectors scaled {scale}x ───")
+    selectors = corpus_selectors(scale)
+
+    tracemalloc.start()
+    tokens = [tokenize(s) for s in selectors]
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = sum(len(t) for t in tokens)
+    distinct = len({id(t) for ls in tokens for t in ls})
+    del tokens
+
+    seconds = timed(lambda: [tokenize(s) for s in selectors], reps)
+    print(f"{count:,} tokens, {distinct:,} distinct objects")
+    print(f"retained: {retained / 1_024:>10,.1f} KiB"
+          f" ({retained / count:,.1f} B/token)")
+    print(f"peak:     {peak / 1_024:>10,.1f} KiB")
+    print(f"time:     {seconds * 1_000:>10,.1f} ms"
+          f" ({seconds / count * 1_000_000_000:,.0f} ns/token)")
+
+
+def write_ndjson_files(
+    directory: str,
+    files: int,
+    records_per_file: int,
+) -> list[str]:
+    paths = []
+    for i in range(files):
+        path = os.path.join(directory, f"records-{i}.ndjson")
+        with open(path, "w", encoding="utf-8") as f:
+            for record in make_records(records_per_file, seed=i):
+                f.write(json.dumps(record) + "\n")
+        paths.append(path)
+    return paths
+
+
+def bench_parallel(files: int = 8, records_per_file: int = 25_000) -> None:
+    print(f"─── select_many over {files} files x {records_per_file:,} records"
+          f" ({os.cpu_count()} CPUs available) ───")
+    count = files * records_per_file
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_ndjson_files(directory, files, records_per_file)
+        partition_size = sum(os.path.getsize(p) for p in paths) // (files * 4)
+        baseline = None
+        for workers in (1, 2, 4, 8):
+            start = time.perf_counter()
+            for _ in select_many(EVALUATION_QUERY, paths, workers=workers,
+                                 ordered=False, partition_size=partition_size):
+                pass
+            seconds = time.perf_counter() - start
+            baseline = baseline or seconds
+            report(f"{workers} worker(s)", seconds, count)
+            print(f"{'':<32} scaling {baseline / seconds:>6.2f}x")
+
+
+def bench_flatten(terms: int = 300, count: int = 2_000, reps: int = 5) -> None:
+    print(f"─── {terms}-term conjunction, binary vs flattened ───")
+    query = f"n{{ {' '.join(f'a{i}' for i in range(terms))} }}"
+    document = {"n": [{f"a{i}": 1 for i in range(terms)}] * count}
+    times = []
+    for flatten in (False, True):
+        compiled = compile(query, flatten=flatten)
+        times.append(timed(partial(compiled.select, document), reps))
+        report("flattened" if flatten else "binary tree", times[-1], count)
+    print(f"Speedup: {times[0] / times[1]:.2f}x")
+
+
+OPTIMIZER_QUERIES: tuple[str, ...] = (
+    'insurance{ this.plans{ name = "Vision" } && type = "MH" &&'
+    ' type = "MH" }',
+    'insurance{ !!(8_000 >= amount) AND NOT NOT type = "MH" AND'
+    ' this.plans.name = "Dental Care" }',
+    'insurance{ this.plans{ name = "Medical" } || status = "Inactive" ||'
+    ' status = "Inactive" }',
+)
+
+
+def bench_optimizer(count: int = 2_000, reps: int = 5) -> None:
+    print("─── Predicate optimizer on tests/data.py selectors ───")
+    functions = AnyFunctions()
+    baseline_total = optimized_total = 0.0
+    for index, data in enumerate(TEST_DATA):
+        selector = TestingData(data).selector
+        document = make_selector_document(selector, count, seed=index)
+        baseline = compile(selector, functions)
+        optimized = compile(selector, functions, optimize=True)
+        baseline_time = timed(partial(baseline.select, document), reps)
+        optimized_time = timed(partial(optimized.select, document), reps)
+        baseline_total += baseline_time
+        optimized_total += optimized_time
+        label = " ".join(selector.split())[:40]
+        print(f"{label:<42} {baseline_time * 1_000:>8,.2f} ms"
+              f" {optimized_time * 1_000:>8,.2f} ms"
+              f" {baseline_time / optimized_time:>6.2f}x")
+    print(f"Total speedup: {baseline_total / optimized_total:.2f}x")
+
+    print("─── Predicate optimizer on generated records ───")
+    records = make_records(count * 10)
+    for query in OPTIMIZER_QUERIES:
+        baseline = compile(query)
+        optimized = compile(query, optimize=True)
+        baseline_time = timed(
+            lambda q=baseline: [q.select(r) for r in records], reps)
+        optimized_time = timed(
+            lambda q=optimized: [q.select(r) for r in records], reps)
+        print(explain(parse(query)).split("Rewrites:\n")[1])
+        report("flattened", baseline_time, len(records))
+        report("optimized", optimized_time, len(records))
+        print(f"Speedup: {baseline_time / optimized_time:.2f}x")
+
+
+RANGE_QUERIES: tuple[str, ...] = (
+    "a[1 2-9 15-20 33]",
+    "a[0, -1]",
+    "a[0-999999]",
+    "a[100-200000 150000-600000 -10 -1]",
+)
+
+
+def select_by_index_test(
+    value: list[Any],
+    ranges: tuple[tuple[int, int], ...],
+) -> list[Any]:
+    # The previous range path: every element tested against every range.
+    size = len(value)
+
+    def in_ranges(index: int) -> bool:
+        for start, end in ranges:
+            if start < 0:
+                start += size
+            if end < 0:
+                end += size
+            if start <= index <= end:
+                return True
+        return False
+
+    return [v for i, v in enumerate(value) if in_ranges(i)]
+
+
+def bench_ranges(size: int = 1_000_000, reps: int = 5) -> None:
+    print(f"─── Ranges over a {size:,}-element array ───")
+    document = {"a": list(range(size))}
+    for query in RANGE_QUERIES:
+        ranges = tuple(r.range_ for r in parse(query).steps[0].ranges)
+        compiled = compile(query)
+        baseline_time = timed(
+            partial(select_by_index_test, document["a"], ranges), reps)
+        sliced_time = timed(partial(compiled.select, document), reps)
+        print(f"{query:<40} {baseline_time * 1_000:>9,.2f} ms"
+              f" {sliced_time * 1_000:>9,.3f} ms"
+              f" {baseline_time / sliced_time:>10,.0f}x")
+
+
+INDEX_TEMPLATES: tuple[str, ...] = (
+    "insurance.plans.name",
+    "insurance.benefits[{n}-{m}]",
+    'insurance.plans{{ name = "{plan}" }}',
+    'insurance{{ status = "{status}" }}.amount',
+    "insurance{{ amount > {amount} }}.plans.name",
+)
+
+
+def index_queries(template: str, count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        template.format(
+            n=(n := rng.randrange(0, 20)),
+            m=n + rng.randrange(0, 5),
+            plan=rng.choice(PLAN_NAMES),
+            status=rng.choice(STATUSES),
+            amount=rng.randrange(0, 16_000),
+        ) for _ in range(count)
+    ]
+
+
+def bench_index(
+    records: int = 20_000,
+    queries: int = 60,
+    reps: int = 3,
+) -> None:
+    document = {
+        "insurance": [
+            item for record in make_records(records)
+            for item in record["insurance"]
+        ]
+    }
+    size = len(json.dumps(document))
+    print(f"─── {queries} selectors over one {size / 1_000_000:,.1f} MB"
+          " document ───")
+    build_time = timed(partial(DocumentIndex, document), reps)
+    index = DocumentIndex(document)
+    print(f"{'index build':<44} {build_time * 1_000:>8,.1f} ms")
+
+    separate_total = indexed_total = 0.0
+    per_template = queries // len(INDEX_TEMPLATES)
+    for template in INDEX_TEMPLATES:
+        selectors = index_queries(template, per_template)
+        compiled = [compile(q) for q in selectors]
+        separate_time = timed(lambda c=compiled: [q.select(document)
+                                                  for q in c], reps)
+        indexed_time = timed(lambda c=compiled: [index.select(q)
+                                                 for q in c], reps)
+        separate_total += separate_time
+        indexed_total += indexed_time
+        print(f"{per_template} x {selectors[0]:<38}"
+              f" {separate_time * 1_000:>8,.1f} ms"
+              f" {indexed_time * 1_000:>8,.1f} ms"
+              f" {separate_time / indexed_time:>6.2f}x")
+
+    info = index.info()
+    print(f"Speedup, index build included:"
+          f" {separate_total / (build_time + indexed_total):.2f}x")
+    print(f"{info.paths} paths, {info.references:,} references,"
+          f" {info.nbytes / 1_024:,.1f} KiB")
+
+
+# Our enrichment selectors filter insurance items by a handful of
+# conditions, then pick different fields of the matches.
+QUERYSET_FILTERS: tuple[str, ...] = tuple(
+    f'insurance{{ type = "{t}" status = "{s}" }}'
+    for t in ("MH", "PPO", "HMO") for s in STATUSES)
+QUERYSET_TAILS: tuple[str, ...] = (
+    ".amount",
+    ".plans.name",
+    '.plans{{ name = "{plan}" }}',
+    ".benefits[{n}]",
+    ".benefits[{n}-{m}]",
+)
+
+
+def queryset_queries(count: int, seed: int = 0) -> list[str]:
+    rng = random.Random(seed)
+    return [
+        rng.choice(QUERYSET_FILTERS) + rng.choice(QUERYSET_TAILS).format(
+            plan=rng.choice(PLAN_NAMES),
+            n=(n := rng.randrange(0, 40)),
+            m=n + rng.randrange(0, 10),
+        ) for _ in range(count)
+    ]
+
+
+def bench_queryset(records: int = 2_000, reps: int = 3) -> None:
+    print(f"─── QuerySet vs one compiled query at a time, {records:,}"
+          " records ───")
+    documents = make_records(records)
+    for count in (1, 10, 50, 100, 250, 500):
+        queries = queryset_queries(count)
+        compiled = [compile(q) for q in queries]
+        query_set = QuerySet(queries)
+
+        def separately(compiled=compiled):
+            for document in documents:
+                for query in compiled:
+                    query.select(document)
+
+        def together(query_set=query_set):
+            for document in documents:
+                query_set.evaluate(document)
+
+        separate_time = timed(separately, reps)
+        together_time = timed(together, reps)
+        info = query_set.info()
+        print(f"{count:>4} queries, {info.evaluated_steps:>4}/{info.steps:<4}"
+              f" steps {separate_time * 1_000:>10,.1f} ms"
+              f" {together_time * 1_000:>10,.1f} ms"
+              f" {separate_time / together_time:>6.2f}x")
+
+
+def make_flat_record(rng: random.Random) -> dict[str, Any]:
+    record = {
+        "amount": rng.randrange(0, 16_000),
+        "type": rng.choice(("MH", "PPO", "HMO")),
+        "status": rng.choice(STATUSES),
+        "plans": rng.randrange(0, 4),
+        "rate": rng.random(),
+    }
+    if rng.random() < 0.1:  # Sparse fields leave MISSING in their column.
+        record["note"] = rng.choice(FIELD_VALUES)
+    return record
+
+
+def make_flat_records(count: int, seed: int = 0) -> list[dict[str, Any]]:
+    rng = random.Random(seed)
+    return [make_flat_record(rng) for _ in range(count)]
+
+
+COLUMNAR_QUERIES: tuple[str, ...] = (
+    "records{ amount > 8_000 }",
+    'records{ type = "MH" amount <= 8_000 }',
+    'records{ type = "MH" OR status = "Pending" OR plans >= 3 }',
+    'records{ NOT (type = "PPO") XOR rate < 0.5 }',
+    "records{ (amount > 1_000 && amount < 2_000) || rate > 0.99 }",
+    "records{ note > 2 || note = \"A\" }",
+    "records{ plans > note }",
+    "records{ plans }",
+)
+
+
+def bench_columnar(count: int = 1_000_000, reps: int = 3) -> None:
+    print(f"─── Columnar masks vs record by record, {count:,} records ───")
+    records = make_flat_records(count)
+    document = {"records": records}
+    lists = to_columns(records)
+    arrays = to_columns(records, arrays=True) if np is not None else None
+    if arrays is None:
+        print("NumPy is not installed, only the list fallback is timed.")
+    for query in COLUMNAR_QUERIES:
+        compiled = compile(query)
+        columnar = compile_columnar(query)
+        record_time = timed(lambda: compiled.select(document), reps)
+        list_time = timed(lambda: columnar.mask(lists), reps)
+        line = (f"{query[:48]:<48} {record_time * 1_000:>9,.1f} ms"
+                f" {list_time * 1_000:>9,.1f} ms"
+                f" {record_time / list_time:>6.2f}x")
+        if arrays is not None:
+            array_time = timed(lambda: columnar.mask(arrays), reps)
+            line += (f" {array_time * 1_000:>9,.1f} ms"
+                     f" {record_time / array_time:>7.2f}x")
+        print(line)
+
+
+MAPPED_QUERIES: tuple[str, ...] = (
+    "meta.version",
+    "insurance.benefits[0-9]",
+    "records.insurance{ amount > 15_000 }.plans.name",
+    "records.insurance.amount",
+)
+
+
+def traced(fn: Callable[[], Any]) -> tuple[float, int]:
+    # Seconds of an untraced run, then the peak memory of a traced one.
+    seconds = timed(fn, 1)
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return seconds, peak
+
+
+def bench_mapped(records: int = 100_000) -> None:
+    document = {
+        "meta": {"version": 3},
+        "records": make_records(records),
+        "insurance": {"benefits": list(range(1_000))},
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "document.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(document, f)
+        del document
+        size = os.path.getsize(path)
+        print(f"─── Memory-mapped selection vs json.load, {size / 1e6:,.0f} MB"
+              " document ───")
+        for query in MAPPED_QUERIES:
+            compiled = compile(query)
+
+            def loaded(compiled=compiled):
+                with open(path, "rb") as f:
+                    return compiled.select(json.load(f))
+
+            def mapped(compiled=compiled):
+                with MappedDocument(path) as document:
+                    return document.select(compiled)
+
+            load_time, load_peak = traced(loaded)
+            map_time, map_peak = traced(mapped)
+            print(f"{query[:40]:<40} {load_time * 1_000:>9,.0f} ms"
+                  f" {load_peak / 1e6:>7,.1f} MB"
+                  f" {map_time * 1_000:>9,.0f} ms {map_peak / 1e6:>7,.1f} MB")
+
+
+EVENT_QUERIES: tuple[str, ...] = (
+    "this[0-9].insurance.amount",
+    'this.insurance{ amount > 15_000 && type = "MH" }.plans.name',
+    "this.insurance.benefits[0]",
+)
+
+
+def bench_events(records: int = 100_000) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "records.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(make_records(records), f)
+        size = os.path.getsize(path)
+        print(f"─── Event-based selection vs json.load, {size / 1e6:,.0f} MB"
+              " array ───")
+        for query in EVENT_QUERIES:
+            compiled = compile(query)
+
+            def loaded(compiled=compiled):
+                with open(path, "rb") as f:
+                    return compiled.select(json.load(f))
+
+            def streamed(compiled=compiled):
+                with open(path, "rb") as f:
+                    return list(iter_select_document(compiled, f))
+
+            load_time, load_peak = traced(loaded)
+            stream_time, stream_peak = traced(streamed)
+            print(f"{query[:40]:<40} {load_time * 1_000:>9,.0f} ms"
+                  f" {load_peak / 1e6:>7,.1f} MB"
+                  f" {stream_time * 1_000:>9,.0f} ms"
+                  f" {stream_peak / 1e6:>7,.1f} MB")
+
+
+def library_sources(count: int) -> list[str]:
+    # Distinct selectors drawn from the test corpus and generated queries.
+    rng = random.Random(0)
+    pool = [*corpus_selectors(), *queryset_queries(count)]
+    return [f"{rng.choice(pool).strip()}.n{i}" for i in range(count)]
+
+
+COLD_START_PARSE: str = """
+import sys
+from core.zonquery import parse
+with open(sys.argv[1], encoding="utf-8") as f:
+    for source in f.read().split("\\0"):
+        parse(source)
+"""
+COLD_START_LOAD: str = """
+import sys
+from core.precompile import warm_cache
+warm_cache(sys.argv[1], resize=True)
+"""
+
+
+def bench_precompile(count: int = 2_000, reps: int = 5) -> None:
+    print(f"─── Parsing vs loading {count:,} precompiled selectors ───")
+    sources = library_sources(count)
+    with tempfile.TemporaryDirectory() as directory:
+        text_path = os.path.join(directory, "selectors.txt")
+        with open(text_path, "w", encoding="utf-8") as f:
+            f.write("\0".join(sources))
+        library_path = os.path.join(directory, "selectors.zqb")
+        dump_library(sources, library_path)
+        with open(library_path, "rb") as f:
+            data = f.read()
+        print(f"sources: {os.path.getsize(text_path):>10,} bytes")
+        print(f"library: {len(data):>10,} bytes")
+
+        parse_time = timed(lambda: [parse_uncached(s) for s in sources], reps)
+        load_time = timed(lambda: load_library(data), reps)
+        print(f"{'parse':<32} {parse_time * 1_000:>10,.1f} ms")
+        print(f"{'load':<32} {load_time * 1_000:>10,.1f} ms"
+              f" {parse_time / load_time:>6.2f}x")
+
+        def cold_start(code: str, path: str) -> float:
+            return timed(
+                lambda: subprocess.run([sys.executable, "-c", code, path],
+                                       check=True), reps)
+
+        baseline = cold_start("import core.zonquery", text_path)
+        cold_parse = cold_start(COLD_START_PARSE, text_path)
+        cold_load = cold_start(COLD_START_LOAD, library_path)
+        print(f"{'cold start, imports only':<32} {baseline * 1_000:>10,.1f} ms")
+        print(f"{'cold start, parse':<32} {cold_parse * 1_000:>10,.1f} ms")
+        print(f"{'cold start, precompiled':<32} {cold_load * 1_000:>10,.1f} ms"
+              f" {(cold_parse - baseline) / (cold_load - baseline):>6.2f}x"
+              " past imports")
+
+
+def bench_to_json(count: int = 2_000, reps: int = 5) -> None:
+    print(f"─── JSON export of {count:,} selectors ───")
+    selectors = [parse_uncached(s) for s in library_sources(count)]
+
+    def streamed() -> None:
+        for selector in selectors:
+            chunks: list[str] = []
+            write_json(selector, chunks.append)
+            "".join(chunks)
+
+    def dumped() -> None:
+        for selector in selectors:
+            json.dumps(selector.as_dict,
+                       default=str,
+                       ensure_ascii=False,
+                       separators=(",", ":"))
+
+    baseline = timed(dumped, reps)
+    stream_time = timed(streamed, reps)
+    [to_json(s) for s in selectors]  # pylint: disable=expression-not-assigned
+    memo_time = timed(lambda: [to_json(s) for s in selectors], reps)
+    print(f"{'json.dumps(as_dict)':<32} {baseline * 1_000:>10,.1f} ms")
+    for label, seconds in (("write_json", stream_time),
+                           ("to_json, memoized", memo_time)):
+        print(f"{label:<32} {seconds * 1_000:>10,.1f} ms"
+              f" {baseline / seconds:>8.1f}x")
+
+
+FUNCTION_QUERY: str = """
+insurance{ amount > f:threshold("MH", 2) && type = f:upper("mh") }.benefits
+"""
+
+
+def threshold(kind: str, factor: int) -> int:
+    return {"MH": 4_000, "PPO": 6_000}.get(kind, 8_000) * factor
+
+
+def bench_functions(count: int = 20_000, reps: int = 5) -> None:
+    print("─── Function calls with literal arguments, folded when pure ───")
+    records = make_records(count)
+    functions = {"threshold": threshold, "upper": str.upper}
+    registry = FunctionRegistry()
+    for name, fn in functions.items():
+        registry.register(fn, name=name, pure=True)
+
+    results = []
+    for label, bound in (("dict, called per record", functions),
+                         ("registry, pure", registry)):
+        select = compile(FUNCTION_QUERY, bound).select
+        seconds = timed(lambda: [select(r) for r in records], reps)
+        results.append([select(r) for r in records])
+        report(label, seconds, count)
+    assert results[0] == results[1]
+
+
+CACHED_FUNCTION_QUERY: str = """
+insurance{
+    f:coverage(status, type) > 50 || this.plans{ f:coverage(name, "plan") > 50 }
+}.benefits
+"""
+
+
+def coverage(name: str, kind: str) -> int:
+    # Stands for a costly lookup, e.g. in a reference table.
+    return sum(ord(c) * i for i, c in enumerate(name * 20 + kind)) % 100
+
+
+def bench_function_cache(count: int = 20_000, reps: int = 5) -> None:
+    print("─── Function results cached per document and per batch ───")
+    records = make_records(count)
+    results = []
+    for label, scope, size in (("uncached", "document", 0),
+                               ("cached per document", "document", 64),
+                               ("cached per batch", "batch", 64)):
+        registry = FunctionRegistry(cache_scope=scope)
+        registry.register(coverage, cache=size)
+        select = compile(CACHED_FUNCTION_QUERY, registry).select
+
+        def run(select=select, registry=registry):
+            with registry.cache.batch():
+                return [select(r) for r in records]
+
+        seconds = timed(run, reps)
+        results.append(run())
+        report(label, seconds, count)
+        if size:
+            print(registry.cache.report())
+    assert results[0] == results[1] == results[2]
+
+
+ASYNC_QUERY: str = """
+insurance{ amount > f:threshold(type, 2) || status = "Active Coverage" }.amount
+"""
+
+
+async def lookup_threshold(kind: str, factor: int) -> int:
+    await asyncio.sleep(0.001)  # Stands for a round trip to a local store.
+    return threshold(kind, factor)
+
+
+def bench_async(count: int = 1_000, reps: int = 3) -> None:
+    print("─── Async evaluation, f:threshold awaiting 1 ms per call ───")
+    records = make_records(count)
+    compiled = compile(ASYNC_QUERY, {"threshold": threshold})
+    expected = [compiled.select(r) for r in records]
+    for label, limit in (("one call at a time", 1), ("limit 16", 16),
+                         ("limit 256", 256), ("unlimited", None)):
+        compiled = compile_async(ASYNC_QUERY,
+                                 {"threshold": lookup_threshold},
+                                 limit=limit)
+        if limit == 1:  # Sequential: a single pass is enough.
+            start = time.perf_counter()
+            results = asyncio.run(compiled.select_many(records))
+            seconds = time.perf_counter() - start
+        else:
+            seconds = timed(
+                lambda c=compiled: asyncio.run(c.select_many(records)), reps)
+            results = asyncio.run(compiled.select_many(records))
+        assert results == expected
+        report(label, seconds, count)
+
+    print("Without coroutine functions:")
+    select = compile(ASYNC_QUERY, {"threshold": threshold}).select
+    async_query = compile_async(ASYNC_QUERY, {"threshold": threshold})
+    report("compiled", timed(lambda: [select(r) for r in records], reps),
+           count)
+    report("async", timed(lambda: asyncio.run(async_query.select_many(
+        records)), reps), count)
+
+
+EDITED_STEP: str = (
+    'insurance{i}{{ amount <= 8_000 type == "MH" (this.plans{{ name = "Dental'
+    ' Care" }} OR status = "Active Coverage") }}.benefits[1 2-9 15-20 33]')
+
+
+def edited_selector(size: int) -> str:
+    # Many top-level steps, each with a predicate, as a long path.
+    steps: list[str] = []
+    while sum(len(s) + 1 for s in steps) < size:
+        steps.append(EDITED_STEP.format(i=len(steps)))
+    return ".".join(steps)
+
+
+def parse_each(texts: list[str]) -> None:
+    for text in texts:
+        try:
+            parse_uncached(text)
+        except PARSE_ERRORS:
+            pass
+
+
+def reparse_each(state: Any, edits: list[tuple[int, int, str]]) -> Any:
+    for offset, removed, inserted in edits:
+        state = reparse(state, offset, removed, inserted)
+        state.error  # Parsed, as parse() would.
+    return state
+
+
+def bench_incremental(size: int = 5_120, edits: int = 1_000) -> None:
+    print("─── Incremental parsing, a character per edit ───")
+    rng = random.Random(0)
+    # A single step is parsed again whole: a shorter one keeps it brief.
+    predicate = " && ".join(f"a{i} > {i}" for i in range(size // 40))
+    for label, text in (("path of steps", edited_selector(size)),
+                        ("single predicate", "n{ " + predicate + " }")):
+        typed = [text[:i + 1] for i in range(len(text))]
+        typing = [(i, 0, c) for i, c in enumerate(text)]
+        full = timed(lambda t=typed: parse_each(t), 1)
+        incremental = timed(lambda e=typing: reparse_each(parse_state(""), e),
+                            1)
+        state = reparse_each(parse_state(""), typing)
+        assert to_json(state.selector) == to_json(parse_uncached(text))
+        print(f"{label}, {len(text):,} characters typed:")
+        print(f"  {'parse':<30} {full * 1_000:>10,.1f} ms")
+        print(f"  {'reparse':<30} {incremental * 1_000:>10,.1f} ms"
+              f" {full / incremental:>6.1f}x")
+
+        # Random characters inserted or deleted, then undone, anywhere.
+        changes, texts, current = [], [], text
+        for _ in range(edits // 2):
+            offset = rng.randrange(len(current))
+            if rng.random() < 0.5:
+                removed = current[offset]
+                changes += ((offset, 1, ""), (offset, 0, removed))
+                texts += (current[:offset] + current[offset + 1:], current)
+            else:
+                char = rng.choice("a1 .{}'")
+                changes += ((offset, 0, char), (offset, 1, ""))
+                texts += (current[:offset] + char + current[offset:], current)
+        start = parse_state(text)
+        full = timed(lambda t=texts: parse_each(t), 1)
+        incremental = timed(lambda c=changes, s=start: reparse_each(s, c), 1)
+        print(f"{label}, {len(changes):,} edits anywhere:")
+        print(f"  {'parse':<30} {full * 1_000:>10,.1f} ms")
+        print(f"  {'reparse':<30} {incremental * 1_000:>10,.1f} ms"
+              f" {full / incremental:>6.1f}x")
+
+
+IMPORTED_MODULES: tuple[str, ...] = (
+    "core.symbols",
+    "core.zonquery",
+    "core.engine",
+    "core.stream",
+    "core.precompile",
+    "json",
+    "orjson",
+    "rich.console",
+    "numpy",
+)
+
+
+def bench_imports(runs: int = 9) -> None:
+    print(f"─── Import time, median of {runs} fresh interpreters ───")
+    for module in IMPORTED_MODULES:
+        try:
+            times = [import_times(module)[module] for _ in range(runs)]
+        except subprocess.CalledProcessError:
+            print(f"{module:<32} {'not installed':>13}")
+            continue
+        print(f"{module:<32} {statistics.median(times) / 1_000:>10,.1f} ms")
+
+
+BENCHMARKS: dict[str, Callable[[], None]] = {
+    "compiled_vs_naive": bench_compiled_vs_naive,
+    "parse_cache": bench_parse_cache,
+    "tokenizer": bench_tokenizer,
+    "tokens": bench_tokens,
+    "parallel": bench_parallel,
+    "flatten": bench_flatten,
+    "optimizer": bench_optimizer,
+    "ranges": bench_ranges,
+    "index": bench_index,
+    "queryset": bench_queryset,
+    "columnar": bench_columnar,
+    "mapped": bench_mapped,
+    "events": bench_events,
+    "precompile": bench_precompile,
+    "to_json": bench_to_json,
+    "imports": bench_imports,
+    "functions": bench_functions,
+    "function_cache": bench_function_cache,
+    "async": bench_async,
+    "incremental": bench_incremental,
+}
+
+
+def main(names: list[str]) -> None:
+    for name in names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
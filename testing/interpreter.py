@@ -0,0 +1,137 @@
+from typing import Any
+from typing import Optional
+from typing import Union
+
+from core.engine import compare
+from core.engine import Functions
+from core.engine import MISSING
+from core.symbols import COMPARATORS
+from core.symbols import CONJUNCTION_OPERATORS
+from core.symbols import DISJUNCTION_OPERATORS
+from core.symbols import EXCLUSIVE_DISJUNCTION_OPERATORS
+from core.symbols import FLOAT_PATTERN
+from core.symbols import FUNCTION_PREFIX
+from core.symbols import INTEGER_PATTERN
+from core.symbols import NEGATION_OPERATORS
+from core.symbols import Operator
+from core.symbols import THIS
+from core.zonquery import Predicate
+from core.zonquery import Selector
+from core.zonquery import Step
+from core.zonquery import Token
+
+# Naive tree-walking interpreter: re-dispatches on every AST node and
+# re-parses every literal per evaluation. It is the reference semantics
+# and the baseline the compiled engine is benchmarked against.
+
+
+def interpret(
+    selector: "Selector",
+    document: Any,
+    functions: Optional["Functions"] = None,
+) -> list[Any]:
+    return select_nodes(selector, [document],
+                        {} if functions is None else functions)
+
+
+def select_nodes(
+    selector: "Selector",
+    nodes: list[Any],
+    functions: "Functions",
+) -> list[Any]:
+    for step in selector.steps:
+        nodes = apply_step(step, nodes, functions)
+    return nodes
+
+
+def apply_step(
+    step: "Step",
+    nodes: list[Any],
+    functions: "Functions",
+) -> list[Any]:
+    selected = []
+    for node in nodes:
+        if step.node.word == THIS:
+            value = node
+        elif isinstance(node, dict) and step.node.word in node:
+            value = node[step.node.word]
+        else:
+            continue
+
+        if step.ranges:
+            if not isinstance(value, list):
+                continue
+            size = len(value)
+            items = [
+                v for i, v in enumerate(value)
+                if any(
+                    resolve(start, size) <= i <= resolve(end, size)
+                    for start, end in (r.range_ for r in step.ranges))
+            ]
+        else:
+            items = value if isinstance(value, list) else [value]
+
+        if step.predicate:
+            items = [
+                v for v in items if evaluate(step.predicate, v, functions)
+            ]
+        selected.extend(items)
+    return selected
+
+
+def resolve(index: int, size: int) -> int:
+    return index + size if index < 0 else index
+
+
+def evaluate(
+    node: Union["Token", "Predicate", "Selector"],
+    context: Any,
+    functions: "Functions",
+) -> Any:
+    if isinstance(node, Selector):
+        return select_nodes(node, [context], functions)
+    if isinstance(node, Token):
+        if node.is_phrase:
+            return node.word
+        if INTEGER_PATTERN.fullmatch(node.word):
+            return int(node.word)
+        if FLOAT_PATTERN.fullmatch(node.word):
+            return float(node.word)
+        if node.word == THIS:
+            return context
+        if isinstance(context, dict):
+            return context.get(node.word, MISSING)
+        return MISSING
+
+    root = node.root
+    if not root.is_operator:
+        return evaluate(root, context, functions)
+    op = root.operator
+
+    if op is Operator.FUNCTION:
+        args = []
+        for operand in node.operands:
+            value = evaluate(operand, context, functions)
+            args.append(None if value is MISSING else value)
+        return functions[root.word[len(FUNCTION_PREFIX):]](*args)
+
+    if op in NEGATION_OPERATORS:
+        return not evaluate(node.operands[0], context, functions)
+    if op in CONJUNCTION_OPERATORS:
+        return all(
+            evaluate(o, context, functions) for o in node.operands)
+    if op in DISJUNCTION_OPERATORS:
+        return any(
+            evaluate(o, context, functions) for o in node.operands)
+    if op in EXCLUSIVE_DISJUNCTION_OPERATORS:
+        return sum(
+            bool(evaluate(o, context, functions))
+            for o in node.operands) % 2 == 1
+
+    left, right = node.operands
+    lvs = evaluate(left, context, functions)
+    rvs = evaluate(right, context, functions)
+    lvs = lvs if isinstance(left, Selector) else [lvs]
+    rvs = rvs if isinstance(right, Selector) else [rvs]
+    return any(
+        compare(COMPARATORS[op], lv, rv) for lv in lvs for rv in rvs)
@@ -0,0 +1,62 @@
+from collections import deque
+from typing import Optional
+
+from core.symbols import EMPTY
+from core.symbols import QUOTE_CHARS
+from core.symbols import SEPARATOR_CHARS
+from core.zonquery import conjoin
+from core.zonquery import Token
+
+# Character-by-character tokenizer replaced by core.zonquery.scan(). Kept as
+# the baseline for benchmarks and as a reference for tokenizer parity tests.
+
+
+def legacy_tokenize(selector: str) -> list["Token"]:
+    return list(conjoin(legacy_scan(selector)))
+
+
+def legacy_scan(selector: str) -> deque["Token"]:
+    token_ls: deque[Token] = deque()
+    curr_token: deque[str] = deque()
+    start_phrase: Optional[str] = None
+    quote_count: int = 0  # Used to detect quote mismatches.
+
+    def flush_token(is_phrase: bool = False) -> None:
+        if curr_token:
+            token_ls.append(Token(EMPTY.join(curr_token), is_phrase))
+            curr_token.clear()
+
+    for char in selector:
+        if start_phrase and char != start_phrase:  # Builds quoted phrase.
+            curr_token.append(char)
+        elif char in QUOTE_CHARS:
+            if char == start_phrase:  # Closes current quoted phrase.
+                flush_token(is_phrase=True)
+                quote_count -= 1
+                start_phrase = None
+            else:  # Opens new quoted phrase.
+                quote_count += 1
+                start_phrase = char
+        elif char.isspace():
+            flush_token()
+            if token_ls and token_ls[-1].is_function:
+                token_ls[-1].arity = 0  # Handles zero-argument functions.
+        elif char in SEPARATOR_CHARS:
+            flush_token()
+            if (previous :=
+                (token_ls and token_ls[-1] or
+                 None)) and previous.is_compound_operator_with(char):
+                # Combines compound operators (e.g. "&&", "<=", "!=")
+                token_ls[-1] = Token(previous.word + char)
+            else:
+                token_ls.append(Token(char))
+        else:
+            curr_token.append(char)
+
+    flush_token()
+
+    if quote_count != 0:
+        raise ValueError(
+            f"Mismatched parentheses: {quote_count} are not closed.")
+
+    return token_ls
@@ -0,0 +1,319 @@
+from contextlib import contextmanager
+import datetime
+import json
+import math
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Any
+from typing import Callable
+from typing import Iterator
+from typing import NamedTuple
+from typing import Optional
+
+from core.zonquery import conjoin
+from core.zonquery import parse_selector
+from core.zonquery import parse_uncached
+from core.zonquery import Predicate
+from core.zonquery import scan
+from core.zonquery import tokenize
+from testing.testing import ROOT
+from testing.testing import TestingData
+from tests.data import TEST_DATA
+
+# Parsing, phase by phase. Each phase is timed on the output of the previous
+# ones, prepared afresh for every run: conjoin sets the arity of function
+# tokens, which must not carry over. The predicate build runs within
+# parse_selector and is timed apart, on its calls.
+PHASES: tuple[str, ...] = (
+    "scan",
+    "conjoin",
+    "parse_selector",
+    "predicate_build",
+    "freeze",
+    "parse_uncached",
+)
+OPERATORS: tuple[str, ...] = ("&&", "||", "AND", "OR", "^")
+COMPARISONS: tuple[str, ...] = (">", "<=", "=", "!=")
+
+Workload = list[str]
+
+
+class Stats(NamedTuple):
+    runs: int
+    median: float  # Seconds, as every field below but runs.
+    p95: float
+    mean: float
+    variance: float  # Seconds squared.
+    minimum: float
+
+
+def summarize(samples: list[float]) -> "Stats":
+    ordered = sorted(samples)
+    p95 = ordered[max(0, math.ceil(0.95 * len(ordered)) - 1)]
+    variance = statistics.variance(ordered) if len(ordered) > 1 else 0.0
+    return Stats(len(ordered), statistics.median(ordered), p95,
+                 statistics.fmean(ordered), variance, ordered[0])
+
+
+def sample(
+    fn: Callable[[Any], Any],
+    setup: Callable[[], Any],
+    runs: int,
+    budget: float,
+) -> list[float]:
+    # Times fn(setup()) up to runs times, stopping early past the budget in
+    # seconds once 5 samples are taken. The setup is not timed.
+    samples: list[float] = []
+    deadline = time.perf_counter() + budget
+    while len(samples) < runs and (len(samples) < 5 or
+                                   time.perf_counter() < deadline):
+        argument = setup()
+        start = time.perf_counter()
+        fn(argument)
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+@contextmanager
+def timed_calls(samples: list[float]) -> Iterator[None]:
+    # Appends the duration of every Predicate.build call made meanwhile.
+    build = Predicate.__dict__["build"]
+    fn = build.__func__
+
+    def timed_build(stack):
+        start = time.perf_counter()
+        try:
+            return fn(stack)
+        finally:
+            samples.append(time.perf_counter() - start)
+
+    Predicate.build = staticmethod(timed_build)
+    try:
+        yield
+    finally:
+        Predicate.build = build
+
+
+def scanned(selectors: "Workload") -> Callable[[], list[list[Any]]]:
+    return lambda: [list(scan(s)) for s in selectors]
+
+
+def tokenized(selectors: "Workload") -> Callable[[], list[list[Any]]]:
+    return lambda: [tokenize(s) for s in selectors]
+
+
+def parsed(selectors: "Workload") -> Callable[[], list[Any]]:
+    return lambda: [
+        parse_selector(t, 0, len(t))[0] for t in tokenized(selectors)()
+    ]
+
+
+def nothing() -> None:
+    return None
+
+
+def time_phases(
+    selectors: "Workload",
+    runs: int,
+    budget: float,
+) -> dict[str, "Stats"]:
+    results = {}
+    for phase, fn, setup in (
+        ("scan", lambda _: [list(scan(s)) for s in selectors], nothing),
+        ("conjoin", lambda ts: [conjoin(t) for t in ts], scanned(selectors)),
+        ("parse_selector", lambda ts: [parse_selector(t, 0, len(t))
+                                       for t in ts], tokenized(selectors)),
+        ("freeze", lambda ss: [s.freeze() for s in ss], parsed(selectors)),
+        ("parse_uncached", lambda _: [parse_uncached(s) for s in selectors],
+         nothing),
+    ):
+        results[phase] = summarize(sample(fn, setup, runs, budget))
+
+    # Per run, the total of the build calls, timed on their own.
+    builds: list[float] = []
+
+    def build_time(tokens: list[list[Any]]) -> None:
+        calls: list[float] = []
+        with timed_calls(calls):
+            for t in tokens:
+                parse_selector(t, 0, len(t))
+        builds.append(sum(calls))
+
+    sample(build_time, tokenized(selectors), runs, budget)
+    results["predicate_build"] = summarize(builds)
+    return {phase: results[phase] for phase in PHASES}
+
+
+def peak_memory(selectors: "Workload") -> tuple[int, int]:
+    # Peak and retained bytes of parsing the workload.
+    tracemalloc.start()
+    selectors_parsed = [parse_uncached(s) for s in selectors]
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del selectors_parsed
+    return peak, retained
+
+
+def corpus() -> "Workload":
+    return [TestingData(d).selector for d in TEST_DATA]
+
+
+def chained_selector(terms: int) -> str:
+    # Comparisons chained by mixed logical operators.
+    clauses = [
+        f"a{i} {COMPARISONS[i % len(COMPARISONS)]} {i}" for i in range(terms)
+    ]
+    text = clauses[0]
+    for i, clause in enumerate(clauses[1:]):
+        text += f" {OPERATORS[i % len(OPERATORS)]} {clause}"
+    return f"n{{ {text} }}.m[1 2-9]"
+
+
+def nested_parentheses(depth: int) -> str:
+    return ("n{ " + "(" * depth + "a0" +
+            "".join(f" {OPERATORS[i % len(OPERATORS)]} a{i})"
+                    for i in range(1, depth + 1)) + " }")
+
+
+def nested_selectors(depth: int) -> str:
+    return f"n{'{ this.x' * depth}{' }' * depth}.y"
+
+
+SCALES: dict[str, tuple[Callable[[int], str], tuple[int, ...]]] = {
+    "terms": (chained_selector, (10, 100, 1_000, 10_000)),
+    "parentheses": (nested_parentheses, (1, 10, 100, 1_000)),
+    "selectors": (nested_selectors, (1, 10, 100, 1_000)),
+}
+QUICK_SCALES: dict[str, tuple[int, ...]] = {
+    "terms": (10, 100, 1_000),
+    "parentheses": (1, 10, 100),
+    "selectors": (1, 10, 100),
+}
+
+
+def growth(sizes: list[int], seconds: list[float]) -> list[Optional[float]]:
+    # Exponent k of time ~ size^k between consecutive points: 1 is linear,
+    # 2 quadratic.
+    exponents: list[Optional[float]] = [None]
+    for i in range(1, len(sizes)):
+        exponents.append(
+            math.log(seconds[i] / seconds[i - 1]) /
+            math.log(sizes[i] / sizes[i - 1]))
+    return exponents
+
+
+def print_stats(label: str, stats: "Stats") -> None:
+    print(f"{label:<28} {stats.median * 1e6:>11,.1f}"
+          f" {stats.p95 * 1e6:>11,.1f}"
+          f" {math.sqrt(stats.variance) * 1e6:>10,.1f} {stats.runs:>5}")
+
+
+def print_header(title: str) -> None:
+    print(f"─── {title} ───")
+    print(f"{'':<28} {'median µs':>11} {'p95 µs':>11} {'stdev µs':>10}"
+          f" {'runs':>5}")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"],
+                              capture_output=True,
+                              check=True,
+                              cwd=ROOT,
+                              text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(quick: bool = False) -> dict[str, Any]:
+    runs, budget = (20, 0.5) if quick else (100, 2.0)
+    results: dict[str, Any] = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "quick": quick,
+        },
+        "timings": {},
+        "memory": {},
+        "growth": {},
+    }
+    timings, memory = results["timings"], results["memory"]
+
+    selectors = corpus()
+    print_header(f"Phases, tests/data.py corpus of {len(selectors)} "
+                 "selectors")
+    for phase, stats in time_phases(selectors, runs, budget).items():
+        print_stats(phase, stats)
+        timings[f"corpus/{phase}"] = stats._asdict()
+    peak, retained = peak_memory(selectors)
+    memory["corpus"] = dict(peak=peak, retained=retained)
+    print(f"{'memory, peak':<28} {peak / 1_024:>11,.1f} KiB")
+    print(f"{'memory, retained':<28} {retained / 1_024:>11,.1f} KiB")
+
+    for scale, (generate, sizes) in SCALES.items():
+        sizes = QUICK_SCALES[scale] if quick else sizes
+        print_header(f"Scaling over {scale}")
+        medians: dict[str, list[float]] = {phase: [] for phase in PHASES}
+        for size in sizes:
+            workload = [generate(size)]
+            for phase, stats in time_phases(workload, runs, budget).items():
+                print_stats(f"{size:>6,} {phase}", stats)
+                timings[f"{scale}/{size}/{phase}"] = stats._asdict()
+                medians[phase].append(stats.median)
+            peak, retained = peak_memory(workload)
+            memory[f"{scale}/{size}"] = dict(peak=peak, retained=retained)
+            print(f"{size:>6,} {'memory, peak':<21} {peak / 1_024:>11,.1f}"
+                  " KiB")
+        for phase, seconds in medians.items():
+            exponents = growth(list(sizes), seconds)
+            results["growth"][f"{scale}/{phase}"] = exponents
+            print(f"{'growth ' + phase:<28} " + " ".join(
+                "     -" if k is None else f"{k:>6.2f}" for k in exponents))
+    return results
+
+
+def compare(previous: dict[str, Any], current: dict[str, Any]) -> None:
+    # Ratios of the medians, above 1 when slower than the previous run.
+    print(f"─── Against {previous['meta'].get('commit') or 'previous run'} "
+          "───")
+    for name, stats in current["timings"].items():
+        if (before := previous["timings"].get(name)) is None:
+            continue
+        ratio = stats["median"] / before["median"]
+        print(f"{name:<40} {before['median'] * 1e6:>11,.1f}"
+              f" {stats['median'] * 1e6:>11,.1f} {ratio:>6.2f}x")
+
+
+def main(argv: Optional[list[str]] = None) -> None:
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="python -m testing.suite",
+        description="Times parsing phase by phase, on the tests/data.py "
+        "corpus and on generated selectors of growing size and depth.")
+    parser.add_argument("--json", help="writes the results to this file")
+    parser.add_argument("--compare",
+                        help="results of a previous run to compare with")
+    parser.add_argument("--quick",
+                        action="store_true",
+                        help="fewer runs and smaller selectors")
+    args = parser.parse_args(argv)
+
+    results = run(args.quick)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(json.load(f), results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results: {args.json}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
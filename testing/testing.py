@@ -1,11 +1,14 @@
-import timeit
+import os
+import subprocess
+import sys
 from typing import Any
 from typing import Optional
 import unittest
 
 from core.lib import as_json
 from core.lib import json
-from core.zonquery import parse
+
+ROOT: str = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
 
 class TestingData:
@@ -74,13 +77,19 @@ class TestingJsonTestCase(unittest.TestCase):
         self.fail(msg)
 
 
-def benchmark(data: "TestingData", reps: int = 10_000):
-    # data = TestingData(TEST_DATA[selector - 1])
-    print("─── Selector ───")
-    print(f"⌦{data.selector}⌫")
-
-    def fn():
-        parse(data.selector)
-
-    run_time = timeit.timeit(fn, number=reps)
-    print(f"Average run time: {(run_time / reps ) * 1_000_000:,.0f} µs")
+def import_times(module: str) -> dict[str, int]:
+    # Cumulative import time, in µs, of every module a fresh interpreter
+    # imports along with module, as reported by python -X importtime.
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        check=True,
+        cwd=ROOT,
+        text=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:"):
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative)
+    return times
@@ -0,0 +1,137 @@
+import asyncio
+import unittest
+
+from core.asynchronous import compile_async
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.functions import FunctionRegistry
+from testing.bench import make_records
+
+LEVELS = {"MH": 4_000, "PPO": 6_000}
+
+QUERIES = (
+    "insurance{ amount > f:level(type) }.amount",
+    "insurance{ amount > f:level(type) && status = \"Active Coverage\" }",
+    "insurance{ f:level(type) = 4_000 || this.plans{ f:upper(name) ="
+    " \"VISION\" } }.benefits[1 2-9 -1]",
+    "insurance{ !(f:level(type) < amount) ^ f:upper(status) = \"PENDING\""
+    " ^ type = \"HMO\" }.plans.name",
+    "insurance.plans{ f:upper(name) = f:upper(\"dental care\") }.name",
+)
+
+
+async def level(kind):
+    await asyncio.sleep(0)
+    return LEVELS.get(kind, 8_000)
+
+
+async def upper(text):
+    await asyncio.sleep(0)
+    return None if text is None else text.upper()
+
+
+class Tracker:
+    # A coroutine function recording its calls and the most in flight.
+
+    def __init__(self, result=True):
+        self.result = result
+        self.calls = []
+        self.running = self.most = 0
+
+    async def __call__(self, value):
+        self.calls.append(value)
+        self.running += 1
+        self.most = max(self.most, self.running)
+        await asyncio.sleep(0.001)
+        self.running -= 1
+        return self.result
+
+
+class TestAsyncQuery(unittest.IsolatedAsyncioTestCase):
+
+    async def test_matches_synchronous_engine(self):
+        synchronous = {
+            "level": lambda kind: LEVELS.get(kind, 8_000),
+            "upper": lambda text: None if text is None else text.upper(),
+        }
+        asynchronous = {"level": level, "upper": upper}
+        records = make_records(200)
+        for query in QUERIES:
+            with self.subTest(query=query):
+                compiled = compile(query, synchronous)
+                awaited = compile_async(query, asynchronous)
+                self.assertEqual([compiled.select(r) for r in records],
+                                 await awaited.select_many(records))
+
+    async def test_short_circuit(self):
+        for query, called in (("n{ f:first(a) && f:second(b) }", False),
+                              ("n{ f:first(a) || f:second(b) }", True)):
+            with self.subTest(query=query):
+                first, second = Tracker(called), Tracker()
+                compiled = compile_async(query, {
+                    "first": first,
+                    "second": second
+                })
+                document = {"n": [{"a": 1, "b": 2}, {"a": 3, "b": 4}]}
+                self.assertEqual(document["n"] if called else [],
+                                 await compiled.select(document))
+                self.assertEqual([1, 3], first.calls)
+                self.assertEqual([], second.calls)
+
+    async def test_concurrency_limit(self):
+        document = {"n": [{"a": i} for i in range(20)]}
+        for limit, most in ((None, 20), (3, 3), (1, 1)):
+            with self.subTest(limit=limit):
+                tracker = Tracker()
+                compiled = compile_async("n{ f:check(a) }.a",
+                                         {"check": tracker},
+                                         limit=limit)
+                self.assertEqual(list(range(20)),
+                                 await compiled.select(document))
+                self.assertEqual(most, tracker.most)
+        with self.assertRaises(ValueError):
+            compile_async("n{ f:check(a) }", {"check": tracker}, limit=0)
+
+    async def test_arguments_run_concurrently(self):
+        tracker = Tracker()
+        compiled = compile_async("n{ f:both(f:check(a), f:check(b)) }", {
+            "check": tracker,
+            "both": lambda a, b: a and b,
+        })
+        document = {"n": [{"a": 1, "b": 2}]}
+        self.assertEqual(document["n"], await compiled.select(document))
+        self.assertEqual(2, tracker.most)
+
+    async def test_cached_calls_are_shared(self):
+        tracker = Tracker()
+        registry = FunctionRegistry()
+        registry.register(tracker, name="check", cache=8)
+        compiled = compile_async("n{ f:check(a) }.a", registry)
+        document = {"n": [{"a": i % 3} for i in range(12)]}
+        self.assertEqual([i % 3 for i in range(12)],
+                         await compiled.select(document))
+        self.assertEqual([0, 1, 2], sorted(tracker.calls))
+        self.assertEqual(9, registry.cache.info()["check"].hits)
+
+    async def test_synchronous_functions(self):
+        compiled = compile_async("n{ f:size(tags) = 2 }.name", {"size": len})
+        document = {"n": [{"name": "ada", "tags": [1, 2]}, {"tags": []}]}
+        self.assertEqual(["ada"], await compiled.select(document))
+        self.assertFalse(await compiled.matches({"n": document["n"][1:]}))
+
+    async def test_failed_calls_are_not_cached(self):
+        calls = []
+        registry = FunctionRegistry(cache_scope="batch")
+
+        @registry.register(cache=8)
+        async def flaky(value):
+            calls.append(value)
+            if len(calls) == 1:
+                raise ConnectionError("unavailable")
+            return True
+
+        compiled = compile_async("n{ f:flaky(a) }.a", registry)
+        with self.assertRaises(ConnectionError):
+            await compiled.select({"n": {"a": 1}})
+        self.assertEqual([1], await compiled.select({"n": {"a": 1}}))
+        self.assertEqual([1], await compiled.select({"n": {"a": 1}}))
+        self.assertEqual([1, 1], calls)
@@ -0,0 +1,90 @@
+from concurrent.futures import ThreadPoolExecutor
+import unittest
+
+from core.cache import CacheInfo
+from core.cache import LRUCache
+from core.zonquery import cache_clear
+from core.zonquery import cache_info
+from core.zonquery import parse
+from core.zonquery import PARSE_CACHE
+from core.zonquery import parse_uncached
+from core.zonquery import Step
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_hits_misses_and_evictions(self):
+        cache = LRUCache(maxsize=2)
+        for key in ("a", "b", "a", "c", "b"):
+            cache.get_or_create(key, str.upper)
+        # "b" was the least recently used when "c" was inserted.
+        self.assertEqual(CacheInfo(hits=1, misses=4, evictions=2, maxsize=2,
+                                   currsize=2), cache.info())
+        self.assertIn("b", cache)
+        self.assertNotIn("a", cache)
+
+    def test_resize_evicts(self):
+        cache = LRUCache(maxsize=3)
+        for key in "abc":
+            cache.get_or_create(key, str.upper)
+        cache.resize(1)
+        self.assertEqual(1, len(cache))
+        self.assertIn("c", cache)
+
+    def test_zero_size_disables_caching(self):
+        cache = LRUCache(maxsize=0)
+        cache.get_or_create("a", str.upper)
+        cache.get_or_create("a", str.upper)
+        self.assertEqual(0, len(cache))
+        self.assertEqual(2, cache.info().misses)
+
+    def test_clear(self):
+        cache = LRUCache()
+        cache.get_or_create("a", str.upper)
+        cache.clear()
+        self.assertEqual(CacheInfo(0, 0, 0, 1_024, 0), cache.info())
+
+    def test_concurrent_callers_share_values(self):
+        cache = LRUCache(maxsize=8)
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            values = list(
+                executor.map(lambda _: cache.get_or_create("k", list),
+                             range(200)))
+        self.assertTrue(all(v is values[0] for v in values))
+        info = cache.info()
+        self.assertEqual(200, info.hits + info.misses)
+
+
+class TestParseCache(unittest.TestCase):
+
+    def setUp(self):
+        cache_clear()
+
+    def tearDown(self):
+        PARSE_CACHE.resize(1_024)
+
+    def test_parse_is_cached(self):
+        query = "a{ b = 3 }.c[1-2]"
+        self.assertIs(parse(query), parse(query))
+        self.assertEqual(1, cache_info().hits)
+        self.assertEqual(1, cache_info().misses)
+        self.assertEqual(parse_uncached(query).as_dict, parse(query).as_dict)
+
+    def test_cached_selectors_are_immutable(self):
+        selector = parse("a{ b = 3 }.c[1-2]")
+        with self.assertRaises(AttributeError):
+            selector.add_step(Step(selector.steps[0].node))
+        with self.assertRaises(AttributeError):
+            selector.steps[0].predicate = None
+        with self.assertRaises(AttributeError):
+            selector.steps[0].predicate.operands.append(None)
+        with self.assertRaises(AttributeError):
+            selector.steps[1].ranges[0].range_ = (0, 0)
+        with self.assertRaises(AttributeError):
+            selector.steps[0].predicate.operands[0].word = "zzz"
+        with self.assertRaises(AttributeError):
+            selector.steps[0].predicate.root.arity = 3  # Interned too.
+        with self.assertRaises(AttributeError):
+            selector.steps[1].node.value = None
+        predicate = parse("a{ b = 3 }.c[1-2]").steps[0].predicate
+        self.assertEqual("b", predicate.operands[0].word)
@@ -0,0 +1,95 @@
+import unittest
+
+from core.columnar import compile_columnar
+from core.columnar import is_numeric_array
+from core.columnar import np
+from core.columnar import to_columns
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.engine import MISSING
+from testing.bench import COLUMNAR_QUERIES
+from testing.bench import make_flat_records
+
+
+class TestColumnar(unittest.TestCase):
+
+    def assert_matches_compiled(self, columns, records):
+        document = {"records": records}
+        for query in COLUMNAR_QUERIES:
+            mask = compile_columnar(query).mask(columns)
+            self.assertEqual(compile(query).select(document),
+                             [r for r, keep in zip(records, mask) if keep],
+                             query)
+
+    def test_matches_compiled_queries(self):
+        records = make_flat_records(2_000)
+        self.assert_matches_compiled(to_columns(records), records)
+
+    @unittest.skipUnless(np, "NumPy is not installed")
+    def test_arrays_match_compiled_queries(self):
+        records = make_flat_records(2_000)
+        columns = to_columns(records, arrays=True)
+        self.assertIsInstance(columns["amount"], np.ndarray)
+        self.assertIsInstance(columns["note"], list)
+        self.assert_matches_compiled(columns, records)
+
+    def test_exact_numeric_arrays(self):
+        for column, numeric in (
+            ([1, 2, -3], True),
+            ([1.5, 2.0], True),
+            ([1, 2.5], False),
+            ([2.5, 1], False),
+            ([2**53, -2**53], True),
+            ([1, 2**53 + 1], False),
+            ([2**64], False),
+            ([1, True], False),
+            ([], False),
+        ):
+            self.assertEqual(numeric, is_numeric_array(column), column)
+
+    @unittest.skipUnless(np, "NumPy is not installed")
+    def test_large_and_mixed_numbers(self):
+        records = [{"a": 2**53 + 1, "b": 1}, {"a": 2**53, "b": 1.5},
+                   {"a": 2**70, "b": 2}]
+        columns = to_columns(records, arrays=True)
+        self.assertIsInstance(columns["a"], list)
+        self.assertIsInstance(columns["b"], list)
+        for query in ("r{ a > 9_007_199_254_740_992 }", "r{ a = 2.0 }",
+                      "r{ b < 1.5 }", "r{ b = 2 }"):
+            self.assertEqual(
+                compile(query).select({"r": records}),
+                [r for r, keep in zip(records,
+                                      compile_columnar(query).mask(columns))
+                 if keep], query)
+
+    def test_missing_fields(self):
+        columns = to_columns([{"a": 1}, {"b": "x"}, {"a": 3}])
+        self.assertEqual([1, MISSING, 3], columns["a"])
+        masks = {
+            "r{ a > 1 }": [False, False, True],
+            "r{ a != 1 }": [False, False, True],
+            "r{ NOT a }": [False, True, False],
+            "r{ c = 1 }": [False, False, False],
+            "r{ a = 1 OR b }": [True, True, False],
+            "r{ 2 < a }": [False, False, True],
+            "r{ 1 = 1 }": [True, True, True],
+        }
+        for query, mask in masks.items():
+            self.assertEqual(mask, compile_columnar(query).mask(columns), query)
+
+    def test_functions(self):
+        columns = to_columns([{"a": "x"}, {"a": "xyz"}, {}])
+        fn = compile_columnar("r{ f:len(a) > 1 }",
+                              {"len": lambda v: len(v or "")})
+        self.assertEqual([False, True, False], fn.mask(columns))
+
+    def test_filter(self):
+        columns = to_columns([{"a": 1, "b": 2}, {"a": 5, "b": 6}])
+        filtered = compile_columnar("r{ a > 1 }").filter(columns)
+        self.assertEqual({"a": [5], "b": [6]}, filtered)
+
+    def test_unsupported(self):
+        for query in ("r{ this > 1 }", "r{ this.a{ b } }", "r.s{ a }", "r"):
+            with self.assertRaises(ValueError, msg=query):
+                compile_columnar(query)
+        with self.assertRaises(ValueError):
+            compile_columnar("r{ a }").mask({"a": [1], "b": [1, 2]})
@@ -0,0 +1,168 @@
+import unittest
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.engine import lower_ranges
+from core.engine import merge_intervals
+from core.zonquery import parse
+from testing.bench import EVALUATION_QUERY
+from testing.bench import make_records
+from testing.interpreter import interpret
+
+DOCUMENT = {
+    "insurance": [
+        {
+            "amount": 5_000,
+            "type": "MH",
+            "status": {
+                "statusDetails": "Active"
+            },
+            "plans": [{
+                "name": "Dental Care"
+            }, {
+                "name": "Vision"
+            }],
+            "benefits": list(range(40)),
+        },
+        {
+            "amount": 9_000,
+            "type": "MH",
+            "plans": [],
+            "benefits": [100, 200],
+        },
+    ]
+}
+
+
+class TestCompiledQuery(unittest.TestCase):
+
+    def assertSelects(self, expected, query, document=None, functions=None):
+        document = DOCUMENT if document is None else document
+        self.assertEqual(expected,
+                         compile(query, functions).select(document))
+        self.assertEqual(expected,
+                         interpret(parse(query), document, functions))
+
+    def test_path(self):
+        self.assertSelects([5_000, 9_000], "insurance.amount")
+
+    def test_missing_path(self):
+        self.assertSelects([], "insurance.unknown.amount")
+
+    def test_ranges(self):
+        self.assertSelects([1, 2, 3, 4, 15, 16, 39, 200],
+                           "insurance.benefits[1 2-4 15-16 -1]")
+        self.assertSelects([0, 39, 100, 200], "insurance.benefits[0, -1]")
+
+    def test_relational_predicate(self):
+        self.assertSelects([9_000],
+                           'insurance{ amount > 8_000 type = "MH" }.amount')
+        self.assertSelects([5_000], "insurance{ amount != 9_000 }.amount")
+
+    def test_missing_fields_never_compare(self):
+        self.assertSelects([], "insurance{ unknown = unknown }")
+        self.assertSelects([], "insurance{ unknown != 3 }")
+
+    def test_mismatched_types_never_compare(self):
+        self.assertSelects([], 'insurance{ amount < "a" }')
+
+    def test_logical_predicate(self):
+        self.assertSelects([5_000, 9_000],
+                           "insurance{ amount < 6_000 OR amount > 8_000 }"
+                           ".amount")
+        self.assertSelects([9_000], "insurance{ NOT amount < 6_000 }.amount")
+        self.assertSelects([5_000],
+                           "insurance{ amount < 9_500 XOR amount > 8_000 }"
+                           ".amount")
+
+    def test_nested_selector(self):
+        self.assertSelects([5_000],
+                           'insurance{ this.plans.name = "Vision" }.amount')
+        self.assertSelects(
+            [5_000], 'insurance{ this.status{ this.statusDetails = "Active" }'
+            ' }.amount')
+        self.assertSelects([5_000], "insurance{ this.plans }.amount")
+
+    def test_single_term_predicate(self):
+        self.assertSelects([5_000], "insurance{ status }.amount")
+
+    def test_functions(self):
+        functions = {
+            "double": lambda x: x * 2,
+            "count": len,
+        }
+        self.assertSelects([9_000],
+                           "insurance{ f:double(amount) > 12_000 }.amount",
+                           functions=functions)
+        self.assertSelects([5_000],
+                           "insurance{ f:count(this.plans) = 2 }.amount",
+                           functions=functions)
+
+    def test_unknown_function(self):
+        with self.assertRaises(ValueError):
+            compile("insurance{ f:unknown(amount) }")
+
+    def test_matches_interpreter_on_generated_records(self):
+        query = compile(EVALUATION_QUERY)
+        selector = parse(EVALUATION_QUERY)
+        for record in make_records(500):
+            self.assertEqual(interpret(selector, record), query.select(record))
+
+    def test_flattened_chains(self):
+        self.assertSelects([9_000],
+                           "insurance{ amount < 9_500 XOR amount > 8_000 XOR"
+                           " type = \"MH\" }.amount")
+        self.assertSelects([9_000],
+                           "insurance{ amount > 1 && type = \"MH\" AND"
+                           " amount > 8_000 }.amount")
+        self.assertSelects([5_000, 9_000],
+                           "insurance{ amount = 1 OR amount = 5_000 ||"
+                           " amount = 9_000 }.amount")
+
+    def test_flatten_opt_out(self):
+        flat = compile(EVALUATION_QUERY)
+        legacy = compile(EVALUATION_QUERY, flatten=False)
+        for record in make_records(500):
+            self.assertEqual(legacy.select(record), flat.select(record))
+
+    def test_long_conjunction(self):
+        terms = 100_000
+        query = compile(f"n{{ {' '.join(f'a{i}' for i in range(terms))} }}")
+        document = {"n": [{f"a{i}": 1 for i in range(terms)}, {"a0": 1}]}
+        self.assertEqual(document["n"][:1], query.select(document))
+
+    def test_typed_literals(self):
+        self.assertSelects([5_000], "insurance{ amount < 5_000.5 }.amount")
+        self.assertSelects([9_000], "insurance{ amount >= 9e3 }.amount")
+        # Not a number but a field, missing here.
+        self.assertSelects([], "insurance{ amount != 1_ }.amount")
+
+
+class TestRanges(unittest.TestCase):
+
+    def test_merge_intervals(self):
+        self.assertEqual([(0, 4), (5, 7), (9, 10)],
+                         merge_intervals([(5, 6), (9, 10), (2, 4), (0, 3),
+                                          (6, 7), (8, 8)]))
+
+    def test_fixed_ranges_are_clipped(self):
+        slices_of = lower_ranges([(15, 20), (1, 1), (2, 9), (33, 33)])
+        self.assertEqual([(1, 10), (15, 21), (33, 34)], slices_of(40))
+        self.assertEqual([(1, 10), (15, 18)], slices_of(18))
+        self.assertEqual([], slices_of(0))
+
+    def test_negative_ranges_are_resolved_per_size(self):
+        slices_of = lower_ranges([(0, 0), (-1, -1), (-3, -3)])
+        self.assertEqual([(0, 1), (7, 8), (9, 10)], slices_of(10))
+        self.assertEqual([(0, 2)], slices_of(2))
+        self.assertEqual([(0, 1)], slices_of(1))
+
+    def test_matches_interpreter(self):
+        for ranges in ("0", "-1", "0 -1", "1 2-9 15-20 33", "9-2", "3 1-4 2",
+                       "-5 0-1", "0-99", "-9 -1 4"):
+            query = f"a[{ranges}]"
+            compiled = compile(query)
+            for size in (0, 1, 2, 5, 10, 40):
+                document = {"a": list(range(size))}
+                with self.subTest(query=query, size=size):
+                    self.assertEqual(interpret(parse(query), document),
+                                     compiled.select(document))
@@ -0,0 +1,109 @@
+import io
+from itertools import islice
+import json
+import unittest
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.events import END_ARRAY
+from core.events import END_MAP
+from core.events import iter_events
+from core.events import iter_select_document
+from core.events import MAP_KEY
+from core.events import START_ARRAY
+from core.events import START_MAP
+from core.events import VALUE
+from testing.bench import make_records
+from tests.test_engine import DOCUMENT
+from tests.test_index import QUERIES
+from tests.test_mapped import TRICKY_DOCUMENT
+from tests.test_mapped import TRICKY_QUERIES
+
+ARRAY_QUERIES = (
+    "this{ this.insurance{ amount > 8_000 } }.insurance.type",
+    "this[3-5 -1].insurance.amount",
+    "this.insurance{ amount > 15_000 }.plans",
+    "this[0]",
+)
+
+
+class EndlessArray(io.RawIOBase):
+    # "[" then records forever: only a streaming reader gets anything out.
+
+    def __init__(self):
+        self.pending = b"["
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while len(self.pending) < len(buffer):
+            self.pending += b'{"amount": 1, "id": 2},'
+        data, self.pending = (self.pending[:len(buffer)],
+                              self.pending[len(buffer):])
+        buffer[:] = data
+        return len(data)
+
+
+class TestEvents(unittest.TestCase):
+
+    def test_events(self):
+        text = '{"a": [1, 2.5, "x\\"y", true, null, {}], "b": {"c": -3e2}}'
+        self.assertEqual([
+            (START_MAP, None),
+            (MAP_KEY, "a"),
+            (START_ARRAY, None),
+            (VALUE, 1),
+            (VALUE, 2.5),
+            (VALUE, 'x"y'),
+            (VALUE, True),
+            (VALUE, None),
+            (START_MAP, None),
+            (END_MAP, None),
+            (END_ARRAY, None),
+            (MAP_KEY, "b"),
+            (START_MAP, None),
+            (MAP_KEY, "c"),
+            (VALUE, -300.0),
+            (END_MAP, None),
+            (END_MAP, None),
+        ], list(iter_events(io.StringIO(text), chunk_size=3)))
+
+    def test_matches_compiled_queries(self):
+        records = make_records(50)
+        cases = [
+            (DOCUMENT, QUERIES),
+            (TRICKY_DOCUMENT, (*TRICKY_QUERIES, "c[-2]", "this.c[1 -1]")),
+            ({"records": records}, [f"records.{q}" for q in QUERIES]),
+            (records, ARRAY_QUERIES),
+        ]
+        for document, queries in cases:
+            text = json.dumps(document, indent=1).encode()
+            for query in queries:
+                expected = compile(query).select(document)
+                for chunk_size in (1, 7, 4096):
+                    with self.subTest(query=query, chunk_size=chunk_size):
+                        self.assertEqual(
+                            expected,
+                            list(
+                                iter_select_document(query, io.BytesIO(text),
+                                                     chunk_size=chunk_size)))
+
+    def test_matches_are_yielded_as_they_complete(self):
+        stream = io.BufferedReader(EndlessArray(), buffer_size=16)
+        matches = iter_select_document("this{ amount = 1 }.id", stream,
+                                       chunk_size=16)
+        self.assertEqual([2, 2, 2], list(islice(matches, 3)))
+
+    def test_numbers_cut_by_chunks(self):
+        for number in ("12.25", "-1.5e+3", "2E-2", "7e10"):
+            for pad in range(16):
+                text = f'{{"pad": "{"x" * pad}", "a": {number}}}'
+                matches = iter_select_document("a", io.StringIO(text),
+                                               chunk_size=16)
+                with self.subTest(number=number, pad=pad):
+                    self.assertEqual([json.loads(number)], list(matches))
+
+    def test_invalid_json(self):
+        for text in ('{"a": [1 }', '{"a": 1', '{1: 2}', '{"a": tru}', "]"):
+            with self.assertRaises(ValueError, msg=text):
+                list(iter_select_document("a", io.StringIO(text)))
@@ -0,0 +1,186 @@
+import unittest
+
+from core.cache import CacheInfo
+from core.columnar import compile_columnar
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.functions import BATCH_SCOPE
+from core.functions import FunctionRegistry
+from core.queryset import QuerySet
+from core.symbols import Arity
+from core.zonquery import parse
+from testing.interpreter import interpret
+
+DOCUMENT = {
+    "records": [
+        {
+            "name": "ada",
+            "tags": ["a", "b"]
+        },
+        {
+            "name": "grace",
+            "tags": []
+        },
+    ]
+}
+
+
+class TestFunctionRegistry(unittest.TestCase):
+
+    def test_arity_from_signature(self):
+        registry = FunctionRegistry()
+
+        @registry.register
+        def pad(text, width=8, *rest):  # pylint: disable=unused-argument
+            return text.ljust(width)
+
+        registry.register(len, name="f:size")
+        function = registry.function("pad")
+        self.assertEqual((1, None), (function.min_arity, function.max_arity))
+        self.assertEqual("at least 1", function.arity_text)
+        self.assertEqual("1", registry.function("size").arity_text)
+        self.assertEqual(["pad", "size"], list(registry))
+        self.assertIs(len, registry["size"])
+
+    def test_declared_arity(self):
+        registry = FunctionRegistry()
+        registry.register(max, arity=Arity.NARY)
+        registry.register(lambda a, b: a, name="first", arity=2)
+        self.assertTrue(registry.function("max").accepts(0))
+        self.assertEqual("2", registry.function("first").arity_text)
+        with self.assertRaises(ValueError):
+            registry.register(max, arity=-2)
+
+    def test_compiles_as_a_dict(self):
+        registry = FunctionRegistry({"upper": str.upper, "size": len})
+        query = "records{ f:size(tags) = 2 || f:upper(name) = \"GRACE\" }"
+        expected = DOCUMENT["records"]
+        self.assertEqual(expected, compile(query, registry).select(DOCUMENT))
+        self.assertEqual(expected, interpret(parse(query), DOCUMENT, registry))
+
+    def test_fails_early(self):
+        registry = FunctionRegistry({"upper": str.upper})
+        with self.assertRaisesRegex(ValueError, "Unknown function 'f:lower'"):
+            compile("records{ f:lower(name) }", registry)
+        with self.assertRaisesRegex(ValueError,
+                                    "'f:upper' expects 1 argument"):
+            compile("records{ f:upper(name, tags) }", registry)
+        with self.assertRaisesRegex(ValueError,
+                                    "'f:upper' expects 1 argument"):
+            compile_columnar("records{ f:upper() }", registry)
+
+    def test_folds_pure_calls_with_literals(self):
+        calls = []
+        registry = FunctionRegistry()
+
+        @registry.register(pure=True)
+        def double(x):
+            calls.append(x)
+            return x * 2
+
+        compiled = compile("records{ f:double(f:double(2)) = 8 }.name",
+                           registry)
+        self.assertEqual([2, 4], calls)
+        self.assertEqual(["ada", "grace"], compiled.select(DOCUMENT))
+        self.assertEqual([2, 4], calls)
+
+        compiled = compile("records{ f:double(name) = \"adaada\" }.name",
+                           registry)
+        self.assertEqual(["ada"], compiled.select(DOCUMENT))
+        self.assertEqual([2, 4, "ada", "grace"], calls)
+
+        columnar = compile_columnar("records{ f:double(3) = 6 }", registry)
+        self.assertEqual([2, 4, "ada", "grace", 3], calls)
+        self.assertEqual([True, True], columnar.mask({"name": ["a", "b"]}))
+
+    def test_impure_calls_are_not_folded(self):
+        calls = []
+        registry = FunctionRegistry()
+        registry.register(lambda: calls.append(1) or len(calls), name="tick")
+        compiled = compile("records{ f:tick() > 1 }.name", registry)
+        self.assertEqual([], calls)
+        self.assertEqual(["grace"], compiled.select(DOCUMENT))
+
+
+class TestFunctionCache(unittest.TestCase):
+    QUERY: str = 'records{ f:remaining("Year to Date", name) > 3 }.name'
+    DOCUMENT: dict = {
+        "records": [{
+            "name": name
+        } for name in ("ada", "grace", "ada", "ada", "grace", "alan")]
+    }
+
+    def registry(self, scope: str = "document", size: int = 8):
+        calls = []
+        registry = FunctionRegistry(cache_scope=scope)
+
+        @registry.register(cache=size)
+        def remaining(period, name):
+            calls.append(name)
+            return len(period) - len(name) * 2
+
+        return registry, calls
+
+    def test_cached_per_document(self):
+        registry, calls = self.registry()
+        query = compile(self.QUERY, registry)
+        self.assertEqual(["ada", "ada", "ada", "alan"],
+                         query.select(self.DOCUMENT))
+        self.assertEqual(["ada", "grace", "alan"], calls)
+        query.select(self.DOCUMENT)
+        self.assertEqual(6, len(calls))
+        self.assertEqual({"remaining": CacheInfo(6, 6, 0, 8, 3)},
+                         registry.cache.info())
+        self.assertEqual({"remaining": 0.5}, registry.cache.hit_rates())
+        self.assertIn("50.0%", registry.cache.report())
+
+        QuerySet([self.QUERY], registry).evaluate(self.DOCUMENT)
+        self.assertEqual(9, len(calls))
+
+    def test_cached_per_batch(self):
+        registry, calls = self.registry(BATCH_SCOPE)
+        query = compile(self.QUERY, registry)
+        with registry.cache.batch():
+            for _ in range(3):
+                query.select(self.DOCUMENT)
+        self.assertEqual(3, len(calls))
+        with registry.cache.batch():
+            query.select(self.DOCUMENT)
+        self.assertEqual(6, len(calls))
+        self.assertEqual(0, registry.cache.info()["remaining"].currsize)
+
+    def test_evictions(self):
+        registry, calls = self.registry(size=1)
+        compile(self.QUERY, registry).select(self.DOCUMENT)
+        self.assertEqual(["ada", "grace", "ada", "grace", "alan"], calls)
+        info = registry.cache.info()["remaining"]
+        self.assertEqual((1, 5, 4), (info.hits, info.misses, info.evictions))
+
+    def test_unhashable_arguments_are_not_cached(self):
+        registry = FunctionRegistry()
+        registry.register(len, name="size", cache=4)
+        query = compile("records{ f:size(tags) = 2 }.name", registry)
+        self.assertEqual(["ada"], query.select(DOCUMENT))
+        self.assertEqual(0, registry.cache.info()["size"].misses)
+
+    def test_equal_arguments_of_other_types(self):
+        registry = FunctionRegistry(cache_scope=BATCH_SCOPE)
+        registry.register(lambda x: type(x).__name__, name="kind", cache=16)
+        query = compile('n{ f:kind(a) = "float" }', registry)
+        document = {"n": [{"a": 1}, {"a": 1.0}, {"a": True}]}
+        self.assertEqual([{"a": 1.0}], query.select(document))
+        self.assertEqual(3, registry.cache.info()["kind"].misses)
+
+    def test_columnar(self):
+        registry, calls = self.registry()
+        predicate = compile_columnar(self.QUERY.split(".")[0], registry)
+        names = [r["name"] for r in self.DOCUMENT["records"]]
+        mask = [True, False, True, True, False, True]
+        self.assertEqual(mask, predicate.mask({"name": names}))
+        self.assertEqual(mask, predicate.mask({"name": names}))
+        self.assertEqual(6, len(calls))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            FunctionRegistry(cache_scope="record")
+        with self.assertRaises(ValueError):
+            FunctionRegistry().register(len, cache=-1)
@@ -0,0 +1,69 @@
+import statistics
+import unittest
+
+from core.lib import json
+from core.lib import LazyModule
+from testing.testing import import_times
+
+# Imported on first use only, never by importing the library.
+LAZY_MODULES: tuple[str, ...] = ("argparse", "inspect", "json", "numpy",
+                                 "orjson", "rich")
+LIBRARY_MODULES: tuple[str, ...] = (
+    "core.asynchronous",
+    "core.cache",
+    "core.columnar",
+    "core.engine",
+    "core.events",
+    "core.export",
+    "core.functions",
+    "core.incremental",
+    "core.index",
+    "core.mapped",
+    "core.optimizer",
+    "core.parallel",
+    "core.precompile",
+    "core.queryset",
+    "core.stream",
+    "core.zonquery",
+)
+
+
+class TestImportTime(unittest.TestCase):
+    # Loose on purpose: it catches an eager import of a heavy dependency, not
+    # the noise of a shared machine. See testing.bench imports for numbers.
+    BUDGET_US: int = 150_000
+    RUNS: int = 3
+
+    def test_optional_modules_are_lazy(self):
+        for module in LIBRARY_MODULES:
+            with self.subTest(module=module):
+                times = import_times(module)
+                self.assertIn(module, times)
+                self.assertEqual([],
+                                 [m for m in LAZY_MODULES if m in times])
+
+    def test_budget(self):
+        median = statistics.median(
+            import_times("core.engine")["core.engine"]
+            for _ in range(self.RUNS))
+        self.assertLess(median, self.BUDGET_US)
+
+
+class TestLazyModule(unittest.TestCase):
+
+    def test_first_importable(self):
+        module = LazyModule("zonquery_missing_module", "json.decoder")
+        self.assertEqual("json.decoder", module.__name__)
+        self.assertIn("scanstring", dir(module._module))
+        error = module.JSONDecodeError  # Bound once read.
+        self.assertIs(error, module.__dict__["JSONDecodeError"])
+        with self.assertRaises(AttributeError):
+            getattr(module, "missing_name")
+
+    def test_none_importable(self):
+        with self.assertRaises(ImportError):
+            getattr(LazyModule("zonquery_missing_module"), "loads")
+
+    def test_json_backend(self):
+        self.assertEqual([1, {"a": None}], json.loads(b'[1, {"a": null}]'))
+        self.assertIn(json.__name__, ("orjson", "json"))
@@ -0,0 +1,121 @@
+import random
+import unittest
+
+from core.export import to_json
+from core.incremental import parse_state
+from core.incremental import PARSE_ERRORS
+from core.incremental import reparse
+from core.zonquery import parse_uncached
+from core.zonquery import Predicate
+from core.zonquery import Selector
+from core.zonquery import Step
+from testing.bench import edited_selector
+
+SELECTOR = ('insurance{ amount <= 8_000 type == "MH" }.benefits[1 2-9]'
+            '.plans{ this.status{ code = 1 } = "Active Coverage" }.name'
+            '.deductibles[0, -1]')
+
+
+def spans(selector):
+    # Offsets of every selector, step, range and predicate, in order.
+    found, pending = [], [selector]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, Selector):
+            found.append((node.start, node.end))
+            pending.extend(reversed(node.steps))
+        elif isinstance(node, Step):
+            found.append((node.start, node.end))
+            found.extend((r.start, r.end) for r in node.ranges or ())
+            if node.predicate is not None:
+                pending.append(node.predicate)
+        elif isinstance(node, Predicate):
+            found.append((node.start, node.end))
+            pending.extend(reversed(node.operands))
+    return found
+
+
+def expected(text):
+    try:
+        selector = parse_uncached(text)
+    except PARSE_ERRORS as e:
+        return type(e), str(e)
+    return to_json(selector), spans(selector)
+
+
+def actual(state):
+    if state.error is not None:
+        return type(state.error), str(state.error)
+    return to_json(state.selector), spans(state.selector)
+
+
+class TestIncrementalParse(unittest.TestCase):
+
+    def test_typing(self):
+        state = parse_state("")
+        for i, char in enumerate(SELECTOR):
+            state = reparse(state, i, 0, char)
+            self.assertEqual(expected(SELECTOR[:i + 1]), actual(state))
+
+    def test_steps_are_reused(self):
+        text = edited_selector(2_000)
+        state = parse_state(text)
+        steps = state.selector.steps
+        offset = text.index("amount", len(text) // 2)
+        for replacement, reused in (("totals", len(steps) - 2),
+                                    ("total", len(steps) // 2 - 2)):
+            with self.subTest(replacement=replacement):
+                edited = reparse(state, offset, len("amount"), replacement)
+                self.assertLessEqual(edited.scanned, 2)
+                self.assertEqual(expected(edited.text), actual(edited))
+                kept = sum(
+                    a is b for a, b in zip(steps, edited.selector.steps))
+                self.assertGreaterEqual(kept, reused)
+
+    def test_segments_merge_and_split(self):
+        state = parse_state(SELECTOR)
+        offset = SELECTOR.index(".plans")
+        merged = reparse(state, offset, 1, "")
+        self.assertEqual(expected(merged.text), actual(merged))
+        split = reparse(merged, offset, 0, ".")
+        self.assertEqual(expected(SELECTOR), actual(split))
+
+    def test_errors(self):
+        state = parse_state(SELECTOR)
+        offset = SELECTOR.index('"MH"')
+        for inserted in ('"', "(", "]", "}", "{ a"):
+            with self.subTest(inserted=inserted):
+                broken = reparse(state, offset, 0, inserted)
+                self.assertEqual(expected(broken.text), actual(broken))
+                if inserted in "\"(":
+                    with self.assertRaises(PARSE_ERRORS):
+                        broken.selector  # pylint: disable=pointless-statement
+                fixed = reparse(broken, offset, len(inserted), "")
+                self.assertEqual(expected(SELECTOR), actual(fixed))
+
+    def test_quote_closed_later(self):
+        state = parse_state("a.b{ c = 'x }.d{ e }.f")
+        self.assertIsNotNone(state.error)
+        closed = reparse(state, state.text.index(" }.d"), 0, "'")
+        self.assertEqual(expected(closed.text), actual(closed))
+        self.assertIsNone(closed.error)
+
+    def test_random_edits(self):
+        rng = random.Random(7)
+        state = parse_state(SELECTOR)
+        for _ in range(500):
+            text = state.text
+            offset = rng.randrange(len(text) + 1)
+            removed = rng.randrange(min(3, len(text) - offset) + 1)
+            inserted = "".join(
+                rng.choices("a1 .{}[]()'\"=-", k=rng.randrange(3)))
+            state = reparse(state, offset, removed, inserted)
+            self.assertEqual(expected(state.text), actual(state))
+            if rng.random() < 0.1:
+                state = parse_state(SELECTOR)
+
+    def test_invalid_edit(self):
+        state = parse_state("a.b")
+        for offset, removed in ((4, 0), (-1, 0), (2, 2)):
+            with self.assertRaises(ValueError):
+                reparse(state, offset, removed, "c")
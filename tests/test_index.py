@@ -0,0 +1,102 @@
+import copy
+import unittest
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.index import DocumentIndex
+from core.index import QUERY_CACHE
+from testing.bench import EVALUATION_QUERY
+from testing.bench import make_records
+from tests.test_engine import DOCUMENT
+
+QUERIES: tuple[str, ...] = (
+    "insurance",
+    "insurance.amount",
+    "insurance.benefits[0 -1]",
+    "insurance.plans.name",
+    'insurance{ type = "MH" amount > 8_000 }.benefits[1-2]',
+    "insurance{ this.plans }.status.statusDetails",
+    "this.insurance.amount",
+    "insurance.unknown.amount",
+    EVALUATION_QUERY,
+)
+
+
+class TestDocumentIndex(unittest.TestCase):
+
+    def test_values_and_nodes(self):
+        index = DocumentIndex(DOCUMENT)
+        self.assertEqual([DOCUMENT["insurance"]], index.values(("insurance",)))
+        self.assertEqual(DOCUMENT["insurance"], index.nodes(("insurance",)))
+        self.assertEqual(["Dental Care", "Vision"],
+                         index.nodes(("insurance", "plans", "name")))
+        self.assertEqual([DOCUMENT], index.nodes(()))
+        self.assertEqual([], index.values(("insurance", "unknown")))
+
+    def test_select_matches_compiled_queries(self):
+        documents = [DOCUMENT, *make_records(200)]
+        for query in QUERIES:
+            compiled = compile(query)
+            for document in documents:
+                with self.subTest(query=query):
+                    self.assertEqual(compiled.select(document),
+                                     DocumentIndex(document).select(compiled))
+
+    def test_max_depth_indexes_deeper_paths_on_lookup(self):
+        index = DocumentIndex(DOCUMENT, max_depth=1)
+        path = ("insurance", "status", "statusDetails")
+        self.assertNotIn(path, index)
+        self.assertEqual(["Active"], index.values(path))
+        self.assertIn(path[:2], index)
+        self.assertEqual(["Active"], index.values(path))
+        self.assertEqual((1, 1), (index.info().hits, index.info().misses))
+
+    def test_array_document(self):
+        document = [{}, {"a": "a b"}]
+        for max_depth in (None, 0):
+            index = DocumentIndex(document, max_depth=max_depth)
+            with self.subTest(max_depth=max_depth):
+                self.assertEqual([], index.select("a"))
+                self.assertEqual(compile("a").select(document),
+                                 index.select("a"))
+
+    def test_invalidate(self):
+        document = copy.deepcopy(DOCUMENT)
+        index = DocumentIndex(document)
+        self.assertEqual([5_000, 9_000], index.select("insurance.amount"))
+
+        document["insurance"][1]["amount"] = 1
+        document["insurance"][1]["plans"] = [{"name": "Pharmacy"}]
+        self.assertEqual([5_000, 9_000], index.select("insurance.amount"))
+        self.assertEqual(1, index.invalidate(("insurance", "amount")))
+        self.assertEqual([5_000, 1], index.select("insurance.amount"))
+        self.assertEqual(["Dental Care", "Vision"],
+                         index.select("insurance.plans.name"))
+
+        index.invalidate()
+        self.assertEqual(["Dental Care", "Vision", "Pharmacy"],
+                         index.select("insurance.plans.name"))
+        self.assertEqual(2, index.generation)
+
+    def test_text_queries_are_compiled_once(self):
+        functions = {"len": len}
+        query = "insurance{ f:len(plans) > 1 }.amount"
+        QUERY_CACHE.clear()
+        for document in (DOCUMENT, copy.deepcopy(DOCUMENT)):
+            for _ in range(2):
+                self.assertEqual([5_000],
+                                 DocumentIndex(document).select(query,
+                                                                functions))
+        self.assertEqual((3, 1), (QUERY_CACHE.info().hits,
+                                  QUERY_CACHE.info().misses))
+        DocumentIndex(DOCUMENT).select(query, {"len": lambda _: 0})
+        self.assertEqual(2, QUERY_CACHE.info().misses)
+
+    def test_memory_accounting(self):
+        index = DocumentIndex(DOCUMENT)
+        info = index.info()
+        self.assertEqual(len(index), info.paths)
+        self.assertGreater(info.nbytes, 0)
+        self.assertEqual(index.memory_usage(), info.nbytes)
+        # Root and insurance, then amount, type, status, plans, benefits,
+        # plans.name and status.statusDetails: 2 + 2 + 2 + 1 + 2 + 2 + 2 + 1.
+        self.assertEqual(14, info.references)
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import unittest
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.mapped import MappedDocument
+from core.mapped import select_mapped
+from testing.bench import make_records
+from tests.test_engine import DOCUMENT
+from tests.test_index import QUERIES
+
+TRICKY_DOCUMENT = {
+    "deep": [[[[[[[[[[{"x": "]"}]]]]]]]]]],
+    "a": [{"b": 1}, {"b": [2, 3]}, [{"b": 9}], {"b": {"c": 'x]}"{\\'}}],
+    "b": {"c": 5, "d": []},
+    "é": "☃",
+    "c": [[], {}, "}", None, True, -1.5e3],
+}
+TRICKY_QUERIES = ("deep", "a.b", "a.b.c", "b.c", "b.d", "this.a.b", "a",
+                  "é", "c", "c[1-3]", "x.y", "a{ b > 1 }.b")
+
+
+class TestMappedDocument(unittest.TestCase):
+
+    def setUp(self):
+        self.files = []
+
+    def tearDown(self):
+        for name in self.files:
+            os.remove(name)
+
+    def write(self, text):
+        with tempfile.NamedTemporaryFile("w", suffix=".json",
+                                         encoding="utf-8",
+                                         delete=False) as f:
+            f.write(text)
+        self.files.append(f.name)
+        return f.name
+
+    def assert_matches_compiled(self, document, queries, indent=None):
+        name = self.write(json.dumps(document, indent=indent))
+        with MappedDocument(name) as mapped:
+            for query in queries:
+                self.assertEqual(compile(query).select(document),
+                                 mapped.select(query), query)
+
+    def test_matches_compiled_queries(self):
+        self.assert_matches_compiled(DOCUMENT, QUERIES)
+        self.assert_matches_compiled(DOCUMENT, QUERIES, indent=4)
+        self.assert_matches_compiled(TRICKY_DOCUMENT, TRICKY_QUERIES)
+        self.assert_matches_compiled(TRICKY_DOCUMENT, TRICKY_QUERIES, indent=1)
+        records = {"records": make_records(50)}
+        self.assert_matches_compiled(
+            records, [f"records.{q}" for q in QUERIES])
+
+    def test_skips_unrelated_subtrees(self):
+        document = {"big": make_records(100), "small": {"value": 1}}
+        with MappedDocument(self.write(json.dumps(document))) as mapped:
+            self.assertEqual([1], mapped.select("small.value"))
+            self.assertEqual(len("1"), mapped.materialized)
+
+    def test_last_duplicate_key_wins(self):
+        self.assertEqual([2], select_mapped("a", self.write('{"a":1,"a":2}')))
+
+    def test_invalid_json(self):
+        for text in ('{"a" 1}', '{"a": [1 2]}', '{"a": {"b": 1', '{"a": "b'):
+            with self.assertRaises(ValueError, msg=text):
+                select_mapped("a.b", self.write(text))
+        with self.assertRaises(ValueError):
+            select_mapped("a", self.write(""))
@@ -0,0 +1,141 @@
+import random
+import unittest
+import weakref
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.optimizer import explain
+from core.optimizer import optimize
+from core.optimizer import Optimizer
+from core.zonquery import parse
+from core.zonquery import parse_uncached
+from testing.bench import AnyFunctions
+from testing.bench import make_records
+from testing.bench import make_selector_document
+from testing.bench import OPTIMIZER_QUERIES
+from testing.interpreter import interpret
+from testing.testing import TestingData
+from tests.data import TEST_DATA
+
+
+def random_term(rng: random.Random, depth: int) -> str:
+    # Negations, constants, duplicates and nested selectors, which the
+    # optimizer folds, drops and memoizes.
+    if depth <= 0 or rng.random() < 0.3:
+        return rng.choice((
+            f"{rng.choice('abc')} = {rng.randrange(3)}",
+            f"{rng.randrange(3)} < {rng.choice('abc')}",
+            rng.choice("abc"),
+            str(rng.randrange(2)),
+            f"this.s{{ {rng.choice('ac')} = {rng.randrange(2)} }}",
+            "this.s.a",
+        ))
+    if rng.random() < 0.3:
+        negation = rng.choice(("!", "!!", "NOT "))
+        return f"{negation}({random_term(rng, depth - 1)})"
+    operator = f" {rng.choice(('AND', 'OR', '&&', '||', '^'))} "
+    return "(" + operator.join(
+        random_term(rng, depth - 1) for _ in range(rng.randrange(2, 5))) + ")"
+
+
+class TestOptimize(unittest.TestCase):
+
+    def assertOptimizes(self, expected, predicate):
+        selector = optimize(parse(f"a{{ {predicate} }}"))
+        self.assertEqual(expected, selector.steps[0].predicate.as_dict)
+
+    def test_double_negation(self):
+        self.assertOptimizes({"=": ["b", "1"]}, "!!(b = 1)")
+        self.assertOptimizes({"~": ["b"]}, "~!!b")
+        self.assertOptimizes({"AND": ["b", "c"]}, "NOT NOT b AND c")
+        # The truth of a value, not the value: kept outside of NOT/AND/OR.
+        self.assertOptimizes({"!": [{"!": ["b"]}]}, "!!b")
+
+    def test_duplicate_operands(self):
+        self.assertOptimizes({"AND": ["c", {"=": ["b", "1"]}]},
+                             "b = 1 AND c AND b = 1")
+        self.assertOptimizes({"OR": ["b", "c"]}, "b OR c OR b")
+        self.assertOptimizes({"AND": [{"f:g": ["b"]}, {"f:g": ["b"]}]},
+                             "f:g(b) AND f:g(b)")
+
+    def test_cost_order(self):
+        self.assertOptimizes(
+            {
+                "&&": [{
+                    "=": ["c", "2"]
+                }, {
+                    "selector": [{
+                        "node": "this"
+                    }, {
+                        "node": "b"
+                    }]
+                }, {
+                    "f:g": ["d"]
+                }]
+            }, "f:g(d) && this.b && c = 2")
+
+    def test_literals(self):
+        self.assertOptimizes({"<=": ["b", "8_000"]}, "8_000 >= b")
+        self.assertOptimizes({"=": ["b", "1"]}, "1 = 1 AND b = 1")
+        self.assertOptimizes({"0": []}, "1 > 2 AND b")
+        self.assertOptimizes({"1": []}, "NOT 0 OR b")
+        self.assertOptimizes({"NOT": [{"NOT": ["b"]}]}, "b AND 1")
+
+    def test_explain(self):
+        text = explain(parse("a{ 8_000 >= b AND b <= 8_000 }"))
+        self.assertIn("Optimized:\n  .a\n    <= (cost 3)\n      b\n      8_000",
+                      text)
+        self.assertIn("dropped duplicate AND operand: (b <= 8_000)", text)
+
+    def test_same_results_on_test_data(self):
+        functions = AnyFunctions()
+        for index, data in enumerate(TEST_DATA):
+            selector = TestingData(data).selector
+            with self.subTest(selector=selector):
+                document = make_selector_document(selector, 50, seed=index)
+                expected = interpret(parse(selector), document, functions)
+                self.assertEqual(
+                    expected,
+                    compile(selector, functions,
+                            optimize=True).select(document))
+
+    def test_same_results_on_generated_records(self):
+        records = make_records(300)
+        for query in OPTIMIZER_QUERIES:
+            selector = parse(query)
+            optimized = compile(selector, optimize=True)
+            for record in records:
+                self.assertEqual(interpret(selector, record),
+                                 optimized.select(record))
+
+    def test_same_results_on_random_predicates(self):
+        rng = random.Random(9)
+        document = {
+            "n": [{
+                "a": rng.randrange(3),
+                "b": rng.randrange(3),
+                "c": rng.randrange(3),
+                "s": {
+                    "a": rng.randrange(2)
+                }
+            } for _ in range(30)]
+        }
+        for _ in range(500):
+            query = f"n{{ {random_term(rng, 4)} }}"
+            selector = parse(query)
+            expected = interpret(selector, document)
+            for optimize_ in (False, True):
+                with self.subTest(query=query, optimize=optimize_):
+                    self.assertEqual(
+                        expected,
+                        compile(selector,
+                                optimize=optimize_).select(document))
+
+    def test_memoized_nodes_are_kept(self):
+        # Their ids would otherwise be reused by nodes built afterwards.
+        optimizer = Optimizer()
+        selector = parse_uncached("this.s.a")
+        key = optimizer.key(selector)
+        reference = weakref.ref(selector)
+        del selector
+        self.assertIsNotNone(reference())
+        self.assertEqual(key, optimizer.key(reference()))
@@ -0,0 +1,101 @@
+import json
+import os
+import pickle
+import tempfile
+import unittest
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.parallel import iter_partition_lines
+from core.parallel import partition_files
+from core.parallel import select_many
+from core.stream import iter_select
+from core.zonquery import parse
+
+
+def is_even(n):
+    return n % 2 == 0
+
+
+class TestSelectMany(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.paths = []
+        for f in range(3):
+            path = os.path.join(cls.directory.name, f"records-{f}.ndjson")
+            with open(path, "w", encoding="utf-8") as out:
+                for i in range(200):
+                    n = f * 1_000 + i
+                    out.write(json.dumps({"id": n, "amount": n % 700}) + "\n")
+            cls.paths.append(path)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.directory.cleanup()
+
+    def expected(self, query):
+        matches = []
+        for path in self.paths:
+            with open(path, "rb") as f:
+                matches.extend(iter_select(query, f))
+        return matches
+
+    def test_partitions_cover_every_line_once(self):
+        for size in (1, 17, 1_000, 1 << 20):
+            with self.subTest(partition_size=size):
+                lines = [
+                    line for p in partition_files(self.paths, size)
+                    for _, line in iter_partition_lines(p)
+                ]
+                self.assertEqual(600, len(lines))
+                self.assertEqual(600, len(set(lines)))
+
+    def test_single_worker(self):
+        query = "this{ amount > 600 }.id"
+        self.assertEqual(
+            self.expected(query),
+            list(select_many(query, self.paths, workers=1,
+                             partition_size=999)))
+
+    def test_ordered_workers(self):
+        query = "this{ amount > 600 }.id"
+        self.assertEqual(
+            self.expected(query),
+            list(select_many(query, self.paths, workers=2,
+                             partition_size=999)))
+
+    def test_unordered_workers(self):
+        query = compile("this{ f:is_even(id) }.id", {"is_even": is_even})
+        self.assertEqual(
+            sorted(self.expected(query)),
+            sorted(
+                select_many(query, self.paths, workers=2, ordered=False,
+                            partition_size=2_048)))
+
+    def test_selectors_pickle_with_interned_tokens(self):
+        selector = parse("a{ (b OR c) f:d(e, 1) }.x[1-2]")  # Implied AND.
+        restored = pickle.loads(pickle.dumps(selector))
+        self.assertEqual(selector.as_dict, restored.as_dict)
+        self.assertIs(selector.steps[0].predicate.root,
+                      restored.steps[0].predicate.root)
+        self.assertEqual(2, restored.steps[0].predicate.operands[1].root.arity)
+        document = {"a": {"b": 1, "e": 3, "x": [0, 1, 2]}}
+        functions = {"d": max}
+        self.assertEqual(
+            compile(selector, functions).select(document),
+            compile(restored, functions).select(document))
+
+    def test_invalid_records_report_offsets(self):
+        with tempfile.NamedTemporaryFile("wb", suffix=".ndjson",
+                                         delete=False) as f:
+            f.write(b'{"id": 1}\nnope\n')
+        try:
+            with self.assertRaisesRegex(ValueError, "byte 10"):
+                list(select_many("id", [f.name], workers=1))
+            self.assertEqual([1],
+                             list(
+                                 select_many("id", [f.name], workers=1,
+                                             skip_invalid=True)))
+        finally:
+            os.unlink(f.name)
@@ -1,8 +1,16 @@
+import json
+import pickle
 from typing import Any
 from typing import Optional
 import unittest
 
+from core.export import to_json
+from core.optimizer import optimize
+from core.zonquery import flatten
 from core.zonquery import parse
+from core.zonquery import parse_uncached
+from core.zonquery import Predicate
+from core.zonquery import Selector
 from testing.testing import TestingData
 from testing.testing import TestingJsonTestCase
 from tests.data import TEST_DATA
@@ -69,3 +77,199 @@ class TestSample(TestingJsonTestCase):
                 print(f"{count} - Input: {selector}")
                 print(parse(selector))
                 break
+
+
+class TestDeepSelectors(unittest.TestCase):
+    TERMS: int = 100_000
+    NESTING: int = 5_000
+
+    def test_chained_terms(self):
+        query = f"n{{ {' '.join(f'a{i}' for i in range(self.TERMS))} }}"
+        predicate = parse_uncached(query).steps[0].predicate
+
+        terms = []
+        pending = [predicate]
+        while pending:
+            node = pending.pop()
+            if isinstance(node, Predicate):
+                self.assertEqual("AND", node.root.word)
+                pending.extend(node.operands)
+            else:
+                terms.append(node.word)
+        self.assertEqual(self.TERMS, len(terms))
+        self.assertEqual(f"a{self.TERMS - 1}", terms[0])
+        self.assertEqual("a0", terms[-1])
+
+    def test_nested_selectors(self):
+        query = (f"n{'{ this.x' * self.NESTING}"
+                 f"{' }' * self.NESTING}.y")
+        selector = parse_uncached(query)
+        self.assertEqual(["n", "y"], [s.node.word for s in selector.steps])
+
+        depth = 0
+        step = selector.steps[0]
+        while step.predicate is not None:
+            depth += 1
+            self.assertIsInstance(step.predicate, Selector)
+            step = step.predicate.steps[-1]
+        self.assertEqual(self.NESTING, depth)
+
+
+class TestFlatten(unittest.TestCase):
+
+    def test_associative_chains(self):
+        selector = flatten(parse("a{ b OR c OR d && e AND f AND (g XOR h) }"))
+        self.assertEqual(
+            {
+                "selector": [{
+                    "node": "a",
+                    "predicate": {
+                        "OR": [
+                            "b", "c", {
+                                "AND": ["d", "e", "f", {
+                                    "XOR": ["g", "h"]
+                                }]
+                            }
+                        ]
+                    },
+                }]
+            }, selector.as_dict)
+
+    def test_keeps_original_tree(self):
+        query = "a{ b AND c AND d }.e[1-2]"
+        selector = parse(query)
+        flat = flatten(selector)
+        self.assertEqual(parse_uncached(query).as_dict, selector.as_dict)
+        self.assertEqual(selector.steps[1].as_dict, flat.steps[1].as_dict)
+        with self.assertRaises(AttributeError):
+            flat.steps.append(None)
+
+    def test_chained_terms(self):
+        query = f"n{{ {' '.join(f'a{i}' for i in range(100_000))} }}"
+        predicate = flatten(parse_uncached(query)).steps[0].predicate
+        self.assertEqual("AND", predicate.root.word)
+        self.assertEqual([f"a{i}" for i in range(100_000)],
+                         [t.word for t in predicate.operands])
+
+
+class TestJson(unittest.TestCase):
+
+    def test_matches_as_dict(self):
+        for data in TEST_DATA:
+            selector = parse(TestingData(data).selector)
+            expected = selector.as_dict
+            self.assertEqual(
+                json.dumps(expected,
+                           default=str,
+                           ensure_ascii=False,
+                           separators=(",", ":")), to_json(selector))
+            self.assertEqual(
+                json.dumps(expected, default=str, ensure_ascii=False,
+                           indent=2), to_json(selector, indent=2))
+
+    def test_escapes_phrases(self):
+        selector = parse_uncached('a[1 2-3].b{ c = "é\\x\t" }')
+        self.assertEqual(
+            {
+                "selector": [{
+                    "node": "a",
+                    "ranges": [{
+                        "start": 1,
+                        "end": 1
+                    }, {
+                        "start": 2,
+                        "end": 3
+                    }]
+                }, {
+                    "node": "b",
+                    "predicate": {
+                        "=": ["c", "é\\x\t"]
+                    },
+                }]
+            }, json.loads(to_json(selector)))
+        self.assertIn('"é\\\\x\\t"', str(selector.steps[1].predicate))
+
+    def test_memoizes_frozen_nodes(self):
+        selector = parse_uncached("a{ b AND c }.d")
+        text = to_json(selector)
+        self.assertIs(text, to_json(selector))
+        self.assertIs(text, selector._json)
+        self.assertNotIn("_json", pickle.loads(pickle.dumps(selector)).__dict__)
+
+        predicate = Predicate(selector.steps[0].predicate.root)
+        predicate.operands.append(selector.steps[1].node)
+        self.assertEqual('{"AND":["d"]}', to_json(predicate))
+        predicate.operands.append(selector.steps[0].node)
+        self.assertEqual('{"AND":["d","a"]}', to_json(predicate))
+
+    def test_deep_predicates(self):
+        terms = 3_000
+        query = f"n{{ {' '.join(f'a{i}' for i in range(terms))} }}"
+        text = to_json(parse_uncached(query))
+        self.assertEqual(terms - 1, text.count('{"AND":'))
+        self.assertEqual(terms, text.count('"a'))
+
+
+class TestSpans(unittest.TestCase):
+    QUERY: str = ('insurance{ amount <= 8_000 (f:x(a, b) OR c) }'
+                  '.benefits[1 2-9]')
+
+    def fragment(self, node):
+        return self.QUERY[node.start:node.end]
+
+    def test_nodes(self):
+        selector = parse_uncached(self.QUERY)
+        insurance, benefits = selector.steps
+        self.assertEqual((0, len(self.QUERY)), (selector.start, selector.end))
+        self.assertEqual("insurance{ amount <= 8_000 (f:x(a, b) OR c) }",
+                         self.fragment(insurance))
+        self.assertEqual("benefits[1 2-9]", self.fragment(benefits))
+        self.assertEqual(["1", "2-9"],
+                         [self.fragment(r) for r in benefits.ranges])
+        predicate = insurance.predicate
+        self.assertEqual("amount <= 8_000 (f:x(a, b) OR c)",
+                         self.fragment(predicate))
+        self.assertEqual(["amount <= 8_000", "(f:x(a, b) OR c)"],
+                         [self.fragment(o) for o in predicate.operands])
+        self.assertEqual("f:x(a, b)",
+                         self.fragment(predicate.operands[1].operands[0]))
+
+    def test_kept_by_rewrites(self):
+        for rewrite in (flatten, optimize):
+            with self.subTest(rewrite=rewrite.__name__):
+                predicate = rewrite(parse(self.QUERY)).steps[0].predicate
+                self.assertEqual("amount <= 8_000 (f:x(a, b) OR c)",
+                                 self.fragment(predicate))
+
+    def test_parentheses_and_operators(self):
+        for query, fragments in (
+            ("y{ !(b) }", ["!(b)"]),
+            ("y{ ((a)) }", ["((a))"]),
+            ("y{ a ^ !((b) OR c) }",
+             ["a ^ !((b) OR c)", "!((b) OR c)", "((b) OR c)"]),
+            ("y{ (a = 1) (f:x()) }", ["(a = 1) (f:x())", "(a = 1)", "(f:x())"]),
+        ):
+            with self.subTest(query=query):
+                predicates, pending = [], [parse_uncached(query).steps[0]
+                                           .predicate]
+                while pending:
+                    predicates.append(predicate := pending.pop())
+                    pending.extend(o for o in reversed(predicate.operands)
+                                   if isinstance(o, Predicate))
+                self.assertEqual(fragments,
+                                 [query[p.start:p.end] for p in predicates])
+
+    def test_errors(self):
+        for query, error in (
+            ("n{ (a OR b }", "Mismatched parentheses at offset 3."),
+            ("n{ f:x(a }", "Mismatched parentheses at offset 6."),
+            ("n[1 2)", "Mismatched nesting \\[ at offset 1 and \\) at offset"
+             " 5."),
+            ("{a}", "Missing node before '{' at offset 0."),
+            ("a.n[1]{ a }", "range is already defined for step 'n' at offset"
+             " 2."),
+        ):
+            with self.subTest(query=query):
+                with self.assertRaisesRegex((ValueError, AssertionError),
+                                            error):
+                    parse_uncached(query)
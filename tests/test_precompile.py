@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+from core.optimizer import optimize
+from core.precompile import dumps
+from core.precompile import Encoder
+from core.precompile import FORMAT_VERSION
+from core.precompile import HEADER
+from core.precompile import load
+from core.precompile import loads
+from core.precompile import main
+from core.precompile import warm_cache
+from core.zonquery import cache_clear
+from core.zonquery import cache_info
+from core.zonquery import cache_resize
+from core.zonquery import parse
+from core.zonquery import parse_uncached
+from testing.bench import corpus_selectors
+from testing.bench import OPTIMIZER_QUERIES
+from testing.bench import queryset_queries
+from testing.bench import RANGE_QUERIES
+
+SOURCES = [
+    *corpus_selectors(), *OPTIMIZER_QUERIES, *RANGE_QUERIES,
+    *queryset_queries(20), 'a{ "é" = f:g(b, -1.5, f:h()) }.c[-3 0-2]'
+]
+
+
+def encoded(selector):
+    # Equal for structurally equal trees; unlike as_dict, not recursive.
+    encoder = Encoder()
+    encoder.node(selector)
+    return list(encoder.strings), list(encoder.tokens), encoder.ints
+
+
+class TestPrecompile(unittest.TestCase):
+
+    def test_round_trip(self):
+        library = loads(dumps(SOURCES))
+        self.assertEqual(SOURCES, [p.source for p in library])
+        for precompiled in library:
+            selector = parse_uncached(precompiled.source)
+            self.assertEqual(encoded(selector), encoded(precompiled.selector))
+            self.assertEqual((selector.start, selector.end),
+                             (precompiled.selector.start,
+                              precompiled.selector.end))
+            self.assertFalse(precompiled.optimized)
+            with self.assertRaises(AttributeError):
+                precompiled.selector.steps[0].node = None
+
+    def test_round_trip_optimized(self):
+        for precompiled in loads(dumps(SOURCES, optimize=True)):
+            self.assertTrue(precompiled.optimized)
+            self.assertEqual(
+                encoded(optimize(parse_uncached(precompiled.source))),
+                encoded(precompiled.selector))
+
+    def test_deep_predicates(self):
+        query = f"n{{ {' '.join(f'a{i}' for i in range(3_000))} }}"
+        self.assertEqual(encoded(parse_uncached(query)),
+                         encoded(loads(dumps([query]))[0].selector))
+
+    def test_names(self):
+        (precompiled,) = loads(dumps([("amounts.zq", "a.amount")]))
+        self.assertEqual(("amounts.zq", "a.amount"), precompiled[:2])
+
+    def test_invalid_libraries(self):
+        data = dumps(["a{ b = 'secret' }"])
+        version = HEADER.pack(*(HEADER.unpack_from(data)[:1] +
+                                (FORMAT_VERSION + 1,) +
+                                HEADER.unpack_from(data)[2:]))
+        for invalid in (b"", b"not a library" * 5, data[:-1],
+                        version + data[HEADER.size:],
+                        data.replace(b"secret", b"secreT")):
+            with self.assertRaises(ValueError):
+                loads(invalid)
+        loads(data.replace(b"secret", b"secreT"), verify=False)
+
+    def test_warm_cache(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for i, source in enumerate(SOURCES[:5]):
+                path = os.path.join(directory, "nested") if i else directory
+                os.makedirs(path, exist_ok=True)
+                with open(os.path.join(path, f"{i}.zq"), "w",
+                          encoding="utf-8") as f:
+                    f.write(f"\n{source.strip()}\n")
+            output = os.path.join(directory, "library.zqb")
+            main([directory, output])
+            self.assertEqual(["0.zq", *(f"nested/{i}.zq" for i in range(1, 5))],
+                             [p.name for p in load(output)])
+
+            cache_clear()
+            sources = [s.strip() for s in SOURCES[:6]]
+            self.assertEqual(5, warm_cache(output, sources))
+            self.assertEqual(6, cache_info().currsize)
+            self.assertEqual(encoded(parse_uncached(sources[0])),
+                             encoded(parse(sources[0])))
+            self.assertEqual(1, cache_info().hits)
+            cache_clear()
+
+            maxsize = cache_info().maxsize
+            cache_resize(2)
+            try:
+                with self.assertRaises(ValueError):
+                    warm_cache(output)
+                self.assertEqual(5, warm_cache(output, resize=True))
+                self.assertEqual(5, cache_info().maxsize)
+            finally:
+                cache_resize(maxsize)
+                cache_clear()
+
+            main([directory, output, "--optimize"])
+            with self.assertRaises(ValueError):
+                warm_cache(output)
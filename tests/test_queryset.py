@@ -0,0 +1,42 @@
+import unittest
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.queryset import QuerySet
+from testing.bench import make_records
+from testing.bench import queryset_queries
+from tests.test_engine import DOCUMENT
+from tests.test_index import QUERIES
+
+
+class TestQuerySet(unittest.TestCase):
+
+    def test_matches_compiled_queries(self):
+        queries = [*QUERIES, *queryset_queries(100)]
+        query_set = QuerySet(queries)
+        compiled = [compile(q) for q in queries]
+        for document in [DOCUMENT, *make_records(200)]:
+            self.assertEqual([q.select(document) for q in compiled],
+                             query_set.evaluate(document))
+
+    def test_shared_prefixes_are_evaluated_once(self):
+        query_set = QuerySet([
+            'insurance{ type = "MH" }.benefits[0]',
+            'insurance{ type = "MH" }.benefits[1-2]',
+            'insurance{ type = "MH" }.plans.name',
+            "insurance.amount",
+        ])
+        self.assertEqual((4, 9, 7), query_set.info())
+        self.assertEqual([[0, 100], [1, 2, 200], ["Dental Care", "Vision"],
+                          [5_000, 9_000]], query_set.evaluate(DOCUMENT))
+
+    def test_phrases_and_words_are_not_merged(self):
+        records = {"n": [{"a": 0}, {"a": 1}]}
+        query_set = QuerySet(['n{ a }', 'n{ "a" }', 'n{ 0 }', 'n{ "0" }'])
+        self.assertEqual((4, 4, 4), query_set.info())
+        self.assertEqual([[{"a": 1}], records["n"], [], records["n"]],
+                         query_set.evaluate(records))
+
+    def test_duplicate_queries_get_their_own_results(self):
+        first, second = QuerySet(["insurance.amount"] * 2).evaluate(DOCUMENT)
+        self.assertEqual(first, second)
+        self.assertIsNot(first, second)
@@ -0,0 +1,73 @@
+import io
+import unittest
+
+from core.engine import compile  # pylint: disable=redefined-builtin
+from core.stream import iter_lines
+from core.stream import iter_records
+from core.stream import iter_select
+
+RECORDS = b"""{"id": 1, "amount": 5000, "tags": ["a", "b"]}
+{"id": 2, "amount": 9000, "tags": ["c"]}
+
+{"id": 3, "amount": 12000, "tags": []}
+"""
+
+
+class EndlessRecords(io.RawIOBase):
+
+    def __init__(self):
+        self.reads = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        self.reads += 1
+        line = b'{"amount": 1}\n' * (len(buffer) // 14)
+        buffer[:len(line)] = line
+        return len(line)
+
+
+class TestIterSelect(unittest.TestCase):
+
+    def test_lines_across_chunk_boundaries(self):
+        for chunk_size in (1, 3, 7, 1 << 20):
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(
+                    RECORDS.split(b"\n")[:-1],
+                    list(iter_lines(io.BytesIO(RECORDS), chunk_size)))
+
+    def test_last_line_without_newline(self):
+        self.assertEqual(["a", "b"], list(iter_lines(io.StringIO("a\nb"))))
+
+    def test_select_bytes_and_text(self):
+        for stream in (io.BytesIO(RECORDS), io.StringIO(RECORDS.decode())):
+            with self.subTest(stream=type(stream).__name__):
+                self.assertEqual(
+                    [2, 3],
+                    list(iter_select("this{ amount > 8_000 }.id", stream,
+                                     chunk_size=5)))
+
+    def test_yields_every_match(self):
+        self.assertEqual(["a", "b", "c"],
+                         list(iter_select("tags", io.BytesIO(RECORDS))))
+
+    def test_accepts_compiled_queries(self):
+        query = compile("this{ f:even(id) }.id", {"even": lambda n: n % 2 == 0})
+        self.assertEqual([2], list(iter_select(query, io.BytesIO(RECORDS))))
+
+    def test_is_lazy(self):
+        stream = EndlessRecords()
+        matches = iter_select("amount", io.BufferedReader(stream),
+                              chunk_size=1_024)
+        self.assertEqual([1] * 10, [next(matches) for _ in range(10)])
+        self.assertLessEqual(stream.reads, 2)
+
+    def test_invalid_records(self):
+        data = b'{"id": 1}\nnot json\n{"id": 3}\n'
+        with self.assertRaisesRegex(ValueError, "line 2"):
+            list(iter_records(io.BytesIO(data)))
+        self.assertEqual([1, 3],
+                         list(
+                             iter_select("id", io.BytesIO(data),
+                                         skip_invalid=True)))
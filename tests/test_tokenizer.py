@@ -0,0 +1,112 @@
+import unittest
+
+from core.zonquery import parse
+from core.zonquery import Token
+from core.zonquery import tokenize
+from testing.legacy import legacy_tokenize
+from testing.testing import TestingData
+from tests.data import TEST_DATA
+
+
+def describe(tokens):
+    return [(t.word, t.is_phrase, t.arity) for t in tokens]
+
+
+class TestTokenize(unittest.TestCase):
+
+    def test_matches_legacy_tokenizer(self):
+        for i, raw_data in enumerate(TEST_DATA, 1):
+            selector = TestingData(raw_data).selector
+            with self.subTest(name=f"Selector {i}"):
+                self.assertEqual(describe(legacy_tokenize(selector)),
+                                 describe(tokenize(selector)))
+
+    def test_compound_operators(self):
+        self.assertEqual(
+            ["n", "{", "a", "<=", "1", "AND", "b", "!=", "2", "AND", "c",
+             "==", "3", "AND", "d", ">=", "4", "}"],
+            [t.word for t in tokenize("n{a<=1 b!=2 c==3 d>=4}")])
+
+    def test_whole_runs(self):
+        tokens = tokenize("insurance{ amount <= 8_000 'a \"b\" c' }")
+        self.assertEqual(["insurance", "{", "amount", "<=", "8_000", "AND",
+                          'a "b" c', "}"], [t.word for t in tokens])
+        self.assertTrue(tokens[6].is_phrase)
+
+    def test_zero_argument_functions(self):
+        tokens = tokenize("n{f:a f:b() f:c(x, y)}")
+        self.assertEqual([("f:a", 0), ("f:b", 0), ("f:c", 2)],
+                         [(t.word, t.arity) for t in tokens if t.is_function])
+
+    def test_unclosed_quote(self):
+        with self.assertRaisesRegex(ValueError, "offset 5"):
+            tokenize("n{ a 'b }")
+
+
+class TestToken(unittest.TestCase):
+
+    def test_dots_are_interned(self):
+        first = tokenize("n{ (a OR b) && c.d }")[9]
+        second = tokenize("m{ (x OR y) && z.w }")[9]
+        self.assertEqual(".", first.word)
+        self.assertIs(first, second)
+        self.assertIs(Token.of("."), first)
+
+    def test_brackets_and_operators_are_copied_at_their_offsets(self):
+        first = tokenize("n{ (a OR b) && c.d }")
+        for i, start in ((1, 1), (2, 3), (4, 6), (6, 10), (7, 12), (11, 19)):
+            with self.subTest(word=first[i].word):
+                interned = Token.of(first[i].word)
+                self.assertIsNot(interned, first[i])
+                self.assertEqual((interned.kind, start),
+                                 (first[i].kind, first[i].start))
+                self.assertIsNone(interned.start)
+
+    def test_offsets(self):
+        selector = "n{ (a OR 'b c') && f:d(e) }.x"
+        for token in tokenize(selector):
+            with self.subTest(word=token.word):
+                if token.start is None:  # Shared.
+                    self.assertIs(Token.of(token.word), token)
+                    continue
+                found = selector[token.start:token.end]
+                self.assertEqual(f"'{token.word}'"
+                                 if token.is_phrase else token.word, found)
+
+    def test_identifiers_and_functions_are_not_interned(self):
+        self.assertIsNot(Token.of("a"), Token.of("a"))
+        self.assertIsNot(Token.of("f:len"), Token.of("f:len"))
+
+    def test_slots(self):
+        self.assertFalse(hasattr(Token("a"), "__dict__"))
+
+    def test_kind_flags(self):
+        self.assertTrue(Token.of("(").is_open_parenthesis)
+        self.assertTrue(Token.of("!").is_unary_operator)
+        self.assertTrue(Token.of("NOT").is_right_associative)
+        self.assertTrue(Token.of("f:len").is_function)
+        self.assertTrue(Token.of("f:len").is_operator)
+        self.assertTrue(Token.of("abc").isalnum)
+        self.assertFalse(Token.of("abc").is_delimiter)
+
+    def test_phrases_are_never_separators(self):
+        phrase = Token("(", is_phrase=True)
+        self.assertTrue(phrase.is_phrase)
+        self.assertFalse(phrase.is_open_parenthesis)
+        self.assertFalse(phrase.is_delimiter)
+
+    def test_typed_literals(self):
+        tokens = tokenize("n{ a = 8_000 b < -2.5 c > 1e3 d = 'x' e = 1_ }")
+        literals = {t.word: t.value for t in tokens if t.is_literal}
+        self.assertEqual({"8_000": 8_000, "-2.5": -2.5, "1e3": 1_000.0,
+                          "x": "x"}, literals)
+        self.assertIs(int, type(literals["8_000"]))
+        self.assertEqual(["n", "a", "b", "c", "d", "e", "1_"],
+                         [t.value for t in tokens if t.is_identifier])
+        self.assertTrue(all(t.value is None for t in tokens if t.is_operator))
+
+    def test_typed_literals_keep_their_text(self):
+        self.assertEqual(
+            {"selector": [{"node": "n", "predicate": {
+                "AND": [{"<=": ["a", "8_000"]}, {">": ["b", "0.5"]}]}}]},
+            parse("n{ a <= 8_000 b > 0.5 }").as_dict)